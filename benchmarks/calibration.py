@@ -0,0 +1,150 @@
+""" Throughput of calibration residual evaluations
+
+Builds a grid network split into four zones, each with its own roughness
+and demand multiplier, and measures pressures and the inflow at every
+hour of a day with the true parameters. Then evaluates candidate
+parameter vectors by setting properties one by one and solving every
+timestamp, and with epynet.calibration on one and on several workers,
+and fits the parameters with scipy, or by Levenberg-Marquardt steps
+when scipy is not installed.
+
+    python benchmarks/calibration.py --size 50 --sensors 50 --candidates 64 --workers 4
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from epynet.calibration import Calibration, Parameter
+from session_latency import grid_network
+
+
+def zones(network, size):
+    """ return the pipes and junctions of the four quadrants of the grid """
+    pipes, junctions = {}, {}
+    for uid in network.junctions.keys():
+        if uid.startswith('J'):
+            row, column = [int(part) for part in uid[1:].split('_')]
+            junctions.setdefault(2 * (row >= size // 2) + (column >= size // 2), []).append(uid)
+    for uid in network.pipes.keys():
+        if uid[0] in 'HV':
+            row, column = [int(part) for part in uid[1:].split('_')]
+            pipes.setdefault(2 * (row >= size // 2) + (column >= size // 2), []).append(uid)
+    return pipes, junctions
+
+
+def naive(network, parameters, measurements, vectors):
+    """ Set the properties element by element and solve every timestamp, as a hand written loop would """
+    residuals = []
+    roughness = dict((uid, network.pipes[uid].roughness) for uid in network.pipes.keys())
+    demands = dict((uid, network.junctions[uid].basedemand) for uid in network.junctions.keys())
+    for vector in vectors:
+        for parameter, value in zip(parameters, vector):
+            for uid in parameter.elements:
+                if parameter.property == 'roughness':
+                    network.pipes[uid].roughness = value
+                else:
+                    network.junctions[uid].basedemand = demands[uid] * value
+        rows = []
+        for simtime in measurements['pressure'].index:
+            network.solve(simtime)
+            rows.append(network.nodes.pressure[measurements['pressure'].columns].values -
+                        measurements['pressure'].loc[simtime].values)
+        residuals.append(np.concatenate(rows))
+
+    for uid, value in roughness.items():
+        network.pipes[uid].roughness = value
+    for uid, value in demands.items():
+        network.junctions[uid].basedemand = value
+    return residuals
+
+
+def levenberg_marquardt(calibration, iterations):
+    """ Damped Gauss-Newton steps within the bounds, when scipy is not installed """
+    vector = calibration.x0
+    lower, upper = calibration.bounds
+    cost = calibration.cost(vector)
+    damping = 1e-3
+    for _ in range(iterations):
+        jacobian = calibration.jacobian(vector)
+        normal = jacobian.T.dot(jacobian)
+        gradient = jacobian.T.dot(calibration.residuals(vector))
+        while damping < 1e10:
+            step = np.linalg.solve(normal + damping * np.diag(np.diag(normal) + 1e-12), -gradient)
+            candidate = np.clip(vector + step, lower + 1e-6, upper)
+            if calibration.cost(candidate) < cost:
+                vector, cost, damping = candidate, calibration.cost(candidate), damping / 10
+                break
+            damping *= 10
+        else:
+            break
+    return vector
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--size', type=int, default=50, help='junctions per side of the grid')
+    parser.add_argument('--sensors', type=int, default=50, help='number of pressure sensors')
+    parser.add_argument('--hours', type=int, default=24, help='number of hourly timestamps')
+    parser.add_argument('--candidates', type=int, default=64, help='number of candidate vectors')
+    parser.add_argument('--naive', type=int, default=2, help='candidate vectors of the element by element loop')
+    parser.add_argument('--workers', type=int, default=4, help='worker processes')
+    arguments = parser.parse_args()
+
+    network = grid_network(arguments.size)
+    network.add_pattern('day', list(0.6 + 0.6 * np.sin(np.linspace(0, 2 * np.pi, 24, endpoint=False)) ** 2))
+    for junction in network.junctions:
+        if junction.uid.startswith('J'):
+            junction.pattern = 'day'
+    network.ep.ENsettimeparam(0, 24 * 3600)
+
+    pipes, junctions = zones(network, arguments.size)
+    parameters = [Parameter('roughness', 'roughness %d' % zone, pipes[zone]) for zone in sorted(pipes)] + \
+                 [Parameter('demand', 'demand %d' % zone, junctions[zone]) for zone in sorted(junctions)]
+    true = np.array([0.5, 1.0, 2.0, 0.2, 1.1, 0.9, 1.2, 0.8])
+
+    random = np.random.RandomState(0)
+    sensors = list(random.choice([uid for uid in network.junctions.keys() if uid.startswith('J')],
+                                 arguments.sensors, replace=False))
+    times = [hour * 3600 for hour in range(arguments.hours)]
+    empty = {'pressure': pd.DataFrame(0.0, index=times, columns=sensors),
+             'flow': pd.DataFrame(0.0, index=times, columns=['S'])}
+    simulated = Calibration(network, parameters, empty).frame(true)['simulated'].unstack(['result', 'uid'])
+    measurements = {'pressure': simulated['pressure'] + random.normal(0, 0.05, simulated['pressure'].shape),
+                    'flow': simulated['flow']}
+    vectors = true * random.uniform(0.7, 1.3, (arguments.candidates, len(true)))
+
+    print('%d nodes, %d links, %d parameters, %d measurements at %d timestamps' % (
+        len(network.nodes), len(network.links), len(parameters),
+        measurements['pressure'].notnull().values.sum() + len(times), len(times)))
+
+    started = time.perf_counter()
+    naive(network, parameters, measurements, vectors[:arguments.naive])
+    elapsed = (time.perf_counter() - started) / arguments.naive
+    print('element by element: %.3f s per candidate' % elapsed)
+
+    for workers in (1, arguments.workers):
+        with Calibration(network, parameters, measurements, sigma={'flow': 10.0}, workers=workers) as calibration:
+            started = time.perf_counter()
+            calibration.evaluate(vectors)
+            elapsed = (time.perf_counter() - started) / len(vectors)
+            print('calibration, %d workers: %.3f s per candidate, %.1f solves per s' % (
+                workers, elapsed, len(times) / elapsed))
+
+    with Calibration(network, parameters, measurements, sigma={'flow': 10.0}, workers=arguments.workers) as calibration:
+        started = time.perf_counter()
+        try:
+            from scipy.optimize import least_squares
+            result = least_squares(calibration.residuals, calibration.x0, jac=calibration.jacobian,
+                                   bounds=calibration.bounds)
+            fitted, method = result.x, 'scipy least_squares'
+        except ImportError:
+            fitted, method = levenberg_marquardt(calibration, 20), 'Levenberg-Marquardt'
+        print('%s: %.1f s, %d solves, cost %.3g, largest relative error %.3f' % (
+            method, time.perf_counter() - started, calibration.solves, calibration.cost(fitted),
+            np.abs(fitted / true - 1).max()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+""" Latency of real-time hydraulic sessions
+
+Builds a grid network with a reservoir, a pump and a tank, then runs
+update / advance / state cycles as a digital twin would on every SCADA
+scan and reports the latency percentiles against a target.
+
+    python benchmarks/session_latency.py --size 50 --cycles 500 --target 50
+"""
+import argparse
+import time
+
+import numpy as np
+
+from epynet import Network
+
+
+def grid_network(size):
+    """ size x size junctions fed by a pumped reservoir, with a tank at the far corner """
+    network = Network()
+    network.add_pattern('1', [1.0])
+    network.add_curve('pump', [(size * size * 0.5, 60)])
+    network.add_reservoir('R', -100, -100, elevation=0)
+    network.add_junction('S', -50, -50, elevation=0)
+    network.add_pump('P', 'R', 'S', speed=1)
+    network.pumps['P'].curve = network.curves['pump']
+
+    for row in range(size):
+        for column in range(size):
+            uid = 'J%d_%d' % (row, column)
+            junction = network.add_junction(uid, column * 100, row * 100, basedemand=1, elevation=10)
+            junction.pattern = '1'
+            if column:
+                network.add_pipe('H%d_%d' % (row, column), 'J%d_%d' % (row, column - 1), uid, diameter=300, length=100)
+            if row:
+                network.add_pipe('V%d_%d' % (row, column), 'J%d_%d' % (row - 1, column), uid, diameter=300, length=100)
+    network.add_pipe('S', 'S', 'J0_0', diameter=600, length=100)
+    network.add_tank('T', size * 100, size * 100, diameter=30, maxlevel=10, minlevel=0, tanklevel=5)
+    network.tanks['T'].elevation = 40
+    network.add_pipe('T', 'J%d_%d' % (size - 1, size - 1), 'T', diameter=300, length=100)
+    return network
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--size', type=int, default=50, help='junctions per side of the grid')
+    parser.add_argument('--cycles', type=int, default=500, help='number of update / advance cycles')
+    parser.add_argument('--delta', type=int, default=60, help='seconds per cycle')
+    parser.add_argument('--target', type=float, default=50, help='target latency per cycle in ms')
+    arguments = parser.parse_args()
+
+    network = grid_network(arguments.size)
+    random = np.random.RandomState(0)
+    latencies = np.zeros(arguments.cycles)
+
+    with network.session() as session:
+        for cycle in range(arguments.cycles):
+            started = time.perf_counter()
+            session.update(tank_levels={'T': random.uniform(2, 8)},
+                           pump_status={'P': int(random.uniform() > 0.1)})
+            session.advance(arguments.delta)
+            latencies[cycle] = (time.perf_counter() - started) * 1000
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    print('%d nodes, %d links, %d cycles of %d s' % (len(network.nodes), len(network.links),
+                                                     arguments.cycles, arguments.delta))
+    print('latency ms: median %.2f, p95 %.2f, p99 %.2f, max %.2f' % (p50, p95, p99, latencies.max()))
+    print('target %.1f ms: %s' % (arguments.target, 'met' if p99 <= arguments.target else 'missed'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+""" EPYNET asyncio interface
+
+Solves and simulations run in a shared thread pool so they do not block
+the event loop. The toolkit releases the GIL while it computes, so
+networks progress concurrently, while calls on the same network wait for
+each other. Cancelling a simulation stops it after the current hydraulic
+timestep, a single period solve always runs to completion.
+
+Example:
+    await network.asolve(3600)
+    results = await network.arun(reducers={'min_pressure': Minimum(network.junctions, 'pressure')})
+    async with network.asteps() as steps:
+        async for simtime, state in steps:
+            state['pressure']   # array in toolkit index order
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import epanet2
+from .session import NODE_STATE, LINK_STATE
+
+# thread pool shared by all networks, created on first use
+_executor = None
+
+
+def get_executor():
+    """ return the thread pool that runs the toolkit calls """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(thread_name_prefix='epynet')
+    return _executor
+
+
+def set_executor(executor):
+    """ Run the toolkit calls in another executor, for example with a limited number of threads """
+    global _executor
+    _executor = executor
+
+
+def network_lock(network):
+    """ return the asyncio lock of a network for the running event loop """
+    # the running loop inside coroutines, get_running_loop needs Python 3.7
+    loop = asyncio.get_event_loop()
+    if network._async_lock is None or network._async_lock[0] is not loop:
+        network._async_lock = (loop, asyncio.Lock())
+    return network._async_lock[1]
+
+
+async def _call(network, function, *args, abort=None):
+    """ Run function in the executor, on cancellation wait until it has stopped """
+    loop = asyncio.get_event_loop()
+    future = loop.run_in_executor(get_executor(), function, *args)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        if abort is not None:
+            abort.set()
+        network.ep.ENabort()
+        # the network may only be used again when the worker thread is done with it
+        try:
+            await future
+        except Exception:
+            pass
+        network.close_hydraulics()
+        network.reset()
+        raise
+
+
+async def solve(network, simtime=0):
+    """ Solve a single timestep, see Network.solve """
+    async with network_lock(network):
+        await _call(network, network.solve, simtime)
+
+
+async def run(network, reducers=None):
+    """ Run an extended period simulation, see Network.run """
+    abort = threading.Event()
+    async with network_lock(network):
+        return await _call(network, network.run, reducers, abort, abort=abort)
+
+
+class Steps(object):
+    """ Async iterator over the hydraulic timesteps of a simulation
+
+    Yields the time and a dict of name: array with the state of every node
+    and link after every timestep. The network is locked from the first
+    step until the simulation ends or the iterator is closed, use it as an
+    async context manager to close it when leaving a loop early.
+    """
+
+    def __init__(self, network, node_properties=None, link_properties=None):
+        self.network = network
+        self.node_properties = NODE_STATE if node_properties is None else node_properties
+        self.link_properties = LINK_STATE if link_properties is None else link_properties
+        self.lock = None
+        self.running = False
+        self.simtime = 0
+        self.timestep = 1
+
+    def _open(self):
+        network = self.network
+        network.close_hydraulics()
+        network.reset()
+        network.open_hydraulics()
+        network.ep.ENinitH(0)
+        ep = network.ep
+        self.node_indices = list(range(1, ep.ENgetcount(epanet2.EN_NODECOUNT) + 1))
+        self.link_indices = list(range(1, ep.ENgetcount(epanet2.EN_LINKCOUNT) + 1))
+
+    def _step(self):
+        ep = self.network.ep
+        ep.ENrunH()
+        state = {}
+        for name, code in self.node_properties.items():
+            state[name] = ep.ENgetnodevalues(self.node_indices, code)
+        for name, code in self.link_properties.items():
+            state[name] = ep.ENgetlinkvalues(self.link_indices, code)
+        return state, ep.ENnextH()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.lock is None:
+            self.lock = network_lock(self.network)
+            await self.lock.acquire()
+            self.running = True
+            try:
+                await _call(self.network, self._open)
+            except BaseException:
+                self._release()
+                raise
+        if self.timestep <= 0:
+            await self.aclose()
+            raise StopAsyncIteration
+
+        try:
+            state, timestep = await _call(self.network, self._step)
+        except BaseException:
+            await self.aclose()
+            raise
+        simtime = self.simtime
+        self.simtime += timestep
+        self.timestep = timestep
+        return simtime, state
+
+    def _release(self):
+        if self.running:
+            self.running = False
+            self.lock.release()
+        self.timestep = 0
+
+    async def aclose(self):
+        """ Close the simulation and unlock the network """
+        if self.running:
+            try:
+                await _call(self.network, self.network.close_hydraulics)
+            finally:
+                self._release()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import warnings
 import weakref
@@ -45,6 +46,10 @@ class BaseObject(object):
     def get_object_value(self, code):
         raise NotImplementedError
 
+    @staticmethod
+    def set_object_values(network, indices, code, values):
+        raise NotImplementedError
+
     def reset(self):
         self._values = {}
         self.results = {}
@@ -83,6 +88,19 @@ class BaseObject(object):
         self._values[code] = value
         self.set_object_value(code, value)
 
+    @classmethod
+    def set_static_properties(cls, objects, code, values):
+        """ set a static property of a list of objects of this class in one pass """
+        if not objects:
+            return
+        network = objects[0].network()
+        # set network as unsolved
+        network.solved = False
+        values = np.broadcast_to(np.asarray(values, dtype=float), (len(objects),)).tolist()
+        cls.set_object_values(network, [item.index for item in objects], code, values)
+        for item, value in zip(objects, values):
+            item._values[code] = value
+
     def get_property(self, code):
         if code not in self._values.keys():
             self._values[code] = self.get_object_value(code)
@@ -0,0 +1,214 @@
+""" EPYNET hydraulics cache
+
+Keeps the hydraulics files of extended period simulations in a directory,
+named after a hash of the network data the hydraulics depend on (see
+hydraulics_key), so processes that analyse the same hydraulics solve them
+only once. Files are written under a temporary name and renamed when
+complete, so processes can share a cache on a local filesystem. When the
+cache grows beyond its maximum size the least recently used files are
+removed.
+
+Example:
+    cache = HydraulicsCache('/data/epynet-cache', max_size=10 * 2 ** 30)
+    engine = network.quality(cache=cache)   # solves only when the hydraulics are not cached
+    cache.use(network)                      # the network reads its hydraulics from the cache
+    network.ep.ENsolveQ()
+"""
+import errno
+import glob
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from .inpfile import InpIndex
+
+# sections and keywords of the input file that do not change the hydraulics
+IGNORED_SECTIONS = set(['TITLE', 'QUALITY', 'SOURCES', 'REACTIONS', 'MIXING', 'REPORT', 'COORDINATES',
+                        'VERTICES', 'LABELS', 'TAGS', 'BACKDROP', 'END'])
+IGNORED_KEYWORDS = {'OPTIONS': ('QUALITY', 'DIFFUSIVITY', 'TOLERANCE'), 'TIMES': ('QUALITY',)}
+
+# temporary files of writers that did not finish are removed after a day
+STALE = 24 * 3600
+
+
+def hydraulics_key(network):
+    """ return a hash of the network data that the hydraulics depend on
+
+    Covers the input file the toolkit writes for the current state of the
+    network, without its water quality, report and map data, and the
+    version of the toolkit. """
+    charset = network.ep.charset
+    directory = tempfile.mkdtemp(prefix='epynet')
+    try:
+        path = os.path.join(directory, 'network.inp')
+        network.save_inputfile(path)
+        index = InpIndex(path, charset)
+        digest = hashlib.sha256(str(network.ep.ENgetversion()).encode())
+        for section in sorted(index.sections):
+            if section in IGNORED_SECTIONS:
+                continue
+            ignored = IGNORED_KEYWORDS.get(section, ())
+            digest.update(('[%s]\n' % section).encode(charset))
+            for line in index.lines(section):
+                words = line.split()
+                if words[0].upper() not in ignored:
+                    digest.update((' '.join(words) + '\n').encode(charset))
+        return digest.hexdigest()
+    finally:
+        shutil.rmtree(directory, True)
+
+
+def _link(source, target):
+    """ Hard link source to target, or copy it when it is on another filesystem """
+    try:
+        os.link(source, target)
+    except OSError as error:
+        if error.errno == errno.ENOENT:
+            raise
+        shutil.copyfile(source, target)
+
+
+class HydraulicsCache(object):
+    """ Hydraulics files in a directory, by hash of the network data
+
+    directory:  of the cache, created when it does not exist
+    max_size:   total size of the files in bytes above which the least
+                recently used are removed, unlimited by default
+
+    hits and misses count the lookups of hydraulics() and fetch().
+    """
+
+    def __init__(self, directory, max_size=None):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, key):
+        """ return the path of the hydraulics file of a key """
+        return os.path.join(self.directory, key + '.hyd')
+
+    def get(self, network, key=None):
+        """ return the path of the cached hydraulics of a network, or None """
+        path = self.path(key or hydraulics_key(network))
+        try:
+            # recently used files are removed last
+            os.utime(path, None)
+        except OSError:
+            return None
+        return path
+
+    def put(self, network, key=None):
+        """ Solve the hydraulics of a network and store them, returns the path of the file """
+        path = self.path(key or hydraulics_key(network))
+        network.close_hydraulics()
+        network.ep.ENsolveH()
+        network.solved = False
+
+        handle, temporary = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        os.close(handle)
+        try:
+            network.ep.ENsavehydfile(temporary)
+            # atomic on POSIX and Windows, where os.rename fails when the file exists
+            os.replace(temporary, path)
+        except Exception:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        self.evict(keep=path)
+        return path
+
+    def hydraulics(self, network):
+        """ return the path of the hydraulics of a network, solving them when they are not cached """
+        key = hydraulics_key(network)
+        path = self.get(network, key)
+        if path is not None:
+            self.hits += 1
+            return path
+        self.misses += 1
+        return self.put(network, key)
+
+    def fetch(self, network, target):
+        """ Link or copy the hydraulics of a network to target, solving them when they are not cached
+
+        The file at target is not removed when the cache is evicted.
+        Returns True when the hydraulics were cached. """
+        key = hydraulics_key(network)
+        path = self.get(network, key)
+        if path is not None:
+            try:
+                _link(path, target)
+                self.hits += 1
+                return True
+            except OSError:
+                # removed by another process in the meantime
+                pass
+        self.misses += 1
+        _link(self.put(network, key), target)
+        return False
+
+    def use(self, network):
+        """ Make the network read its hydraulics from the cache, returns the path of the file
+
+        The toolkit cannot open the hydraulic solver of the network anymore
+        afterwards, only water quality analyses can run. """
+        path = self.hydraulics(network)
+        network.close_hydraulics()
+        network.ep.ENusehydfile(path)
+        network.hydraulics_file = path
+        return path
+
+    def files(self):
+        """ return a list of (last use, size, path) of the cached files, least recently used first """
+        files = []
+        for path in glob.glob(os.path.join(self.directory, '*.hyd')):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        return sorted(files)
+
+    def size(self):
+        """ return the total size of the cached files in bytes """
+        return sum(size for _, size, _ in self.files())
+
+    def evict(self, keep=None):
+        """ Remove the least recently used files until the cache fits max_size, returns their number """
+        for path in glob.glob(os.path.join(self.directory, '*.tmp')):
+            try:
+                if os.stat(path).st_mtime < time.time() - STALE:
+                    os.remove(path)
+            except OSError:
+                pass
+        if self.max_size is None:
+            return 0
+
+        files = self.files()
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in files:
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                # removed by another process
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        """ Remove all cached files """
+        for _, _, path in self.files():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
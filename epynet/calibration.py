@@ -0,0 +1,423 @@
+""" EPYNET model calibration against measurements
+
+Compares measured pressures, flows and other results, such as SCADA
+readings at many timestamps, with the results of the network, and
+evaluates the residuals of many candidate parameter vectors at once. A
+parameter applies to a collection of elements, such as the roughness of
+the pipes of a zone or a multiplier of the base demands of a district.
+
+Every timestamp is solved as a single period at its pattern time, with
+measured tank levels, pump and valve states as boundary conditions.
+Candidate vectors are solved one after the other per timestamp, each
+starting from the flows of the previous solve, spread over worker
+processes. residuals, jacobian and bounds fit standard least squares
+optimisers.
+
+Example:
+    zones = [Parameter('roughness', 'roughness north', north_pipes),
+             Parameter('demand', 'demand north', north_junctions)]
+    with network.calibration(zones, {'pressure': pressures, 'flow': flows}, workers=4) as calibration:
+        result = scipy.optimize.least_squares(calibration.residuals, calibration.x0,
+                                              jac=calibration.jacobian, bounds=calibration.bounds)
+        calibration.apply(result.x)
+"""
+import numpy as np
+import pandas as pd
+
+from . import epanet2
+from .parallel import WorkerPool, parallel_map
+from .sensitivity import OUTPUTS
+
+# name: (kind, EN_* code, collection of the elements by default, mode by default)
+PARAMETERS = {'roughness': ('link', epanet2.EN_ROUGHNESS, 'pipes', 'set'),
+              'minorloss': ('link', epanet2.EN_MINORLOSS, 'pipes', 'set'),
+              'diameter': ('link', epanet2.EN_DIAMETER, 'pipes', 'multiply'),
+              'demand': ('node', epanet2.EN_BASEDEMAND, 'junctions', 'multiply'),
+              'emitter': ('node', epanet2.EN_EMITTER, 'junctions', 'set'),
+              'setting': ('link', epanet2.EN_INITSETTING, 'valves', 'set'),
+              'status': ('link', epanet2.EN_INITSTATUS, 'valves', 'status')}
+MODES = ['set', 'multiply', 'status']
+# name: (kind, EN_* code)
+BOUNDARIES = {'tanklevel': ('node', epanet2.EN_TANKLEVEL), 'status': ('link', epanet2.EN_INITSTATUS),
+              'setting': ('link', epanet2.EN_INITSETTING)}
+
+
+def _accessors(ep, kind):
+    if kind == 'node':
+        return ep.ENgetnodevalues, ep.ENsetnodevalues
+    return ep.ENgetlinkvalues, ep.ENsetlinkvalues
+
+
+def _apply(ep, parameters, originals, vector, current):
+    """ Write the parameters of vector that differ from current """
+    for position, parameter in enumerate(parameters):
+        value = vector[position]
+        if current is not None and value == current[position]:
+            continue
+        _, setter = _accessors(ep, parameter['kind'])
+        indices = parameter['indices']
+        if parameter['mode'] == 'multiply':
+            setter(indices, parameter['code'], originals[position] * value)
+        elif parameter['mode'] == 'set':
+            setter(indices, parameter['code'], np.full(len(indices), value))
+        else:
+            setter(indices, parameter['code'], np.full(len(indices), 1.0 if value >= 0.5 else 0.0))
+            if value >= 0.5 and len(parameter['valves']):
+                # an open control valve controls its setting again
+                setter(parameter['valves'], epanet2.EN_INITSETTING, parameter['valve_settings'])
+
+
+def _restore(ep, parameters, originals):
+    for parameter, original in reversed(list(zip(parameters, originals))):
+        _, setter = _accessors(ep, parameter['kind'])
+        setter(parameter['indices'], parameter['code'], original)
+        if parameter['mode'] == 'status' and len(parameter['valves']):
+            setter(parameter['valves'], epanet2.EN_INITSETTING, parameter['valve_settings'])
+
+
+def _evaluate(network, settings, vectors):
+    """ Solve every timestamp for every parameter vector, returns the residuals per vector """
+    ep = network.ep
+    parameters, boundaries = settings['parameters'], settings['boundaries']
+    originals = [_accessors(ep, parameter['kind'])[0](parameter['indices'], parameter['code'])
+                 for parameter in parameters]
+    boundary_originals = [_accessors(ep, kind)[0](indices, code) for kind, code, indices, _ in boundaries]
+
+    residuals = np.zeros((len(vectors), settings['count']))
+    failed = np.zeros(len(vectors), dtype=bool)
+    accuracy = ep.ENgetoption(epanet2.EN_ACCURACY)
+    if settings['accuracy'] is not None:
+        ep.ENsetoption(epanet2.EN_ACCURACY, settings['accuracy'])
+    current = None
+    try:
+        for position, (simtime, rows) in enumerate(zip(settings['times'], settings['rows'])):
+            for kind, code, indices, values in boundaries:
+                known = np.isfinite(values[position])
+                _accessors(ep, kind)[1](indices[known], code, values[position][known])
+
+            for row, vector in enumerate(vectors):
+                _apply(ep, parameters, originals, vector, current)
+                current = vector
+                if failed[row]:
+                    continue
+                try:
+                    network.solve_hydraulics(simtime, warm=True)
+                except epanet2.ENtoolkitError:
+                    failed[row] = True
+                    # continue from a fresh solver
+                    network.close_hydraulics()
+                    continue
+                for kind, code, indices, measured, sigma, start in rows:
+                    simulated = _accessors(ep, kind)[0](indices, code)
+                    residuals[row, start:start+len(indices)] = (simulated - measured) / sigma
+    finally:
+        ep.ENsetoption(epanet2.EN_ACCURACY, accuracy)
+        _restore(ep, parameters, originals)
+        for (kind, code, indices, _), original in zip(boundaries, boundary_originals):
+            _accessors(ep, kind)[1](indices, code, original)
+    residuals[failed] = np.inf
+    return residuals
+
+
+def _simtimes(index, start):
+    """ return the pattern times in seconds of a time index """
+    if isinstance(index, pd.DatetimeIndex):
+        if start is None:
+            raise ValueError("Timestamps need the start time of the simulation")
+        index = index - pd.Timestamp(start)
+    if isinstance(index, pd.TimedeltaIndex):
+        return np.round(index.total_seconds()).astype(np.int64)
+    return np.asarray(index, dtype=np.int64)
+
+
+def _table(table, start):
+    """ return a DataFrame of time in seconds x uid from a wide or a long table """
+    if isinstance(table, pd.DataFrame) and set(['time', 'uid', 'value']) <= set(table.columns):
+        table = table.pivot_table(index='time', columns='uid', values='value', aggfunc='mean')
+    table = pd.DataFrame(table).copy()
+    table.index = _simtimes(table.index, start)
+    return table.groupby(level=0).mean().sort_index()
+
+
+class Parameter(object):
+    """ A calibration parameter that applies to a collection of elements
+
+    property:   one of PARAMETERS
+    name:       of the parameter, the property by default
+    elements:   collection, elements or uids, by default all elements of
+                the collection of the property
+    mode:       'set' gives every element the value, 'multiply' scales
+                the values of the elements and 'status' closes them below
+                0.5 and opens them from 0.5, the mode of the property by
+                default
+    initial:    start value, 1 for multipliers, the mean value of the
+                elements for 'set' and their first status for 'status'
+    bounds:     (lower, upper), (0, inf) by default, (0, 1) for 'status'
+    """
+
+    def __init__(self, property, name=None, elements=None, mode=None, initial=None, bounds=None):
+        if property not in PARAMETERS:
+            raise ValueError("Unknown parameter", property)
+        kind, code, collection, default = PARAMETERS[property]
+        mode = default if mode is None else mode
+        if mode not in MODES:
+            raise ValueError("Unknown mode", mode)
+        self.property = property
+        self.name = property if name is None else name
+        self.elements = elements
+        self.collection = collection
+        self.kind = kind
+        self.code = code
+        self.mode = mode
+        self.initial = initial
+        if bounds is None:
+            bounds = (0, 1) if mode == 'status' else (0, np.inf)
+        self.bounds = bounds
+
+    def __repr__(self):
+        return "<epynet.Parameter {name} ({property}, {mode})>".format(name=self.name, property=self.property,
+                                                                    mode=self.mode)
+
+    def uids(self, network):
+        """ return the uids of the elements """
+        elements = getattr(network, self.collection) if self.elements is None else self.elements
+        if isinstance(elements, dict):
+            return list(elements.keys())
+        return [getattr(element, 'uid', element) for element in elements]
+
+
+class Calibration(object):
+    """ Residuals of parameter vectors against measurements
+
+    network:        the network
+    parameters:     list of Parameter
+    measurements:   dict of result name (see sensitivity.OUTPUTS): table,
+                    either a DataFrame of time x uid with NaN where nothing
+                    was measured, or a long DataFrame with time, uid and
+                    value columns
+    boundaries:     dict of boundary name (see BOUNDARIES): table of time x
+                    uid, applied at every timestamp, the last earlier value
+                    is used for timestamps that are missing
+    sigma:          dict of result name: standard deviation of the
+                    measurements, a number or a Series by uid, 1 by default
+    start:          time of simtime 0 when the tables have timestamps, times
+                    are seconds or Timedeltas otherwise
+    workers:        processes that solve the vectors, kept until close(),
+                    with more than one every vector is solved on them
+    relative_step:  of the forward differences of jacobian(), relative to
+                    the absolute value of the parameter, at least 1
+    accuracy:       hydraulic accuracy of the solves, that of the network
+                    by default
+
+    Residuals are (simulated - measured) / sigma, ordered by time, result
+    name and uid, see index. Vectors that fail to solve have infinite
+    residuals. The residuals of every distinct vector are cached, so the
+    baseline of jacobian() is not solved again.
+    """
+
+    def __init__(self, network, parameters, measurements, boundaries=None, sigma=None, start=None, workers=1,
+                 relative_step=1e-2, accuracy=None):
+        self.network = network
+        self.parameters = list(parameters)
+        self.workers = workers
+        self.relative_step = relative_step
+        self.cache = {}
+        self.solves = 0
+        self._pool = None
+        sigma = {} if sigma is None else sigma
+        ep = network.ep
+
+        settings, initial = [], []
+        for parameter in self.parameters:
+            uids = parameter.uids(network)
+            getindex = ep.ENgetnodeindex if parameter.kind == 'node' else ep.ENgetlinkindex
+            indices = np.array([getindex(uid) for uid in uids], dtype=np.int64)
+            values = _accessors(ep, parameter.kind)[0](indices, parameter.code)
+            valves = np.zeros(0, dtype=np.int64)
+            if parameter.mode == 'status':
+                valves = np.array([index for uid, index in zip(uids, indices) if uid in network.valves],
+                                  dtype=np.int64)
+            settings.append({'kind': parameter.kind, 'code': parameter.code, 'indices': indices,
+                             'mode': parameter.mode, 'valves': valves,
+                             'valve_settings': ep.ENgetlinkvalues(valves, epanet2.EN_INITSETTING)})
+            if parameter.initial is not None:
+                initial.append(parameter.initial)
+            elif parameter.mode == 'multiply':
+                initial.append(1.0)
+            elif parameter.mode == 'status':
+                initial.append(values[0] if len(values) else 1.0)
+            else:
+                initial.append(values.mean() if len(values) else 0.0)
+        self._x0 = np.array(initial, dtype=float)
+
+        tables = {}
+        for name, table in measurements.items():
+            if name not in OUTPUTS:
+                raise ValueError("Unknown result", name)
+            tables[name] = _table(table, start)
+        self.properties = sorted(tables.keys())
+        self.times = sorted(set().union(*[table.index.tolist() for table in tables.values()]))
+        for name, table in tables.items():
+            deviations = pd.Series(sigma.get(name, 1.0), index=table.columns).fillna(1.0)
+            getindex = ep.ENgetnodeindex if OUTPUTS[name][0] == 'node' else ep.ENgetlinkindex
+            tables[name] = (table.reindex(self.times), deviations.values.astype(float),
+                            np.array([getindex(uid) for uid in table.columns], dtype=np.int64))
+
+        # the measurements of every timestamp: (kind, code, indices, measured, sigma, first residual)
+        rows = [[] for _ in self.times]
+        index, measured, deviations = [], [], []
+        count = 0
+        for position, simtime in enumerate(self.times):
+            for name in self.properties:
+                kind, code = OUTPUTS[name]
+                table, table_sigma, table_indices = tables[name]
+                values = table.values[position].astype(float)
+                known = np.isfinite(values)
+                uids = table.columns[known]
+                rows[position].append((kind, code, table_indices[known], values[known], table_sigma[known], count))
+                index.extend((simtime, name, uid) for uid in uids)
+                measured.append(values[known])
+                deviations.append(table_sigma[known])
+                count += len(uids)
+        self.index = pd.MultiIndex.from_tuples(index, names=['time', 'result', 'uid']) if index else \
+            pd.MultiIndex.from_arrays([[], [], []], names=['time', 'result', 'uid'])
+        self.measured = pd.Series(np.concatenate(measured) if count else np.zeros(0), index=self.index)
+        self.sigma = pd.Series(np.concatenate(deviations) if count else np.zeros(0), index=self.index)
+
+        boundary_settings = []
+        for name, table in (boundaries or {}).items():
+            if name not in BOUNDARIES:
+                raise ValueError("Unknown boundary", name)
+            kind, code = BOUNDARIES[name]
+            table = _table(table, start).reindex(self.times, method='ffill')
+            getindex = ep.ENgetnodeindex if kind == 'node' else ep.ENgetlinkindex
+            indices = np.array([getindex(uid) for uid in table.columns], dtype=np.int64)
+            boundary_settings.append((kind, code, indices, table.values.astype(float)))
+
+        self.settings = {'parameters': settings, 'boundaries': boundary_settings, 'times': self.times,
+                         'rows': rows, 'count': count, 'accuracy': accuracy}
+
+    def __repr__(self):
+        return "<epynet.Calibration of {parameters} parameters against {count} measurements>".format(
+            parameters=len(self.parameters), count=len(self))
+
+    def __len__(self):
+        return self.settings['count']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def names(self):
+        """ return the names of the parameters """
+        return [parameter.name for parameter in self.parameters]
+
+    @property
+    def x0(self):
+        """ return the initial parameter vector """
+        return self._x0.copy()
+
+    @property
+    def bounds(self):
+        """ return the (lower, upper) arrays of the parameters """
+        return (np.array([parameter.bounds[0] for parameter in self.parameters], dtype=float),
+                np.array([parameter.bounds[1] for parameter in self.parameters], dtype=float))
+
+    def _vectors(self, vectors):
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=float))
+        if vectors.shape[1] != len(self.parameters):
+            raise ValueError("Vectors need a value for every parameter")
+        return vectors
+
+    def evaluate(self, vectors, chunksize=8):
+        """ return an array of vector x measurement with the residuals of every parameter vector """
+        vectors = self._vectors(vectors)
+        keys = [vector.tobytes() for vector in vectors]
+
+        unique = {}
+        for key, vector in zip(keys, vectors):
+            if key not in self.cache and key not in unique:
+                unique[key] = vector
+        pending = list(unique.keys())
+        if pending:
+            workers = self.workers
+            # every vector runs on the same copy of the network, so residuals can be compared
+            if workers is not None and workers > 1:
+                if self._pool is None:
+                    self._pool = WorkerPool(self.network, workers)
+                workers = self._pool
+                chunksize = min(chunksize, -(-len(pending) // self.workers))
+            else:
+                workers = 1
+            vectors_pending = np.array([unique[key] for key in pending])
+            tasks = [(self.settings, vectors_pending[start:start+chunksize])
+                     for start in range(0, len(pending), chunksize)]
+            position = 0
+            try:
+                for residuals in parallel_map(self.network, _evaluate, tasks, workers):
+                    for row in residuals:
+                        self.cache[pending[position]] = row
+                        position += 1
+            finally:
+                self.network.close_hydraulics()
+                self.network.reset()
+            self.solves += len(pending) * len(self.times)
+
+        return np.array([self.cache[key] for key in keys]).reshape(len(keys), len(self))
+
+    def residuals(self, vector):
+        """ return the residuals of a parameter vector """
+        return self.evaluate([vector])[0]
+
+    def cost(self, vector):
+        """ return half the sum of the squared residuals of a parameter vector """
+        residuals = self.residuals(vector)
+        return 0.5 * residuals.dot(residuals)
+
+    def jacobian(self, vector):
+        """ return the array of measurement x parameter with the forward difference derivatives
+
+        The steps point away from the upper bound. Status parameters have
+        no derivatives, search them with evaluate(). """
+        vector = self._vectors(vector)[0]
+        lower, upper = self.bounds
+        steps = self.relative_step * np.maximum(np.abs(vector), 1.0)
+        steps = np.where(vector + steps > upper, -steps, steps)
+        perturbed = vector + np.diag(steps)
+        residuals = self.evaluate(np.vstack([vector, perturbed]))
+        jacobian = (residuals[1:] - residuals[0]).T / steps
+        for position, parameter in enumerate(self.parameters):
+            if parameter.mode == 'status':
+                jacobian[:, position] = 0
+        return jacobian
+
+    def frame(self, vector):
+        """ return a DataFrame with the measured and simulated value and the residual of every measurement """
+        residuals = self.residuals(vector)
+        return pd.DataFrame({'measured': self.measured.values,
+                             'simulated': self.measured.values + residuals * self.sigma.values,
+                             'residual': residuals}, index=self.index, columns=['measured', 'simulated', 'residual'])
+
+    def apply(self, vector):
+        """ Write a parameter vector to the network
+
+        Multipliers apply to the calibrated values afterwards, the workers
+        are stopped and the cached residuals are cleared. """
+        vector = self._vectors(vector)[0]
+        ep = self.network.ep
+        self.network.close_hydraulics()
+        self.network.reset()
+        originals = [_accessors(ep, parameter['kind'])[0](parameter['indices'], parameter['code'])
+                     for parameter in self.settings['parameters']]
+        _apply(ep, self.settings['parameters'], originals, vector, None)
+        self.close()
+        self.cache = {}
+
+    def close(self):
+        """ Stop the worker processes """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
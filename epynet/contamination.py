@@ -0,0 +1,243 @@
+""" EPYNET contamination events and sensor placement
+
+A contaminant is injected at every candidate node in turn, in water
+quality runs against hydraulics that are solved once (see
+epynet.quality). Every run records when the contaminant reaches each
+candidate sensor location, and how large the impact of the event is by
+then: the demand or mass of contaminant consumed, or the population of
+the nodes reached. The detections are kept as a sparse matrix of event x
+sensor, on which sensors are placed to minimise the expected impact.
+
+Example:
+    matrix = network.impact_matrix(threshold=0.01, impact='demand', workers=8)
+    sensors = matrix.place_sensors(5)
+    matrix.expected_impact(sensors)
+"""
+import numpy as np
+import pandas as pd
+
+from . import epanet2
+from .parallel import parallel_map
+from .quality import QualityEngine, QualityScenario, simulate
+
+IMPACTS = ['demand', 'mass', 'population']
+
+
+def _concatenate(arrays, dtype):
+    return np.concatenate(arrays).astype(dtype) if arrays else np.zeros(0, dtype=dtype)
+
+
+class _Impact(object):
+    """ Records the detections and the impact of an event """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.detected = np.zeros(len(settings['sensors']), dtype=bool)
+        self.exposed = np.zeros(len(settings['nodes']), dtype=bool)
+        self.positions = []
+        self.times = []
+        self.impacts = []
+        self.total = 0.0
+
+    def read(self, ep):
+        quality = ep.ENgetnodevalues(self.settings['nodes'], epanet2.EN_QUALITY)
+        if self.settings['impact'] == 'population':
+            return quality, None
+        return quality, ep.ENgetnodevalues(self.settings['nodes'], epanet2.EN_DEMAND)
+
+    def update(self, simtime, values, timestep):
+        settings = self.settings
+        quality, demand = values
+        contaminated = quality > settings['threshold']
+        if settings['impact'] == 'population':
+            self.exposed |= contaminated
+            self.total = settings['population'][self.exposed].sum()
+
+        # sensors detect the event at the start of the timestep, with the impact so far
+        new = np.flatnonzero(contaminated[settings['sensors']] & ~self.detected)
+        if len(new):
+            self.detected[new] = True
+            self.positions.append(new)
+            self.times.extend([simtime] * len(new))
+            self.impacts.extend([self.total] * len(new))
+
+        if settings['impact'] == 'demand':
+            self.total += np.maximum(demand[contaminated], 0).sum() * timestep / 3600.
+        elif settings['impact'] == 'mass':
+            self.total += (np.maximum(demand, 0) * quality).sum() * timestep / 3600.
+
+    def result(self):
+        positions = _concatenate(self.positions, np.int64)
+        return positions, np.array(self.times, dtype=np.int64), np.array(self.impacts), self.total
+
+
+def _inject(network, settings, uid):
+    """ Inject at a node, returns the detections and the total impact """
+    recorder = _Impact(settings)
+    scenario = QualityScenario('chemical', sources={uid: (settings['strength'], settings['source_type'])})
+    simulate(network, settings, scenario, recorder, quality_steps=True)
+    return recorder.result()
+
+
+class ImpactMatrix(object):
+    """ Detections of contamination events by candidate sensors
+
+    events:     uids of the injection nodes
+    sensors:    uids of the candidate sensor nodes
+    event:      position in events of every detection
+    sensor:     position in sensors of every detection
+    time:       of every detection in seconds
+    impact:     of the event when it is detected
+    undetected: impact of every event when no sensor detects it
+    weights:    probability of every event, uniform by default
+
+    An event that is detected by several sensors has the impact of the
+    earliest detection.
+    """
+
+    def __init__(self, events, sensors, event, sensor, time, impact, undetected, weights=None):
+        self.events = list(events)
+        self.sensors = list(sensors)
+        self.event = event
+        self.sensor = sensor
+        self.time = time
+        self.impact = impact
+        self.undetected = undetected
+        if weights is None:
+            weights = np.full(len(self.events), 1. / max(len(self.events), 1))
+        self.weights = np.asarray(weights, dtype=float)
+
+    def __repr__(self):
+        return "<epynet.ImpactMatrix of {events} events and {sensors} sensors with {count} detections>".format(
+            events=len(self.events), sensors=len(self.sensors), count=len(self.event))
+
+    def __len__(self):
+        return len(self.event)
+
+    def frame(self):
+        """ return a DataFrame with the event, sensor, time and impact of every detection """
+        return pd.DataFrame({'event': np.array(self.events, dtype=object)[self.event],
+                             'sensor': np.array(self.sensors, dtype=object)[self.sensor],
+                             'time': self.time, 'impact': self.impact},
+                            columns=['event', 'sensor', 'time', 'impact'])
+
+    def detection_times(self):
+        """ return a DataFrame of event x sensor with the detection times, NaN when not detected """
+        times = np.full((len(self.events), len(self.sensors)), np.nan)
+        times[self.event, self.sensor] = self.time
+        return pd.DataFrame(times, index=self.events, columns=self.sensors)
+
+    def _positions(self, sensors):
+        mask = np.zeros(len(self.sensors), dtype=bool)
+        mask[[self.sensors.index(uid) for uid in sensors]] = True
+        return mask
+
+    def _impacts(self, mask):
+        impacts = self.undetected.copy()
+        detections = mask[self.sensor]
+        np.minimum.at(impacts, self.event[detections], self.impact[detections])
+        return impacts
+
+    def impacts(self, sensors):
+        """ return a Series with the impact of every event with sensors at the given nodes """
+        return pd.Series(self._impacts(self._positions(sensors)), index=self.events)
+
+    def expected_impact(self, sensors):
+        """ return the impact with sensors at the given nodes, weighted over the events """
+        return self.weights.dot(self._impacts(self._positions(sensors)))
+
+    def _gains(self, impacts, mask):
+        """ return the reduction of the expected impact per sensor that is not placed """
+        gains = np.bincount(self.sensor, self.weights[self.event] * np.maximum(impacts[self.event] - self.impact, 0),
+                            minlength=len(self.sensors))
+        gains[mask] = -1
+        return gains
+
+    def place_sensors(self, count, method='local', max_sweeps=20):
+        """ Choose the nodes of count sensors that minimise the expected impact
+
+        method 'greedy' adds the sensor that reduces the impact most until
+        count sensors are placed, 'local' then swaps sensors for better ones
+        until no swap improves the placement or after max_sweeps sweeps.
+        Fewer sensors are returned when more sensors do not reduce the
+        impact. """
+        if method not in ('greedy', 'local'):
+            raise ValueError("Unknown placement method", method)
+        mask = np.zeros(len(self.sensors), dtype=bool)
+        impacts = self.undetected.copy()
+        chosen = []
+        for _ in range(min(count, len(self.sensors))):
+            gains = self._gains(impacts, mask)
+            best = int(np.argmax(gains))
+            if gains[best] <= 0:
+                break
+            chosen.append(best)
+            mask[best] = True
+            impacts = self._impacts(mask)
+
+        if method == 'local':
+            for _ in range(max_sweeps):
+                improved = False
+                for position, current in enumerate(chosen):
+                    mask[current] = False
+                    gains = self._gains(self._impacts(mask), mask)
+                    best = int(np.argmax(gains))
+                    if gains[best] > gains[current] * (1 + 1e-9) + 1e-12:
+                        chosen[position] = current = best
+                        improved = True
+                    mask[current] = True
+                if not improved:
+                    break
+        return [self.sensors[position] for position in chosen]
+
+
+def impact_matrix(network, events=None, sensors=None, threshold=0.01, impact='demand', population=None,
+                  strength=1000, source_type='mass', weights=None, workers=1, chunksize=1, cache=None):
+    """ Inject a contaminant at every event node and return the ImpactMatrix
+
+    network:     the network, its hydraulics are solved once
+    events:      uids of the injection nodes, all junctions by default
+    sensors:     uids of the candidate sensor nodes, all junctions by default
+    threshold:   concentration above which a node is contaminated and a
+                 sensor detects the contaminant
+    impact:      'demand', the volume of contaminated water consumed in
+                 flow units x hours, 'mass', the contaminant consumed in
+                 flow units x concentration x hours, or 'population', the
+                 population of the contaminated nodes
+    population:  dict or Series of node uid: population, for 'population'
+    strength:    of the injection, which lasts the whole simulation
+    source_type: of the injection, see quality.SOURCE_TYPES
+    weights:     dict or Series of event uid: probability, uniform by default
+    workers:     processes that run the injections
+    cache:       HydraulicsCache for the hydraulics, see epynet.cache
+    """
+    if impact not in IMPACTS:
+        raise ValueError("Unknown impact", impact)
+    if impact == 'population' and population is None:
+        raise ValueError("The population impact needs the population of the nodes")
+    events = list(network.junctions.uid) if events is None else list(events)
+    sensors = list(network.junctions.uid) if sensors is None else list(sensors)
+
+    with QualityEngine(network, links=[], cache=cache) as engine:
+        positions = dict((uid, position) for position, uid in enumerate(engine.nodes))
+        settings = dict(engine.settings, threshold=threshold, impact=impact, strength=strength,
+                        source_type=source_type,
+                        sensors=np.array([positions[uid] for uid in sensors], dtype=np.int64))
+        if impact == 'population':
+            settings['population'] = pd.Series(population).reindex(engine.nodes).fillna(0).values
+
+        event, sensor, time, impacts, undetected = [], [], [], [], np.zeros(len(events))
+        tasks = [(settings, uid) for uid in events]
+        for position, (detected, times, values, total) in enumerate(
+                parallel_map(engine.network, _inject, tasks, workers, chunksize)):
+            event.append(np.full(len(detected), position, dtype=np.int64))
+            sensor.append(detected)
+            time.append(times)
+            impacts.append(values)
+            undetected[position] = total
+
+    if weights is not None:
+        weights = pd.Series(weights).reindex(events).fillna(0).values
+        weights = weights / weights.sum()
+    return ImpactMatrix(events, sensors, _concatenate(event, np.int64), _concatenate(sensor, np.int64),
+                        _concatenate(time, np.int64), _concatenate(impacts, float), undetected, weights)
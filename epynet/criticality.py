@@ -0,0 +1,156 @@
+""" EPYNET pipe criticality (N-1) analysis """
+import csv
+
+import numpy as np
+import pandas as pd
+
+from . import epanet2
+from .graph import DepthFirstForest
+from .node import Junction, Reservoir, Tank
+from .parallel import parallel_map
+
+COLUMNS = ['method', 'isolated_nodes', 'nodes_below', 'pressure_deficit', 'unsupplied_demand']
+
+
+def _junction_indices(network):
+    return np.array([node.index for node in network.topology.nodes if isinstance(node, Junction)], dtype=np.int64)
+
+
+def _close_pipes(network, uids, simtime, min_pressure):
+    """ Close the pipes one at a time and measure the impact on the junctions """
+    ep = network.ep
+    junctions = _junction_indices(network)
+
+    network.solve_hydraulics(simtime, warm=True)
+    base_deficit = np.maximum(min_pressure - ep.ENgetnodevalues(junctions, epanet2.EN_PRESSURE), 0)
+    base_demand = ep.ENgetnodevalues(junctions, epanet2.EN_DEMAND)
+
+    rows = []
+    for uid in uids:
+        index = ep.ENgetlinkindex(uid)
+        status = ep.ENgetlinkvalue(index, epanet2.EN_INITSTATUS)
+        try:
+            ep.ENsetlinkvalue(index, epanet2.EN_INITSTATUS, 0)
+        except epanet2.ENtoolkitError:
+            # the toolkit cannot close pipes with a check valve
+            rows.append((uid, 'failed', 0, np.nan, np.nan, np.nan))
+            continue
+        try:
+            network.solve_hydraulics(simtime, warm=True)
+            pressure = ep.ENgetnodevalues(junctions, epanet2.EN_PRESSURE)
+            demand = ep.ENgetnodevalues(junctions, epanet2.EN_DEMAND)
+        except epanet2.ENtoolkitError:
+            rows.append((uid, 'failed', 0, np.nan, np.nan, np.nan))
+            continue
+        finally:
+            ep.ENsetlinkvalue(index, epanet2.EN_INITSTATUS, status)
+
+        deficit = np.maximum(min_pressure - pressure, 0)
+        rows.append((uid, 'solved', 0,
+                     int(np.count_nonzero((deficit > 0) & (base_deficit == 0))),
+                     float(np.maximum(deficit - base_deficit, 0).sum()),
+                     float(np.maximum(base_demand - demand, 0).sum())))
+    return rows
+
+
+def pipe_criticality(network, pipes=None, min_pressure=0, simtime=0, flow_threshold=1e-3,
+                     workers=1, output=None, chunksize=64):
+    """ Close every pipe in turn and measure the impact on the junctions
+
+    Pipes whose closure cuts off part of the network from all reservoirs and
+    tanks (bridges) are evaluated without solving: the junctions on the cut
+    off side are isolated, lose their demand and are taken to have zero
+    pressure. Pipes that carry less than flow_threshold in the baseline and
+    are not bridges are skipped, closing them hardly changes the solution.
+    All other pipes are solved, with warm starts, on the given number of
+    worker processes. Pipes with a check valve cannot be closed by the
+    toolkit and fail unless they are bridges or skipped.
+
+    Returns a DataFrame indexed by pipe uid with the columns:
+    method            'solved', 'bridge', 'skipped' or 'failed'
+    isolated_nodes    number of junctions cut off from every source
+    nodes_below       number of junctions that drop below min_pressure
+    pressure_deficit  total increase of the pressure shortfall below min_pressure
+    unsupplied_demand demand that is no longer delivered
+
+    When output is a file name, rows are written to it as a CSV file as soon
+    as they are available.
+    """
+    ep = network.ep
+    topology = network.topology
+
+    if pipes is None:
+        uids = list(network.pipes.keys())
+    else:
+        uids = [pipe if isinstance(pipe, str) else pipe.uid for pipe in pipes]
+
+    network.solve_hydraulics(simtime, warm=True)
+    flows = ep.ENgetlinkvalues(topology.link_indices, epanet2.EN_FLOW)
+    status = ep.ENgetlinkvalues(topology.link_indices, epanet2.EN_INITSTATUS)
+    pressure = ep.ENgetnodevalues(topology.node_indices, epanet2.EN_PRESSURE)
+    demand = ep.ENgetnodevalues(topology.node_indices, epanet2.EN_DEMAND)
+
+    is_junction = np.array([isinstance(node, Junction) for node in topology.nodes])
+    is_source = np.array([isinstance(node, (Reservoir, Tank)) for node in topology.nodes])
+    base_deficit = np.maximum(min_pressure - pressure, 0)
+
+    # per node: demand, junctions, sources, junctions above min_pressure and
+    # the deficit increase when the junction loses all pressure
+    values = np.column_stack([np.where(is_junction, np.maximum(demand, 0), 0),
+                              is_junction,
+                              is_source,
+                              is_junction & (base_deficit == 0),
+                              np.where(is_junction, max(min_pressure, 0) - base_deficit, 0)])
+
+    # bridges of the graph of open links
+    open_links = status != 0
+    forest = DepthFirstForest(topology.node_count, topology.from_nodes[open_links], topology.to_nodes[open_links])
+    totals = forest.subtree_totals(values)
+    edges = np.cumsum(open_links) - 1
+
+    rows = []
+    solve = []
+    for uid in uids:
+        position = topology.link_positions[uid]
+        if not open_links[position]:
+            rows.append((uid, 'skipped', 0, 0, 0.0, 0.0))
+            continue
+
+        edge = edges[position]
+        if forest.bridges[edge]:
+            below = forest.below[edge]
+            cut = totals[below]
+            rest = totals[forest.root[below]] - cut
+            isolated = cut if cut[2] == 0 else rest if rest[2] == 0 else None
+            if isolated is not None:
+                rows.append((uid, 'bridge', int(isolated[1]), int(isolated[3]),
+                             float(isolated[4]), float(isolated[0])))
+                continue
+
+        if abs(flows[position]) < flow_threshold:
+            rows.append((uid, 'skipped', 0, 0, 0.0, 0.0))
+        else:
+            solve.append(uid)
+
+    tasks = [(solve[start:start+chunksize], simtime, min_pressure) for start in range(0, len(solve), chunksize)]
+
+    handle = open(output, 'w') if output else None
+    try:
+        if handle:
+            writer = csv.writer(handle)
+            writer.writerow(['pipe'] + COLUMNS)
+            writer.writerows(rows)
+            handle.flush()
+        for chunk in parallel_map(network, _close_pipes, tasks, workers):
+            rows.extend(chunk)
+            if handle:
+                writer.writerows(chunk)
+                handle.flush()
+    finally:
+        if handle:
+            handle.close()
+        network.close_hydraulics()
+        network.reset()
+
+    table = pd.DataFrame([row[1:] for row in rows], index=[row[0] for row in rows], columns=COLUMNS)
+    return table.loc[uids]
@@ -1,6 +1,8 @@
 from . import epanet2
 import weakref
 
+import numpy as np
+
 class Curve(object):
 
     def __init__(self, uid, network):
@@ -12,12 +14,84 @@ class Curve(object):
 
     @property
     def index(self):
-        return self.network().ep.ENgetcurveindex(self.uid)
+        return self.network().curve_store.index(self.uid)
 
     @property
     def values(self):
-        return self.network().ep.ENgetcurve(self.index)
+        return [tuple(point) for point in self.network().curve_store.get(self.uid).tolist()]
 
     @values.setter
     def values(self, value):
-        self.network().ep.ENsetcurve(self.index, value)
+        self.network().curve_store.set(self.uid, value)
+
+    @property
+    def curve_type(self):
+        return self.network().ep.ENgetcurvetype(self.index)
+
+
+class CurveStore(object):
+    """ Cache of the data curves of a network as NumPy arrays
+
+    Curve ids, indices and points are read from the toolkit once and kept
+    up to date by the writes that go through the store. The points of a
+    curve are an (n, 2) array of x and y values.
+    """
+
+    def __init__(self, network):
+        self.network = weakref.ref(network)
+        self.uids = []
+        self.indices = {}
+        self.arrays = []
+
+        ep = network.ep
+        for index in range(1, ep.ENgetcount(epanet2.EN_CURVECOUNT)+1):
+            self._register(ep.ENgetcurveid(index), index, ep.ENgetcurvepoints(index))
+
+    def __len__(self):
+        return len(self.uids)
+
+    def __contains__(self, uid):
+        return uid in self.indices
+
+    def _register(self, uid, index, points):
+        self.uids.append(uid)
+        self.indices[uid] = index
+        self.arrays.append(points)
+
+    def index(self, uid):
+        """ return the toolkit index of a curve """
+        if uid not in self.indices:
+            raise KeyError("Unknown curve", uid)
+        return self.indices[uid]
+
+    def uid(self, index):
+        """ return the uid of the curve with a toolkit index """
+        if index < 1 or index > len(self.uids):
+            raise KeyError("Unknown curve index", index)
+        return self.uids[index - 1]
+
+    def get(self, uid):
+        """ return the points of a curve as an (n, 2) array """
+        return self.arrays[self.index(uid) - 1].copy()
+
+    def set(self, uid, points):
+        """ set the points of a curve from a sequence of (x, y) pairs """
+        index = self.index(uid)
+        points = np.array(points, dtype=float).reshape(-1, 2)
+        self.network().ep.ENsetcurve(index, points.tolist())
+        self.arrays[index - 1] = points
+        self.network().solved = False
+
+    def add(self, uid, points):
+        """ add a curve and return its Curve object """
+        network = self.network()
+        network.close_hydraulics()
+        network.ep.ENaddcurve(uid)
+        index = network.ep.ENgetcurveindex(uid)
+        points = np.array(points, dtype=float).reshape(-1, 2)
+        network.ep.ENsetcurve(index, points.tolist())
+        self._register(uid, index, points)
+
+        curve = Curve(uid, network)
+        network.curves[uid] = curve
+        return curve
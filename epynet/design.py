@@ -0,0 +1,136 @@
+""" EPYNET pipe sizing design evaluation
+
+Evaluates populations of pipe diameter assignments, as produced by a
+genetic algorithm, against cost and pressure constraints. An individual
+is a row of option numbers, one per candidate pipe, that select a
+diameter (and its unit cost) from a table of options.
+
+Example:
+    design = PipeDesign(network, pipes, diameters=[100, 150, 200], unit_costs=[50, 80, 120], min_pressure=20)
+    cost, violation = design.evaluate(population, workers=8)
+"""
+import numpy as np
+import pandas as pd
+
+from . import epanet2
+from .parallel import parallel_map
+
+
+def _solve(network, settings, population):
+    """ Apply the diameters of every individual and solve the loading conditions """
+    ep = network.ep
+    pipes = np.array([ep.ENgetlinkindex(uid) for uid in settings['pipes']], dtype=np.int64)
+    junctions = np.array([ep.ENgetnodeindex(uid) for uid in settings['junctions']], dtype=np.int64)
+    diameters = settings['diameters']
+    original = ep.ENgetlinkvalues(pipes, epanet2.EN_DIAMETER)
+    min_pressure = settings['min_pressure']
+
+    violations = np.zeros((len(population), 2))
+    current = None
+    try:
+        for row, options in enumerate(population):
+            # only write the diameters that differ from the previous individual
+            changed = slice(None) if current is None else options != current
+            ep.ENsetlinkvalues(pipes[changed], epanet2.EN_DIAMETER, diameters[options[changed]])
+            current = options
+
+            for simtime in settings['simtimes']:
+                try:
+                    network.solve_hydraulics(simtime, warm=True)
+                except epanet2.ENtoolkitError:
+                    violations[row] = np.inf
+                    # start the next individual from a fresh solver
+                    network.close_hydraulics()
+                    break
+                deficit = np.maximum(min_pressure - ep.ENgetnodevalues(junctions, epanet2.EN_PRESSURE), 0)
+                violations[row, 0] = max(violations[row, 0], deficit.max() if len(deficit) else 0)
+                violations[row, 1] += deficit.sum()
+    finally:
+        ep.ENsetlinkvalues(pipes, epanet2.EN_DIAMETER, original)
+    return violations
+
+
+class PipeDesign(object):
+    """ Cost and pressure constraints of pipe diameter assignments
+
+    network:      the network
+    pipes:        collection or uids of the candidate pipes
+    diameters:    diameter of every option
+    unit_costs:   cost per unit length of every option
+    min_pressure: minimum pressure, a number or a Series by junction uid
+    junctions:    junctions for the pressure constraint, all by default
+    simtimes:     pattern times in seconds of the loading conditions
+
+    Individuals are rows of option numbers, one per candidate pipe. The
+    results of every distinct individual are cached, so repeated
+    individuals are not solved again.
+    """
+
+    def __init__(self, network, pipes, diameters, unit_costs, min_pressure=0, junctions=None, simtimes=(0,)):
+        self.network = network
+        self.pipes = [pipe if isinstance(pipe, str) else pipe.uid for pipe in pipes]
+        self.diameters = np.asarray(diameters, dtype=float)
+        self.unit_costs = np.asarray(unit_costs, dtype=float)
+        if self.diameters.shape != self.unit_costs.shape:
+            raise ValueError("Every diameter option needs a unit cost")
+
+        self.lengths = network.ep.ENgetlinkvalues([network.pipes[uid].index for uid in self.pipes], epanet2.EN_LENGTH)
+        junctions = list(network.junctions.keys() if junctions is None else
+                         [junction if isinstance(junction, str) else junction.uid for junction in junctions])
+        if isinstance(min_pressure, pd.Series):
+            min_pressure = min_pressure.reindex(junctions).values
+        self.settings = {'pipes': self.pipes, 'junctions': junctions, 'diameters': self.diameters,
+                         'min_pressure': np.broadcast_to(np.asarray(min_pressure, dtype=float), (len(junctions),)),
+                         'simtimes': list(simtimes)}
+        self.cache = {}
+        self.solves = 0
+
+    def cost(self, population):
+        """ return the cost of every individual """
+        population = self._population(population)
+        return self.unit_costs[population].dot(self.lengths)
+
+    def _population(self, population):
+        population = np.atleast_2d(np.asarray(population, dtype=np.int64))
+        if population.shape[1] != len(self.pipes):
+            raise ValueError("Individuals need an option for every candidate pipe")
+        if population.min() < 0 or population.max() >= len(self.diameters):
+            raise ValueError("Unknown diameter option")
+        return population
+
+    def evaluate(self, population, workers=1, chunksize=64):
+        """ return the cost and the pressure violations of every individual
+
+        The violations array has the largest and the total pressure deficit
+        over all junctions and loading conditions per individual, an
+        individual is feasible when both are zero. Individuals that fail to
+        solve have infinite violations. """
+        population = self._population(population)
+        keys = [individual.tobytes() for individual in population]
+
+        unique = {}
+        for key, individual in zip(keys, population):
+            if key not in self.cache and key not in unique:
+                unique[key] = individual
+        pending = list(unique.keys())
+        if pending:
+            # similar individuals next to each other change few diameters
+            individuals = np.array([unique[key] for key in pending])
+            order = np.lexsort(individuals.T[::-1])
+            pending = [pending[position] for position in order]
+            individuals = individuals[order]
+
+            tasks = [(self.settings, individuals[start:start+chunksize])
+                     for start in range(0, len(individuals), chunksize)]
+            position = 0
+            try:
+                for violations in parallel_map(self.network, _solve, tasks, workers):
+                    for row in violations:
+                        self.cache[pending[position]] = row
+                        position += 1
+            finally:
+                self.network.close_hydraulics()
+                self.network.reset()
+            self.solves += len(pending)
+
+        return self.cost(population), np.array([self.cache[key] for key in keys]).reshape(-1, 2)
@@ -0,0 +1,174 @@
+""" EPYNET pump energy accounting
+
+Integrates pump power, pumped volume and hydraulic power over the
+hydraulic steps of a simulation and prices the energy with a time of use
+tariff. Accounts are reducers (see epynet.reducers), so they are fed from
+the step loop of Network.run() without keeping time series.
+
+Example:
+    tariff = Tariff([0.10] * 7 + [0.25] * 16 + [0.10], step=3600, demand_charge=5)
+    account = EnergyAccount(network.pumps, tariff, stations={'1': 'north', '2': 'north'})
+    network.run(reducers={'energy': account})
+    account.result()           # energy, cost, efficiency, ... per pump
+    account.station_result()   # the same per station
+"""
+import numpy as np
+import pandas as pd
+
+from . import epanet2
+from .reducers import Reducer
+
+# flow unit to m3/s and whether heads are in feet
+FLOW_FACTORS = {epanet2.EN_CFS: (0.0283168, True), epanet2.EN_GPM: (6.30902e-5, True),
+                epanet2.EN_MGD: (0.0438126, True), epanet2.EN_IMGD: (0.0526168, True),
+                epanet2.EN_AFD: (0.0142764, True), epanet2.EN_LPS: (0.001, False),
+                epanet2.EN_LPM: (1 / 60000.0, False), epanet2.EN_MLD: (1 / 86.4, False),
+                epanet2.EN_CMH: (1 / 3600.0, False), epanet2.EN_CMD: (1 / 86400.0, False)}
+
+FEET = 0.3048
+
+
+class Tariff(object):
+    """ Energy price that repeats every period
+
+    prices:        price per kWh for consecutive intervals of step seconds
+    demand_charge: price per kW of the peak power
+    """
+
+    def __init__(self, prices, step=3600, demand_charge=0):
+        self.prices = np.atleast_1d(np.asarray(prices, dtype=float))
+        self.step = step
+        self.period = step * len(self.prices)
+        self.demand_charge = demand_charge
+        # integral of the price at the start of every interval
+        self.cumulative = np.concatenate([[0], np.cumsum(self.prices * step)])
+
+    @classmethod
+    def from_pattern(cls, network, pattern, price=1, demand_charge=0):
+        """ Tariff of a base price multiplied by the factors of a time pattern of the network """
+        uid = pattern if isinstance(pattern, str) else pattern.uid
+        factors = network.pattern_store.get(uid)
+        return cls(price * factors, network.ep.ENgettimeparam(epanet2.EN_PATTERNSTEP), demand_charge)
+
+    def price(self, time):
+        """ price at a time in seconds """
+        position = (np.asarray(time, dtype=float) % self.period) // self.step
+        return self.prices[position.astype(np.int64)]
+
+    def integral(self, time):
+        """ integral of the price from time 0, in price times seconds """
+        periods, rest = np.divmod(np.asarray(time, dtype=float), self.period)
+        position = np.minimum(rest // self.step, len(self.prices) - 1).astype(np.int64)
+        return periods * self.cumulative[-1] + self.cumulative[position] + (rest - position * self.step) * self.prices[position]
+
+    def mean_price(self, start, duration):
+        """ mean price over intervals that may span several price steps """
+        if duration <= 0:
+            return float(self.price(start))
+        return (self.integral(start + duration) - self.integral(start)) / duration
+
+
+class EnergyAccount(Reducer):
+    """ Energy use and cost of pumps over a simulation
+
+    pumps:            collection of pumps
+    tariff:           Tariff, or a flat price per kWh
+    stations:         dict or Series mapping pump uid to a station name
+    specific_gravity: of the fluid, for the hydraulic power
+
+    result() gives per pump the energy (kWh), cost (energy cost plus demand
+    charge), volume (m3), running time (h), peak power (kW), the mean
+    wire-to-water efficiency and the specific energy (kWh/m3).
+    """
+
+    def __init__(self, pumps, tariff=0, stations=None, specific_gravity=1):
+        super(EnergyAccount, self).__init__(pumps, 'energy')
+        self.tariff = tariff if isinstance(tariff, Tariff) else Tariff([tariff])
+        self.stations = None if stations is None else pd.Series(stations)
+        self.specific_gravity = specific_gravity
+
+    @property
+    def key(self):
+        return (id(self), 'energy')
+
+    def start(self, network):
+        pumps = list(self.objects)
+        self.uids = [pump.uid for pump in pumps]
+        self.indices = np.array([pump.index for pump in pumps], dtype=np.int64)
+        self.ep = network.ep
+
+        flow_factor, feet = FLOW_FACTORS[network.ep.ENgetflowunits()]
+        self.flow_factor = flow_factor
+        self.head_factor = FEET if feet else 1.0
+
+        if self.stations is not None:
+            self.station_names, self.station_codes = np.unique(self.stations.reindex(self.uids).fillna('').values.astype(str),
+                                                               return_inverse=True)
+        else:
+            self.station_names, self.station_codes = np.array([]), np.zeros(len(pumps), dtype=np.int64)
+        self.initialize(len(pumps))
+
+    def read(self):
+        power = self.ep.ENgetlinkvalues(self.indices, epanet2.EN_ENERGY)
+        flow = self.ep.ENgetlinkvalues(self.indices, epanet2.EN_FLOW)
+        # the headloss of a pump is minus its head gain
+        head = -self.ep.ENgetlinkvalues(self.indices, epanet2.EN_HEADLOSS)
+        return power, flow, head
+
+    def initialize(self, size):
+        self.energy = np.zeros(size)
+        self.cost = np.zeros(size)
+        self.volume = np.zeros(size)
+        self.hydraulic_energy = np.zeros(size)
+        self.running = np.zeros(size)
+        self.peak = np.zeros(size)
+        self.station_peak = np.zeros(len(self.station_names))
+        self.station_running = np.zeros(len(self.station_names))
+
+    def update(self, values, time, duration):
+        power, flow, head = values
+        hours = duration / 3600.0
+        flow = np.abs(flow) * self.flow_factor
+
+        self.energy += power * hours
+        self.cost += power * hours * self.tariff.mean_price(time, duration)
+        self.volume += flow * duration
+        self.hydraulic_energy += 9.81 * self.specific_gravity * flow * np.maximum(head, 0) * self.head_factor * hours
+        self.running += (power > 0) * hours
+        np.maximum(self.peak, power, out=self.peak)
+        if len(self.station_names):
+            station_power = np.bincount(self.station_codes, power, minlength=len(self.station_names))
+            np.maximum(self.station_peak, station_power, out=self.station_peak)
+            self.station_running += (station_power > 0) * hours
+
+    def _table(self, energy, cost, volume, hydraulic_energy, running, peak, index):
+        demand_charge = peak * self.tariff.demand_charge
+        with np.errstate(invalid='ignore', divide='ignore'):
+            efficiency = np.where(energy > 0, hydraulic_energy / energy, np.nan)
+            specific_energy = np.where(volume > 0, energy / volume, np.nan)
+        return pd.DataFrame({'energy': energy, 'cost': cost + demand_charge, 'energy_cost': cost,
+                             'demand_charge': demand_charge, 'volume': volume, 'running_time': running,
+                             'peak_power': peak, 'efficiency': efficiency, 'specific_energy': specific_energy},
+                            index=index,
+                            columns=['energy', 'cost', 'energy_cost', 'demand_charge', 'volume',
+                                     'running_time', 'peak_power', 'efficiency', 'specific_energy'])
+
+    def value(self):
+        return self.energy
+
+    def result(self):
+        """ return a DataFrame with the accounts per pump """
+        return self._table(self.energy, self.cost, self.volume, self.hydraulic_energy, self.running,
+                           self.peak, self.uids)
+
+    def station_result(self):
+        """ return a DataFrame with the accounts per station, running time and peak power are those of the station as a whole """
+        if not len(self.station_names):
+            raise ValueError("No stations defined")
+        count = len(self.station_names)
+
+        def total(values):
+            return np.bincount(self.station_codes, values, minlength=count)
+
+        return self._table(total(self.energy), total(self.cost), total(self.volume), total(self.hydraulic_energy),
+                           self.station_running, self.station_peak, list(self.station_names))
@@ -8,6 +8,8 @@ import datetime
 import os
 import warnings
 
+import numpy as np
+
 
 class EPANET2(object):
 
@@ -31,7 +33,7 @@ class EPANET2(object):
              # if epanet2.dll compiled with __stdcall (as in EPA original DLL)
              try:
                self._lib = ctypes.windll.epanet2
-               self._lib.EN_getversion(self.ph, ctypes.byref(ctypes.c_int()))
+               self._lib.EN_getversion(ctypes.byref(ctypes.c_int()))
              except ValueError:
                raise Exception("epanet2.dll not suitable")
 
@@ -49,6 +51,11 @@ class EPANET2(object):
         self._max_label_len= 32
         self._err_max_char= 80
 
+        # records the original values of changed data, see journal.Journal
+        self.journal = None
+        # False when ENdeleteproject would crash, see ENaddnode
+        self.deletable = True
+
     def ENepanet(self,nomeinp, nomerpt='', nomebin='', vfunc=None):
         """Runs a complete EPANET simulation.
 
@@ -84,6 +91,12 @@ class EPANET2(object):
           raise ENtoolkitError(self, ierr)
 
 
+    def ENclose(self):
+      """Closes the project and its files, the project can be opened again"""
+      ierr= self._lib.EN_close(self.ph)
+      if ierr!=0: raise ENtoolkitError(self, ierr)
+
+
     def ENdeleteproject(self):
       """Closes down the Toolkit system (including all files being processed)"""
       ierr= self._lib.EN_deleteproject(ctypes.byref(self.ph))
@@ -119,6 +132,8 @@ class EPANET2(object):
         object_type: object type
         index: object index
         """
+        if self.journal is not None:
+            self.journal.irreversible = True
         ierr = self._lib.EN_setcomment(self.ph, object_type, index, ctypes.c_char_p(comment.encode(self.charset)))
         if ierr!=0: raise ENtoolkitError(self, ierr)
 
@@ -355,7 +370,7 @@ class EPANET2(object):
         if ierr!=0: raise ENtoolkitError(self, ierr)
         return j.value
         
-    def  ENgetqualtype(self, qualcode):
+    def  ENgetqualtype(self, qualcode=None):
         """Retrieves the type of water quality analysis called for
         returns  qualcode: Water quality analysis codes are as follows:
                            EN_NONE	0 No quality analysis
@@ -372,13 +387,28 @@ class EPANET2(object):
         if ierr!=0: raise ENtoolkitError(self, ierr)
         return qualcode.value, tracenode.value
 
+    def ENgetqualinfo(self):
+        """Retrieves the water quality analysis called for
+        returns a tuple of qualcode, chemname, chemunits and the index of the
+        traced node, see ENgetqualtype"""
+        qualcode= ctypes.c_int()
+        tracenode= ctypes.c_int()
+        chemname= ctypes.create_string_buffer(32)
+        chemunits= ctypes.create_string_buffer(32)
+        ierr= self._lib.EN_getqualinfo(self.ph, ctypes.byref(qualcode), ctypes.byref(chemname),
+                                 ctypes.byref(chemunits), ctypes.byref(tracenode))
+        if ierr!=0: raise ENtoolkitError(self, ierr)
+        return (qualcode.value, chemname.value.decode(self.charset), chemunits.value.decode(self.charset),
+                tracenode.value)
+
 
 
     #-------Retrieving other network information--------
-    def ENgetcontrol(self, cindex, ctype, lindex, setting, nindex, level ):
+    def ENgetcontrol(self, cindex, ctype=None, lindex=None, setting=None, nindex=None, level=None):
         """Retrieves the parameters of a simple control statement.
         Arguments:
            cindex:  control statement index
+        Returns a tuple of
            ctype:   control type code EN_LOWLEVEL   (Low Level Control)
                                       EN_HILEVEL    (High Level Control)
                                       EN_TIMER      (Timer Control)       
@@ -387,12 +417,16 @@ class EPANET2(object):
            setting: value of the control setting
            nindex:  index of controlling node
            level:   value of controlling water level or pressure for level controls 
-                    or of time of control action (in seconds) for time-based controls"""
+                    or of time of control action (in seconds) for time-based controls
+        The other arguments are ignored, they are kept for compatibility."""
         #int ENgetcontrol(int cindex, int* ctype, int* lindex, float* setting, int* nindex, float* level )
-        ierr= self._lib.EN_getcontrol(self.ph, ctypes.c_int(cindex), ctypes.c_int(ctype), 
-                                ctypes.c_int(lindex), ctypes.c_float(setting), 
-                                ctypes.c_int(nindex), ctypes.c_float(level) )
+        ctype, lindex, nindex = ctypes.c_int(), ctypes.c_int(), ctypes.c_int()
+        setting, level = ctypes.c_float(), ctypes.c_float()
+        ierr= self._lib.EN_getcontrol(self.ph, ctypes.c_int(cindex), ctypes.byref(ctype), 
+                                ctypes.byref(lindex), ctypes.byref(setting), 
+                                ctypes.byref(nindex), ctypes.byref(level) )
         if ierr!=0: raise ENtoolkitError(self, ierr)
+        return ctype.value, lindex.value, setting.value, nindex.value, level.value
 
 
     def ENgetoption(self, optioncode):
@@ -404,7 +438,7 @@ class EPANET2(object):
                     EN_TOLERANCE 
                     EN_EMITEXPON 
                     EN_DEMANDMULT""" 
-        j= ctypes.c_int()
+        j= ctypes.c_float()
         ierr= self._lib.EN_getoption(self.ph, optioncode, ctypes.byref(j))
         if ierr!=0: raise ENtoolkitError(self, ierr)
         return j.value
@@ -412,7 +446,7 @@ class EPANET2(object):
     def ENgetversion(self):
         """Retrieves the current version number of the Toolkit."""
         j= ctypes.c_int()
-        ierr= self._lib.EN_getversion(self.ph, ctypes.byref(j))
+        ierr= self._lib.EN_getversion(ctypes.byref(j))
         if ierr!=0: raise ENtoolkitError(self, ierr)
         return j.value
 
@@ -433,6 +467,8 @@ class EPANET2(object):
                     or of time of control action (in seconds) for time-based controls"""
         #int ENsetcontrol(int cindex, int* ctype, int* lindex, float* setting, int* nindex, float* level )
         cindex = ctypes.c_int()
+        if self.journal is not None:
+            self.journal.irreversible = True
         ierr= self._lib.EN_addcontrol(self.ph, ctypes.byref(cindex), ctypes.c_int(ctype),
                                 ctypes.c_int(lindex), ctypes.c_float(setting), 
                                 ctypes.c_int(nindex), ctypes.c_float(level))
@@ -453,6 +489,8 @@ class EPANET2(object):
            level:   value of controlling water level or pressure for level controls
                     or of time of control action (in seconds) for time-based controls"""
         #int ENsetcontrol(int cindex, int* ctype, int* lindex, float* setting, int* nindex, float* level )
+        if self.journal is not None:
+            self.journal.record(self, 'control', None, [cindex])
         ierr= self._lib.EN_setcontrol(self.ph, ctypes.c_int(cindex), ctypes.c_int(ctype),
                                 ctypes.c_int(lindex), ctypes.c_float(setting), 
                                 ctypes.c_int(nindex), ctypes.c_float(level) )
@@ -483,6 +521,8 @@ class EPANET2(object):
                       EN_MIXFRACTION   Fraction of total volume occupied by the inlet/outlet
                       EN_TANK_KBULK    Bulk reaction rate coefficient
         value:parameter value"""
+        if self.journal is not None:
+            self.journal.record(self, 'node', paramcode, [index])
         ierr= self._lib.EN_setnodevalue(self.ph, ctypes.c_int(index), ctypes.c_int(paramcode), ctypes.c_float(value))
         if ierr!=0: raise ENtoolkitError(self, ierr)
 
@@ -507,6 +547,8 @@ class EPANET2(object):
                        a simulation is being run (within the ENrunH - ENnextH loop).
 
         value:parameter value"""
+        if self.journal is not None:
+            self.journal.record(self, 'link', paramcode, [index])
         ierr= self._lib.EN_setlinkvalue(self.ph, ctypes.c_int(index), 
                                   ctypes.c_int(paramcode), 
                                   ctypes.c_float(value))
@@ -514,6 +556,94 @@ class EPANET2(object):
 
     # ---- EPYNET Extensions ---- #
 
+    def ENgetnodevalues(self, indices, paramcode):
+        """Retrieves the value of a node parameter for a sequence of nodes.
+
+        Arguments:
+        indices:   node indices
+        paramcode: node parameter code, see ENgetnodevalue
+        Returns a float array with one value per index"""
+        values = np.empty(len(indices))
+        j = ctypes.c_float()
+        ref = ctypes.byref(j)
+        getnodevalue = self._lib.EN_getnodevalue
+        for position, index in enumerate(np.asarray(indices).tolist()):
+            ierr = getnodevalue(self.ph, index, paramcode, ref)
+            if ierr!=0: raise ENtoolkitError(self, ierr)
+            values[position] = j.value
+        return values
+
+    def ENgetlinkvalues(self, indices, paramcode):
+        """Retrieves the value of a link parameter for a sequence of links.
+
+        Arguments:
+        indices:   link indices
+        paramcode: link parameter code, see ENgetlinkvalue
+        Returns a float array with one value per index"""
+        values = np.empty(len(indices))
+        j = ctypes.c_float()
+        ref = ctypes.byref(j)
+        getlinkvalue = self._lib.EN_getlinkvalue
+        for position, index in enumerate(np.asarray(indices).tolist()):
+            ierr = getlinkvalue(self.ph, index, paramcode, ref)
+            if ierr!=0: raise ENtoolkitError(self, ierr)
+            values[position] = j.value
+        return values
+
+    def ENgetpattern(self, index):
+        """Retrieves all multiplier factors of a time pattern.
+
+        Arguments:
+        index: time pattern index
+        Returns a float array with one factor per period"""
+        values = np.empty(self.ENgetpatternlen(index))
+        j = ctypes.c_float()
+        ref = ctypes.byref(j)
+        getpatternvalue = self._lib.EN_getpatternvalue
+        for period in range(len(values)):
+            ierr = getpatternvalue(self.ph, index, period + 1, ref)
+            if ierr!=0: raise ENtoolkitError(self, ierr)
+            values[period] = j.value
+        return values
+
+    def ENgetcurvepoints(self, index):
+        """Retrieves all points of a data curve.
+
+        Arguments:
+        index: curve index
+        Returns an (n, 2) float array of x and y values"""
+        length = self.ENgetcurvelen(index)
+        curveid = ctypes.create_string_buffer(self._max_label_len)
+        count = ctypes.c_int()
+        xValues = (ctypes.c_float*max(length, 1))()
+        yValues = (ctypes.c_float*max(length, 1))()
+        ierr = self._lib.EN_getcurve(self.ph, index, ctypes.byref(curveid), ctypes.byref(count), xValues, yValues)
+        if ierr!=0: raise ENtoolkitError(self, ierr)
+        points = np.empty((count.value, 2))
+        points[:, 0] = xValues[:count.value]
+        points[:, 1] = yValues[:count.value]
+        return points
+
+    def ENgetcurvetype(self, index):
+        """Retrieves the type of a data curve (EN_VOLUME_CURVE, EN_PUMP_CURVE, ...).
+
+        Arguments:
+        index: curve index"""
+        j = ctypes.c_int()
+        ierr = self._lib.EN_getcurvetype(self.ph, ctypes.c_int(index), ctypes.byref(j))
+        if ierr!=0: raise ENtoolkitError(self, ierr)
+        return j.value
+
+    def ENgetpumptype(self, index):
+        """Retrieves the type of head curve of a pump (EN_CONST_HP, EN_POWER_FUNC, EN_CUSTOM, EN_NOCURVE).
+
+        Arguments:
+        index: link index of the pump"""
+        j = ctypes.c_int()
+        ierr = self._lib.EN_getpumptype(self.ph, ctypes.c_int(index), ctypes.byref(j))
+        if ierr!=0: raise ENtoolkitError(self, ierr)
+        return j.value
+
     def ENinit(self, rptfile, binfile, units_code, headloss_code):
         ierr = self._lib.EN_init(self.ph, ctypes.c_char_p(rptfile), ctypes.c_char_p(binfile), ctypes.c_int(units_code), ctypes.c_int(headloss_code))
         if ierr!=0: raise ENtoolkitError(self, ierr)
@@ -521,16 +651,26 @@ class EPANET2(object):
     def ENaddnode(self, node_id, node_type_code):
         index = ctypes.c_int()
 
+        if self.journal is not None:
+            self.journal.irreversible = True
+        if node_type_code == EN_JUNCTION and self.ENgetcount(EN_TANKCOUNT):
+            # the library gives the first reservoir or tank the demands of a junction
+            # inserted before it, freeing the project then frees them twice
+            self.deletable = False
         ierr= self._lib.EN_addnode(self.ph, ctypes.c_char_p(node_id.encode(self.charset)), ctypes.c_int(node_type_code), ctypes.byref(index))
         if ierr!=0: raise ENtoolkitError(self, ierr)
 
         return index
 
     def ENdeletenode(self, node_index, conditional=0):
+        if self.journal is not None:
+            self.journal.irreversible = True
         ierr= self._lib.EN_deletenode(self.ph, ctypes.c_int(node_index), ctypes.c_int(conditional))
         if ierr!=0: raise ENtoolkitError(self, ierr)
 
     def ENdeletelink(self, link_index, conditional=0):
+        if self.journal is not None:
+            self.journal.irreversible = True
         ierr= self._lib.EN_deletelink(self.ph, ctypes.c_int(link_index), ctypes.c_int(conditional))
         if ierr!=0: raise ENtoolkitError(self, ierr)
 
@@ -538,10 +678,14 @@ class EPANET2(object):
 
         index = ctypes.c_int()
 
+        if self.journal is not None:
+            self.journal.irreversible = True
         ierr= self._lib.EN_addlink(self.ph, ctypes.c_char_p(link_id.encode(self.charset)), ctypes.c_int(link_type_code), ctypes.c_char_p(from_node_id.encode(self.charset)), ctypes.c_char_p(to_node_id.encode(self.charset)), ctypes.byref(index))
         if ierr!=0: raise ENtoolkitError(self, ierr)
 
     def ENsetheadcurveindex(self, pump_index, curve_index):
+        if self.journal is not None:
+            self.journal.record(self, 'headcurve', None, [pump_index])
         ierr = self._lib.EN_setheadcurveindex(self.ph, ctypes.c_int(pump_index), ctypes.c_int(curve_index))
         if ierr!=0: raise ENtoolkitError(self, ierr)
 
@@ -552,14 +696,93 @@ class EPANET2(object):
         return j.value
 
     def ENaddcurve(self, curve_id):
+        if self.journal is not None:
+            self.journal.irreversible = True
         ierr = self._lib.EN_addcurve(self.ph, ctypes.c_char_p(curve_id.encode(self.charset)))
         if ierr!=0: raise ENtoolkitError(self, ierr)
 
     def ENsetcurvevalue(self, curve_index,point_index, x ,y):
+        if self.journal is not None:
+            self.journal.record(self, 'curve', None, [curve_index])
         ierr = self._lib.EN_setcurvevalue(self.ph, ctypes.c_int(curve_index), ctypes.c_int(point_index), ctypes.c_float(x), ctypes.c_float(y))
         if ierr!=0: raise ENtoolkitError(self, ierr)
 
+    def ENgetcoords(self, indices):
+        """Retrieves the coordinates of a sequence of nodes as an (n, 2) float array.
+
+        Arguments:
+        indices: node indices"""
+        coordinates = np.empty((len(indices), 2))
+        x = ctypes.c_float()
+        y = ctypes.c_float()
+        xref = ctypes.byref(x)
+        yref = ctypes.byref(y)
+        getcoord = self._lib.EN_getcoord
+        for position, index in enumerate(np.asarray(indices).tolist()):
+            ierr = getcoord(self.ph, index, xref, yref)
+            if ierr!=0: raise ENtoolkitError(self, ierr)
+            coordinates[position, 0] = x.value
+            coordinates[position, 1] = y.value
+        return coordinates
+
+    def ENsetnodevalues(self, indices, paramcode, values):
+        """Sets the value of a node parameter for a sequence of nodes.
+
+        Arguments:
+        indices:   node indices
+        paramcode: node parameter code, see ENsetnodevalue
+        values:    one value per index"""
+        if self.journal is not None:
+            self.journal.record(self, 'node', paramcode, np.asarray(indices).tolist())
+        setnodevalue = self._lib.EN_setnodevalue
+        for index, value in zip(np.asarray(indices).tolist(), np.asarray(values, dtype=float).tolist()):
+            ierr = setnodevalue(self.ph, index, paramcode, ctypes.c_float(value))
+            if ierr!=0: raise ENtoolkitError(self, ierr)
+
+    def ENsetlinkvalues(self, indices, paramcode, values):
+        """Sets the value of a link parameter for a sequence of links.
+
+        Arguments:
+        indices:   link indices
+        paramcode: link parameter code, see ENsetlinkvalue
+        values:    one value per index"""
+        if self.journal is not None:
+            self.journal.record(self, 'link', paramcode, np.asarray(indices).tolist())
+        setlinkvalue = self._lib.EN_setlinkvalue
+        for index, value in zip(np.asarray(indices).tolist(), np.asarray(values, dtype=float).tolist()):
+            ierr = setlinkvalue(self.ph, index, paramcode, ctypes.c_float(value))
+            if ierr!=0: raise ENtoolkitError(self, ierr)
+
+    def ENadddemand(self, index, base_demand, pattern_id='', demand_name=''):
+        """Appends a demand category to a junction, without pattern the demand is constant."""
+        if self.journal is not None:
+            self.journal.irreversible = True
+        ierr = self._lib.EN_adddemand(self.ph, ctypes.c_int(index), ctypes.c_float(base_demand),
+                                      ctypes.c_char_p(pattern_id.encode(self.charset)),
+                                      ctypes.c_char_p(demand_name.encode(self.charset)))
+        if ierr!=0: raise ENtoolkitError(self, ierr)
+
+    def ENdeletedemand(self, index, demand_index):
+        if self.journal is not None:
+            self.journal.irreversible = True
+        ierr = self._lib.EN_deletedemand(self.ph, ctypes.c_int(index), ctypes.c_int(demand_index))
+        if ierr!=0: raise ENtoolkitError(self, ierr)
+
+    def ENgetnumdemands(self, index):
+        j= ctypes.c_int()
+        ierr = self._lib.EN_getnumdemands(self.ph, ctypes.c_int(index), ctypes.byref(j))
+        if ierr!=0: raise ENtoolkitError(self, ierr)
+        return j.value
+
+    def ENsetbasedemand(self, index, demand_index, base_demand):
+        if self.journal is not None:
+            self.journal.irreversible = True
+        ierr = self._lib.EN_setbasedemand(self.ph, ctypes.c_int(index), ctypes.c_int(demand_index), ctypes.c_float(base_demand))
+        if ierr!=0: raise ENtoolkitError(self, ierr)
+
     def ENsetcoord(self, index, x, y):
+        if self.journal is not None:
+            self.journal.irreversible = True
         ierr= self._lib.EN_setcoord(self.ph, ctypes.c_int(index), 
                              ctypes.c_float(x),
                              ctypes.c_float(y))
@@ -569,6 +792,8 @@ class EPANET2(object):
         """Adds a new time pattern to the network.
         Arguments:
           id: ID label of pattern"""
+        if self.journal is not None:
+            self.journal.irreversible = True
         ierr= self._lib.EN_addpattern(self.ph, ctypes.c_char_p(patternid.encode(self.charset)))
         if ierr!=0: raise ENtoolkitError(self, ierr)
 
@@ -584,6 +809,8 @@ class EPANET2(object):
         cfactors= cfactors_type()
         for i in range(nfactors):
            cfactors[i]= float(factors[i] )
+        if self.journal is not None:
+            self.journal.record(self, 'pattern', None, [index])
         ierr= self._lib.EN_setpattern(self.ph, ctypes.c_int(index), cfactors, ctypes.c_int(nfactors) )
         if ierr!=0: raise ENtoolkitError(self, ierr)
 
@@ -595,6 +822,8 @@ class EPANET2(object):
            period: period within time pattern
            value:  multiplier factor for the period"""
         #int ENsetpatternvalue( int index, int period, float value )
+        if self.journal is not None:
+            self.journal.record(self, 'pattern', None, [index])
         ierr= self._lib.EN_setpatternvalue(self.ph,  ctypes.c_int(index), 
                                       ctypes.c_int(period), 
                                       ctypes.c_float(value) )
@@ -609,6 +838,8 @@ class EPANET2(object):
              chemname:	name of the chemical being analyzed
              chemunits:	units that the chemical is measured in
              tracenode:	ID of node traced in a source tracing analysis """
+        if self.journal is not None:
+            self.journal.record(self, 'quality', None, [0])
         ierr= self._lib.EN_setqualtype(self.ph,  ctypes.c_int(qualcode),
                                   ctypes.c_char_p(chemname.encode(self.charset)),
                                   ctypes.c_char_p(chemunits.encode(self.charset)),
@@ -636,6 +867,8 @@ class EPANET2(object):
                           EN_MINIMUM  minimums
                           EN_MAXIMUM  maximums
                           EN_RANGE    ranges"""
+        if self.journal is not None:
+            self.journal.record(self, 'time', paramcode, [0])
         ierr= self._lib.EN_settimeparam(self.ph, ctypes.c_int(paramcode), ctypes.c_int(timevalue))
         if ierr!=0: raise ENtoolkitError(self, ierr)
 
@@ -650,7 +883,9 @@ class EPANET2(object):
                                   EN_EMITEXPON 
                                   EN_DEMANDMULT
           value:  option value"""
-        ierr= self._lib.EN_setoption(self.ph, ctypes.c_int(paramcode), ctypes.c_float(value))
+        if self.journal is not None:
+            self.journal.record(self, 'option', optioncode, [0])
+        ierr= self._lib.EN_setoption(self.ph, ctypes.c_int(optioncode), ctypes.c_float(value))
         if ierr!=0: raise ENtoolkitError(self, ierr)
 
 
@@ -672,7 +907,11 @@ class EPANET2(object):
         """Runs a complete hydraulic simulation with results 
         for all time periods written to the binary Hydraulics file."""
         ierr= self._lib.EN_solveH(self.ph, )
-        if ierr!=0: raise ENtoolkitError(self, ierr)
+        if ierr>=100: 
+          raise ENtoolkitError(self, ierr)
+        elif ierr>0:
+          warnings.warn(self.ENgeterror(ierr))
+          return self.ENgeterror(ierr)
 
 
     def ENopenH(self): 
@@ -701,7 +940,11 @@ class EPANET2(object):
           return self.ENgeterror(ierr)
 
     def ENabort(self):
+        """Aborts a running solve, returns False when the toolkit library does not support it"""
+        if not hasattr(self._lib, 'EN_abort'):
+            return False
         self._lib.EN_abort(self.ph, )
+        return True
 
     def ENsimtime(self):
         """retrieves the current simulation time t as datetime.timedelta instance"""
@@ -728,7 +971,11 @@ class EPANET2(object):
         """Runs a complete water quality simulation with results 
         at uniform reporting intervals written to EPANET's binary Output file."""
         ierr= self._lib.EN_solveQ(self.ph, )
-        if ierr!=0: raise ENtoolkitError(self, ierr)
+        if ierr>=100: 
+          raise ENtoolkitError(self, ierr)
+        elif ierr>0:
+          warnings.warn(self.ENgeterror(ierr))
+          return self.ENgeterror(ierr)
 
 
     def ENopenQ(self):
@@ -767,7 +1014,7 @@ class EPANET2(object):
         """Advances the water quality simulation one water quality time step. 
         The time remaining in the overall simulation is returned in tleft."""
         tleft= ctypes.c_long()
-        ierr= self._lib.EN_nextQ(self.ph, ctypes.byref(tleft))
+        ierr= self._lib.EN_stepQ(self.ph, ctypes.byref(tleft))
         if ierr!=0: raise ENtoolkitError(self, ierr)
         return tleft.value
 
@@ -845,23 +1092,7 @@ class EPANET2(object):
           
           
     def ENgetcurve(self, curveIndex):
-        curveid = ctypes.create_string_buffer(self._max_label_len)
-        nValues = ctypes.c_int()
-        xValues= (ctypes.c_float*100)()
-        yValues= (ctypes.c_float*100)()
-        ierr= self._lib.EN_getcurve(self.ph, curveIndex,
-                              ctypes.byref(curveid),
-                             ctypes.byref(nValues),
-                             xValues,
-                             yValues
-                             )
-        # strange behavior of ENgetcurve: it returns also curveID
-        # better split in two distinct functions ....
-        if ierr!=0: raise ENtoolkitError(self, ierr)
-        curve= []
-        for i in range(nValues.value):
-           curve.append( (xValues[i],yValues[i]) )
-        return curve
+        return [tuple(point) for point in self.ENgetcurvepoints(curveIndex).tolist()]
 
     def ENsetcurve(self, curveIndex, values):
         nValues = len(values)
@@ -872,24 +1103,15 @@ class EPANET2(object):
             xValues[i] = float(values[i][0])
             yValues[i] = float(values[i][1])
 
+        if self.journal is not None:
+            self.journal.record(self, 'curve', None, [curveIndex])
         ierr = self._lib.EN_setcurve(self.ph, curveIndex, xValues, yValues, nValues)
         if ierr!=0: raise ENtoolkitError(self, ierr)
     
 
     def ENgetcurveid(self, curveIndex):
         curveid = ctypes.create_string_buffer(self._max_label_len)
-        nValues = ctypes.c_int()
-
-        xValues= (ctypes.c_float * 100)()
-        yValues= (ctypes.c_float * 100)()
-
-        ierr= self._lib.EN_getcurve(self.ph, curveIndex,
-                              ctypes.byref(curveid),
-                              ctypes.byref(nValues),
-                              xValues,
-                              yValues)
-        # strange behavior of ENgetcurve: it returns also curveID
-        # better split in two distinct functions ....
+        ierr= self._lib.EN_getcurveid(self.ph, curveIndex, ctypes.byref(curveid))
         if ierr!=0: raise ENtoolkitError(self, ierr)
         return curveid.value.decode(self.charset)
 
@@ -953,6 +1175,8 @@ EN_HEADLOSS      = 10
 EN_STATUS        = 11
 EN_SETTING       = 12
 EN_ENERGY        = 13
+EN_LINKQUAL      = 14
+EN_LINKPATTERN   = 15
 
 EN_DURATION      = 0      # /* Time parameters */
 EN_HYDSTEP       = 1
@@ -986,6 +1210,17 @@ EN_FCV           = 6
 EN_TCV           = 7
 EN_GPV           = 8
 
+EN_CONST_HP      = 0      # /* Pump curve types */
+EN_POWER_FUNC    = 1
+EN_CUSTOM        = 2
+EN_NOCURVE       = 3
+
+EN_VOLUME_CURVE  = 0      # /* Data curve types */
+EN_PUMP_CURVE    = 1
+EN_EFFIC_CURVE   = 2
+EN_HLOSS_CURVE   = 3
+EN_GENERIC_CURVE = 4
+
 EN_NONE          = 0      # /* Quality analysis types */
 EN_CHEM          = 1
 EN_AGE           = 2
@@ -0,0 +1,163 @@
+""" EPYNET fire flow capacity analysis """
+import math
+
+import numpy as np
+import pandas as pd
+
+from . import epanet2
+from .node import Junction
+from .parallel import parallel_map
+
+COLUMNS = ['capacity', 'residual_pressure', 'limiting_node', 'solves']
+
+
+def _constraints(network, min_pressure, residual_constraints):
+    """ Toolkit indices and minimum pressures of the constrained nodes """
+    thresholds = {}
+    if min_pressure is not None:
+        for node in network.topology.nodes:
+            if isinstance(node, Junction):
+                thresholds[node.uid] = min_pressure
+    if residual_constraints is not None:
+        thresholds.update(residual_constraints)
+
+    uids = list(thresholds.keys())
+    indices = np.array([network.ep.ENgetnodeindex(uid) for uid in uids], dtype=np.int64)
+    return indices, np.array([thresholds[uid] for uid in uids], dtype=float)
+
+
+def _search(margin, baseline, max_flow, tolerance, max_solves, guess):
+    """ Find the largest flow with a non-negative pressure margin
+
+    Pressure drops roughly with the square of the flow, so the search
+    interpolates in flow squared: first towards the root predicted from
+    the baseline margin, then by false position inside the bracket. """
+    low, low_margin = 0.0, baseline
+    high, high_margin = None, None
+    flow = min(guess, max_flow)
+
+    for _ in range(max_solves):
+        value = margin(flow)
+        if value >= 0:
+            low, low_margin = flow, value
+        else:
+            high, high_margin = flow, value
+
+        if high is None:
+            if low >= max_flow:
+                break
+            slope = (low_margin - baseline) / (low * low) if low > 0 else 0
+            if slope < 0:
+                flow = math.sqrt(-baseline / slope) * (1 + tolerance)
+            else:
+                flow = 4 * low
+            flow = min(max(flow, 1.1 * low), max_flow)
+        else:
+            if high - low <= tolerance * high:
+                break
+            low_square, high_square = low * low, high * high
+            square = low_square + low_margin * (high_square - low_square) / (low_margin - high_margin)
+            # stay away from the ends of the bracket so it keeps shrinking
+            flow = min(max(math.sqrt(square), low + 0.05 * (high - low)), high - 0.05 * (high - low))
+
+    return low
+
+
+class _Margin(object):
+    """ Pressure margin of the constrained nodes for an extra demand at one node """
+
+    def __init__(self, network, index, category, simtime, indices, thresholds):
+        self.network = network
+        self.index = index
+        self.category = category
+        self.simtime = simtime
+        self.indices = indices
+        self.thresholds = thresholds
+        self.solves = 0
+        self.best = (0.0, np.nan, -1)
+
+    def __call__(self, flow):
+        ep = self.network.ep
+        ep.ENsetbasedemand(self.index, self.category, flow)
+        self.solves += 1
+        try:
+            self.network.solve_hydraulics(self.simtime, warm=True)
+        except epanet2.ENtoolkitError:
+            return -np.inf
+
+        margins = ep.ENgetnodevalues(self.indices, epanet2.EN_PRESSURE) - self.thresholds
+        limiting = int(np.argmin(margins)) if len(margins) else -1
+        value = margins[limiting] if len(margins) else np.inf
+
+        if value >= 0 and flow >= self.best[0]:
+            self.best = (flow, ep.ENgetnodevalue(self.index, epanet2.EN_PRESSURE), limiting)
+        return value
+
+
+def _node_capacities(network, uids, simtime, min_pressure, residual_constraints,
+                     max_flow, tolerance, max_solves):
+    """ Search the fire flow capacity of every node in turn """
+    ep = network.ep
+    indices, thresholds = _constraints(network, min_pressure, residual_constraints)
+
+    # nodes that are below their minimum pressure without fire flow do not constrain it
+    network.solve_hydraulics(simtime, warm=True)
+    margins = ep.ENgetnodevalues(indices, epanet2.EN_PRESSURE) - thresholds
+    indices, thresholds = indices[margins >= 0], thresholds[margins >= 0]
+    baseline = margins[margins >= 0].min() if len(indices) else np.inf
+
+    rows = []
+    guess = max_flow / 4.0
+    for uid in uids:
+        index = ep.ENgetnodeindex(uid)
+        ep.ENadddemand(index, 0, '', 'fireflow')
+        category = ep.ENgetnumdemands(index)
+        margin = _Margin(network, index, category, simtime, indices, thresholds)
+        try:
+            capacity = _search(margin, baseline, max_flow, tolerance, max_solves, guess)
+        finally:
+            ep.ENdeletedemand(index, category)
+
+        _, residual, limiting = margin.best
+        rows.append((uid, capacity, residual,
+                     ep.ENgetnodeid(int(indices[limiting])) if limiting >= 0 and capacity < max_flow else None,
+                     margin.solves))
+        # neighbouring hydrants tend to have similar capacities
+        if capacity > 0:
+            guess = capacity
+    return rows
+
+
+def fire_flow(network, nodes, min_pressure=None, residual_constraints=None, simtime=0,
+              max_flow=1000, tolerance=0.01, max_solves=20, workers=1, chunksize=16):
+    """ Maximum extra demand every node can supply while pressures stay above a threshold
+
+    nodes:                node uids or nodes to evaluate, ideally sorted so
+                          that neighbours follow each other
+    min_pressure:         minimum pressure for all junctions
+    residual_constraints: dict or Series of minimum pressures per node uid,
+                          overriding min_pressure
+    max_flow:             upper bound of the search, in network flow units
+    tolerance:            relative accuracy of the capacity
+
+    Constraints that are already violated without fire flow are ignored.
+    The extra demand is added as a separate, unpatterned demand category.
+    Returns a DataFrame indexed by node uid with the capacity, the pressure
+    at the node at that capacity, the node whose pressure limits the
+    capacity and the number of solves used.
+    """
+    uids = [node if isinstance(node, str) else node.uid for node in nodes]
+    if isinstance(residual_constraints, pd.Series):
+        residual_constraints = residual_constraints.to_dict()
+
+    tasks = [(uids[start:start+chunksize], simtime, min_pressure, residual_constraints,
+              max_flow, tolerance, max_solves) for start in range(0, len(uids), chunksize)]
+    rows = []
+    try:
+        for chunk in parallel_map(network, _node_capacities, tasks, workers):
+            rows.extend(chunk)
+    finally:
+        network.close_hydraulics()
+        network.reset()
+
+    return pd.DataFrame([row[1:] for row in rows], index=[row[0] for row in rows], columns=COLUMNS)
@@ -0,0 +1,161 @@
+""" EPYNET geometry export
+
+Geometry is built in bulk: node coordinates as an (n, 2) array and link
+paths as one flat coordinate array with offsets, the layout used by
+GeoArrow. Both can be converted to WKB and written, together with
+property columns, to GeoJSON or GeoParquet.
+"""
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+
+
+def node_coordinates(nodes):
+    """ return the coordinates of a collection of nodes as an (n, 2) array """
+    nodes = list(nodes)
+    if not nodes:
+        return np.empty((0, 2))
+    network = nodes[0].network()
+    return network.ep.ENgetcoords([node.index for node in nodes])
+
+
+def link_geometry(links):
+    """ return the paths of a collection of links as flat coordinates and offsets
+
+    The path of the i-th link runs from its start node through its
+    vertices to its end node, and is coordinates[offsets[i]:offsets[i+1]]. """
+    links = list(links)
+    if not links:
+        return np.empty((0, 2)), np.zeros(1, dtype=np.int64)
+
+    network = links[0].network()
+    topology = network.topology
+    if not network.vertices_loaded:
+        network.parse_vertices()
+
+    positions = np.array([topology.link_positions[link.uid] for link in links], dtype=np.int64)
+    nodes = network.ep.ENgetcoords(topology.node_indices)
+
+    vertices = [network.vertices.get(link.uid, ()) for link in links]
+    counts = np.array([len(points) for points in vertices], dtype=np.int64)
+    offsets = np.zeros(len(links) + 1, dtype=np.int64)
+    np.cumsum(counts + 2, out=offsets[1:])
+
+    coordinates = np.empty((offsets[-1], 2))
+    coordinates[offsets[:-1]] = nodes[topology.from_nodes[positions]]
+    coordinates[offsets[1:] - 1] = nodes[topology.to_nodes[positions]]
+
+    if counts.sum() > 0:
+        points = np.array([point for link_points in vertices for point in link_points], dtype=float)
+        # every vertex goes after the start node of its link
+        owners = np.repeat(np.arange(len(links)), counts)
+        ranks = np.arange(len(points)) - np.repeat(np.cumsum(counts) - counts, counts)
+        coordinates[offsets[owners] + 1 + ranks] = points
+
+    return coordinates, offsets
+
+
+def point_wkb(coordinates):
+    """ return a list of WKB points """
+    header = struct.pack('<BI', 1, 1)
+    return [header + point.tobytes() for point in np.ascontiguousarray(coordinates, dtype='<f8')]
+
+
+def linestring_wkb(coordinates, offsets):
+    """ return a list of WKB linestrings """
+    coordinates = np.ascontiguousarray(coordinates, dtype='<f8')
+    return [struct.pack('<BII', 1, 2, end - start) + coordinates[start:end].tobytes()
+            for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+def _columns(objects, columns):
+    """ return a DataFrame of property columns indexed by uid """
+    uids = [item.uid for item in objects]
+    if columns is None:
+        return pd.DataFrame(index=uids)
+    if isinstance(columns, pd.DataFrame):
+        return columns.reindex(uids)
+    if isinstance(columns, dict):
+        return pd.DataFrame(dict((name, pd.Series(values).reindex(uids)) for name, values in columns.items()),
+                            index=uids, columns=list(columns.keys()))
+    return pd.DataFrame(dict((name, getattr(objects, name).reindex(uids)) for name in columns),
+                        index=uids, columns=list(columns))
+
+
+def _is_nodes(objects):
+    # links are the objects with a start node
+    return len(objects) > 0 and not hasattr(next(iter(objects)), 'from_node')
+
+
+def _json_value(value):
+    if isinstance(value, (np.integer,)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else float(value)
+    return value
+
+
+def write_geojson(objects, path, columns=None):
+    """ Write a collection of nodes or links to a GeoJSON file
+
+    columns: list of property names of the collection (e.g. ['pressure']),
+             a dict of Series or a DataFrame indexed by uid
+    Features are written one at a time. """
+    table = _columns(objects, columns)
+    if _is_nodes(objects):
+        coordinates = node_coordinates(objects)
+        geometries = ({'type': 'Point', 'coordinates': point} for point in coordinates.tolist())
+    else:
+        coordinates, offsets = link_geometry(objects)
+        points = coordinates.tolist()
+        geometries = ({'type': 'LineString', 'coordinates': points[start:end]}
+                      for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist()))
+
+    names = list(table.columns)
+    with open(path, 'w') as handle:
+        handle.write('{"type": "FeatureCollection", "features": [\n')
+        for position, (uid, geometry) in enumerate(zip(table.index, geometries)):
+            properties = {'uid': uid}
+            for name, value in zip(names, table.iloc[position].tolist()):
+                properties[name] = _json_value(value)
+            if position > 0:
+                handle.write(',\n')
+            handle.write(json.dumps({'type': 'Feature', 'geometry': geometry, 'properties': properties}))
+        handle.write('\n]}\n')
+
+
+def write_geoparquet(objects, path, columns=None, batch=65536):
+    """ Write a collection of nodes or links to a GeoParquet file with WKB geometries
+
+    Requires pyarrow. Rows are written in batches of the given size. """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Writing GeoParquet requires pyarrow")
+
+    table = _columns(objects, columns)
+    if _is_nodes(objects):
+        geometries = point_wkb(node_coordinates(objects))
+        geometry_type = 'Point'
+    else:
+        geometries = linestring_wkb(*link_geometry(objects))
+        geometry_type = 'LineString'
+
+    metadata = {'version': '1.0.0', 'primary_column': 'geometry',
+                'columns': {'geometry': {'encoding': 'WKB', 'geometry_types': [geometry_type]}}}
+    fields = [pa.field('uid', pa.string())]
+    fields += [pa.field(str(name), pa.Schema.from_pandas(table[[name]], preserve_index=False).field(0).type)
+               for name in table.columns]
+    fields.append(pa.field('geometry', pa.binary()))
+    schema = pa.schema(fields, metadata={b'geo': json.dumps(metadata).encode()})
+
+    with pq.ParquetWriter(path, schema) as writer:
+        for start in range(0, len(table), batch):
+            chunk = table.iloc[start:start+batch]
+            arrays = [pa.array(list(chunk.index), pa.string())]
+            arrays += [pa.array(chunk[name].values, schema.field(str(name)).type) for name in table.columns]
+            arrays.append(pa.array(geometries[start:start+batch], pa.binary()))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
@@ -0,0 +1,178 @@
+""" EPYNET network topology """
+import numpy as np
+
+
+class Topology(object):
+    """ Connectivity of a network as integer arrays
+
+    Nodes and links are numbered by their position in the node and link
+    collections of the network at the time the topology was built. The
+    network rebuilds its topology after nodes or links are added or deleted.
+    """
+
+    def __init__(self, network):
+
+        self.nodes = list(network.nodes)
+        self.links = list(network.links)
+
+        self.node_uids = np.array([node.uid for node in self.nodes], dtype=object)
+        self.link_uids = np.array([link.uid for link in self.links], dtype=object)
+
+        self.node_positions = dict((uid, position) for position, uid in enumerate(self.node_uids))
+        self.link_positions = dict((uid, position) for position, uid in enumerate(self.link_uids))
+
+        self.from_nodes = np.array([self.node_positions[link.from_node.uid] for link in self.links], dtype=np.int64)
+        self.to_nodes = np.array([self.node_positions[link.to_node.uid] for link in self.links], dtype=np.int64)
+
+        self._node_indices = None
+        self._link_indices = None
+
+    @property
+    def node_count(self):
+        return len(self.nodes)
+
+    @property
+    def link_count(self):
+        return len(self.links)
+
+    @property
+    def node_indices(self):
+        """ EPANET toolkit index of every node """
+        if self._node_indices is None:
+            self._node_indices = np.array([node.index for node in self.nodes], dtype=np.int64)
+        return self._node_indices
+
+    @property
+    def link_indices(self):
+        """ EPANET toolkit index of every link """
+        if self._link_indices is None:
+            self._link_indices = np.array([link.index for link in self.links], dtype=np.int64)
+        return self._link_indices
+
+
+def connected_components(count, sources, targets):
+    """ Label the connected components of an undirected graph
+
+    Vertices are numbered 0..count-1 and edges are given as two arrays of
+    vertex numbers. Returns an array with a component number per vertex,
+    numbered consecutively from 0 in order of first appearance.
+    """
+    parent = list(range(count))
+
+    def find(vertex):
+        root = vertex
+        while parent[root] != root:
+            root = parent[root]
+        # path compression
+        while parent[vertex] != root:
+            parent[vertex], vertex = root, parent[vertex]
+        return root
+
+    for source, target in zip(np.asarray(sources).tolist(), np.asarray(targets).tolist()):
+        source_root = find(source)
+        target_root = find(target)
+        if source_root != target_root:
+            parent[target_root] = source_root
+
+    roots = np.array([find(vertex) for vertex in range(count)], dtype=np.int64)
+    # renumber roots by order of first appearance
+    _, first, inverse = np.unique(roots, return_index=True, return_inverse=True)
+    order = np.argsort(np.argsort(first))
+    return order[inverse]
+
+
+class DepthFirstForest(object):
+    """ Depth first search forest of an undirected multigraph
+
+    Besides the forest itself (parent vertex, parent edge, preorder and the
+    root of every vertex) this records the bridges of the graph: the edges
+    whose removal disconnects their component. Removing a bridge cuts off
+    the subtree below it, see subtree_totals.
+    """
+
+    def __init__(self, count, sources, targets):
+
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        edge_count = len(sources)
+
+        # adjacency lists in compressed sparse row form
+        ends = np.concatenate([sources, targets])
+        neighbours = np.concatenate([targets, sources])
+        edges = np.concatenate([np.arange(edge_count), np.arange(edge_count)])
+        order = np.argsort(ends, kind='stable')
+        offsets = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(ends, minlength=count), out=offsets[1:])
+        neighbours = neighbours[order].tolist()
+        edges = edges[order].tolist()
+        offsets = offsets.tolist()
+
+        discovery = [-1] * count
+        low = [0] * count
+        parent = [-1] * count
+        parent_edge = [-1] * count
+        root = [-1] * count
+        bridges = [False] * edge_count
+        pointer = list(offsets[:-1])
+        preorder = []
+        clock = 0
+
+        for start in range(count):
+            if discovery[start] != -1:
+                continue
+            discovery[start] = low[start] = clock
+            clock += 1
+            root[start] = start
+            preorder.append(start)
+            stack = [start]
+
+            while stack:
+                vertex = stack[-1]
+                if pointer[vertex] < offsets[vertex + 1]:
+                    position = pointer[vertex]
+                    pointer[vertex] += 1
+                    edge = edges[position]
+                    if edge == parent_edge[vertex]:
+                        continue
+                    neighbour = neighbours[position]
+                    if discovery[neighbour] == -1:
+                        parent[neighbour] = vertex
+                        parent_edge[neighbour] = edge
+                        root[neighbour] = start
+                        discovery[neighbour] = low[neighbour] = clock
+                        clock += 1
+                        preorder.append(neighbour)
+                        stack.append(neighbour)
+                    elif discovery[neighbour] < low[vertex]:
+                        low[vertex] = discovery[neighbour]
+                else:
+                    stack.pop()
+                    above = parent[vertex]
+                    if above != -1:
+                        if low[vertex] < low[above]:
+                            low[above] = low[vertex]
+                        if low[vertex] > discovery[above]:
+                            bridges[parent_edge[vertex]] = True
+
+        self.parent = np.array(parent, dtype=np.int64)
+        self.parent_edge = np.array(parent_edge, dtype=np.int64)
+        self.root = np.array(root, dtype=np.int64)
+        self.preorder = np.array(preorder, dtype=np.int64)
+        self.bridges = np.array(bridges, dtype=bool)
+
+        # the vertex below every tree edge, -1 for edges outside the forest
+        self.below = np.full(edge_count, -1, dtype=np.int64)
+        in_tree = self.parent_edge >= 0
+        self.below[self.parent_edge[in_tree]] = np.flatnonzero(in_tree)
+
+    def subtree_totals(self, values):
+        """ Sum vertex values over the subtree below every vertex
+
+        values has one row per vertex, roots hold the total of their
+        component. """
+        totals = np.array(values, dtype=float)
+        parent = self.parent.tolist()
+        for vertex in self.preorder[::-1].tolist():
+            if parent[vertex] != -1:
+                totals[parent[vertex]] += totals[vertex]
+        return totals
@@ -0,0 +1,122 @@
+""" EPYNET input file reader
+
+Reads the sections of an EPANET input file that the toolkit does not
+expose, such as vertices, tags, labels and the backdrop. The file is
+scanned once for the byte offsets of its sections, after which sections
+are parsed on demand. Indexes are cached by path, modification time and
+size, so opening the same file again does not scan it again.
+"""
+import mmap
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+SECTION = re.compile(br'^[ \t]*\[([^\]\r\n]*)\]', re.MULTILINE)
+
+# cache of indexes by absolute path
+_indexes = {}
+
+
+class InpIndex(object):
+    """ Byte offsets of the sections of an EPANET input file """
+
+    def __init__(self, path, charset='UTF8'):
+        self.path = path
+        self.charset = charset
+        stat = os.stat(path)
+        self.signature = (stat.st_mtime, stat.st_size)
+        self.sections = {}
+        self._parsed = {}
+
+        if stat.st_size == 0:
+            return
+
+        with open(path, 'rb') as handle:
+            data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                name = None
+                start = 0
+                for match in SECTION.finditer(data):
+                    if name is not None:
+                        self.sections.setdefault(name, []).append((start, match.start()))
+                    name = match.group(1).strip().upper().decode('ascii', 'replace')
+                    start = match.end()
+                if name is not None:
+                    self.sections.setdefault(name, []).append((start, len(data)))
+            finally:
+                data.close()
+
+    @classmethod
+    def open(cls, path, charset='UTF8'):
+        """ return the cached index of a file, scanning it when it is new or has changed """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        index = _indexes.get(path)
+        if index is None or index.signature != (stat.st_mtime, stat.st_size) or index.charset != charset:
+            index = cls(path, charset)
+            _indexes[path] = index
+        return index
+
+    def lines(self, section):
+        """ return the lines of a section without comments and empty lines """
+        lines = []
+        with open(self.path, 'rb') as handle:
+            for start, end in self.sections.get(section.upper(), []):
+                handle.seek(start)
+                text = handle.read(end - start).decode(self.charset)
+                for line in text.splitlines():
+                    line = line.split(';', 1)[0].strip()
+                    if line:
+                        lines.append(line)
+        return lines
+
+    def _points(self, section):
+        if section not in self._parsed:
+            uids = []
+            points = []
+            for line in self.lines(section):
+                components = line.split()
+                if len(components) < 3:
+                    continue
+                uids.append(components[0])
+                points.append((float(components[1]), float(components[2])))
+            self._parsed[section] = (np.array(uids, dtype=object),
+                                     np.array(points, dtype=float).reshape(-1, 2))
+        return self._parsed[section]
+
+    def vertices(self):
+        """ return the link uid of every vertex and an (n, 2) array of vertex coordinates, in file order """
+        return self._points('VERTICES')
+
+    def coordinates(self):
+        """ return the node uids and an (n, 2) array of node coordinates """
+        return self._points('COORDINATES')
+
+    def tags(self):
+        """ return a DataFrame with the object type, uid and tag of every tag """
+        rows = [line.split(None, 2) for line in self.lines('TAGS')]
+        rows = [row for row in rows if len(row) == 3]
+        return pd.DataFrame(rows, columns=['type', 'uid', 'tag'])
+
+    def labels(self):
+        """ return a DataFrame with the position, text and anchor node of every label """
+        rows = []
+        for line in self.lines('LABELS'):
+            match = re.match(r'(\S+)\s+(\S+)\s+"([^"]*)"\s*(\S*)', line)
+            if match:
+                rows.append((float(match.group(1)), float(match.group(2)), match.group(3), match.group(4) or None))
+        return pd.DataFrame(rows, columns=['x', 'y', 'label', 'anchor'])
+
+    def backdrop(self):
+        """ return the backdrop settings as a dict """
+        backdrop = {}
+        for line in self.lines('BACKDROP'):
+            components = line.split(None, 1)
+            key = components[0].upper()
+            value = components[1].strip() if len(components) > 1 else ''
+            if key in ('DIMENSIONS', 'OFFSET'):
+                value = tuple(float(component) for component in value.split())
+            backdrop[key] = value
+        return backdrop
@@ -0,0 +1,117 @@
+""" EPYNET change journals
+
+A journal attached to the toolkit wrapper (EPANET2.journal) records the
+original value of every piece of network data before it is changed, so
+the changes can be reverted or located without comparing the whole
+network. Changes to the structure of the network, such as adding or
+deleting nodes, links, patterns or curves, cannot be reverted and only
+mark the journal as irreversible.
+
+Example:
+    network.ep.journal = Journal()
+    network.pipes['P1'].diameter = 300
+    network.ep.journal.revert(network.ep)
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+from . import epanet2
+
+
+def _read(ep, kind, code, indices):
+    if kind == 'node':
+        try:
+            return ep.ENgetnodevalues(indices, code)
+        except epanet2.ENtoolkitError:
+            # source values of nodes without a source cannot be read
+            values = np.full(len(indices), np.nan)
+            for position, index in enumerate(indices):
+                try:
+                    values[position] = ep.ENgetnodevalue(index, code)
+                except epanet2.ENtoolkitError:
+                    pass
+            return values
+    if kind == 'link':
+        return ep.ENgetlinkvalues(indices, code)
+    if kind == 'pattern':
+        return [ep.ENgetpattern(index) for index in indices]
+    if kind == 'curve':
+        return [ep.ENgetcurvepoints(index) for index in indices]
+    if kind == 'headcurve':
+        return [ep.ENgetheadcurveindex(index) for index in indices]
+    if kind == 'control':
+        return [ep.ENgetcontrol(index) for index in indices]
+    if kind == 'quality':
+        return [ep.ENgetqualinfo()]
+    if kind == 'time':
+        return [ep.ENgettimeparam(code)]
+    return [ep.ENgetoption(code)]
+
+
+def _write(ep, kind, code, index, value):
+    if kind == 'node':
+        if np.isnan(value):
+            # a node without a source gets a source of strength zero
+            if code == epanet2.EN_SOURCEQUAL:
+                ep.ENsetnodevalue(index, code, 0)
+        else:
+            ep.ENsetnodevalue(index, code, value)
+    elif kind == 'link':
+        ep.ENsetlinkvalue(index, code, value)
+    elif kind == 'pattern':
+        ep.ENsetpattern(index, value)
+    elif kind == 'curve':
+        ep.ENsetcurve(index, value)
+    elif kind == 'headcurve':
+        ep.ENsetheadcurveindex(index, value)
+    elif kind == 'control':
+        ep.ENsetcontrol(index, *value)
+    elif kind == 'quality':
+        qualcode, chemname, chemunits, tracenode = value
+        ep.ENsetqualtype(qualcode, chemname, chemunits, ep.ENgetnodeid(tracenode) if tracenode else '')
+    elif kind == 'time':
+        ep.ENsettimeparam(code, value)
+    else:
+        ep.ENsetoption(code, value)
+
+
+class Journal(object):
+    """ Original values of the toolkit data changed since the journal was attached
+
+    The EPANET2 wrapper calls record() before every change while it has a
+    journal, and sets irreversible for changes that cannot be undone.
+    Entries are keyed by (kind, code, index), with kind one of node, link,
+    pattern, curve, headcurve, control, quality, time or option.
+    """
+
+    def __init__(self):
+        self.originals = OrderedDict()
+        self.irreversible = False
+
+    def __len__(self):
+        return len(self.originals)
+
+    def record(self, ep, kind, code, indices):
+        """ Keep the values of the data about to change, unless they were kept already """
+        originals = self.originals
+        new = [index for index in indices if (kind, code, index) not in originals]
+        if not new:
+            return
+        for index, value in zip(new, _read(ep, kind, code, new)):
+            originals[(kind, code, index)] = value
+
+    def revert(self, ep):
+        """ Write back the original values, the most recent change first """
+        journal = ep.journal
+        ep.journal = None
+        try:
+            for (kind, code, index), value in reversed(list(self.originals.items())):
+                _write(ep, kind, code, index, value)
+        finally:
+            ep.journal = journal
+        self.originals = OrderedDict()
+
+    @property
+    def kinds(self):
+        return set(key[0] for key in self.originals)
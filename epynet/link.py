@@ -26,6 +26,10 @@ class Link(BaseObject):
         index = self.get_index(self.uid)
         return self.network().ep.ENgetlinkvalue(index, code)
 
+    @staticmethod
+    def set_object_values(network, indices, code, values):
+        return network.ep.ENsetlinkvalues(indices, code, values)
+
     @property
     def comment(self):
         return self.network().ep.ENgetcomment(1, self.index) # get comment from LINK table
@@ -93,8 +97,8 @@ class Pump(Link):
     @property
     def curve(self):
         curve_index = self.network().ep.ENgetheadcurveindex(self.index)
-        curve_uid = self.network().ep.ENgetcurveid(curve_index)
-        return Curve(curve_uid, self.network())
+        curve_uid = self.network().curve_store.uid(curve_index)
+        return self.network().curves.get(curve_uid) or Curve(curve_uid, self.network())
 
     @curve.setter
     def curve(self, value):
@@ -103,7 +107,7 @@ class Pump(Link):
         if isinstance(value, int):
             curve_index = value
         elif isinstance(value, str):
-            curve_index = self.network().ep.ENgetcurveindex(value)
+            curve_index = self.network().curve_store.index(value)
         elif isinstance(value, Curve):
             curve_index = value.index
         else:
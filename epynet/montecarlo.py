@@ -0,0 +1,159 @@
+""" EPYNET Monte Carlo demand uncertainty analysis """
+import numpy as np
+import pandas as pd
+
+from . import epanet2
+from .node import Junction
+from .parallel import parallel_map, worker_count
+from .statistics import SampleStatistics
+
+NODE_PROPERTIES = {'head': epanet2.EN_HEAD, 'pressure': epanet2.EN_PRESSURE, 'demand': epanet2.EN_DEMAND}
+LINK_PROPERTIES = {'flow': epanet2.EN_FLOW, 'velocity': epanet2.EN_VELOCITY, 'headloss': epanet2.EN_HEADLOSS}
+
+
+class Lognormal(object):
+    """ Lognormal multipliers with mean 1 and coefficient of variation cv """
+
+    def __init__(self, cv=0.1):
+        self.cv = cv
+
+    def __call__(self, rng, size):
+        sigma = np.sqrt(np.log(1 + self.cv ** 2))
+        return rng.lognormal(-sigma ** 2 / 2, sigma, size)
+
+
+class Normal(object):
+    """ Normal multipliers with mean 1 and coefficient of variation cv, truncated at zero """
+
+    def __init__(self, cv=0.1):
+        self.cv = cv
+
+    def __call__(self, rng, size):
+        return np.maximum(rng.normal(1, self.cv, size), 0)
+
+
+def _sample(network, settings, batches, edges):
+    """ Solve the batches of samples and accumulate their statistics """
+    ep = network.ep
+    junctions = np.array([ep.ENgetnodeindex(uid) for uid in settings['junctions']], dtype=np.int64)
+    groups = settings['groups']
+    elements = {'nodes': np.array([ep.ENgetnodeindex(uid) for uid in settings['nodes']], dtype=np.int64),
+                'links': np.array([ep.ENgetlinkindex(uid) for uid in settings['links']], dtype=np.int64)}
+
+    statistics = {}
+    for name in settings['properties']:
+        kind = 'nodes' if name in NODE_PROPERTIES else 'links'
+        lower, upper = edges[name] if edges else (0, 1)
+        statistics[name] = SampleStatistics(settings[kind], lower, upper, settings['bins'])
+
+    base = ep.ENgetnodevalues(junctions, epanet2.EN_BASEDEMAND)
+    failures = 0
+    try:
+        for seed, size in batches:
+            multipliers = settings['sampler'](np.random.default_rng(seed), (size, groups.max() + 1))
+            values = dict((name, []) for name in statistics)
+            for sample in range(size):
+                ep.ENsetnodevalues(junctions, epanet2.EN_BASEDEMAND, base * multipliers[sample, groups])
+                try:
+                    network.solve_hydraulics(settings['simtime'], warm=True)
+                except epanet2.ENtoolkitError:
+                    failures += 1
+                    continue
+                for name in statistics:
+                    if name in NODE_PROPERTIES:
+                        values[name].append(ep.ENgetnodevalues(elements['nodes'], NODE_PROPERTIES[name]))
+                    else:
+                        values[name].append(ep.ENgetlinkvalues(elements['links'], LINK_PROPERTIES[name]))
+            for name in statistics:
+                if values[name]:
+                    statistics[name].update(np.array(values[name]))
+    finally:
+        ep.ENsetnodevalues(junctions, epanet2.EN_BASEDEMAND, base)
+
+    return statistics, failures
+
+
+class MonteCarlo(object):
+    """ Sample demand multipliers and accumulate statistics of the solutions
+
+    network:    the network to sample
+    groups:     dict or Series mapping junction uid to a demand group, all
+                junctions of a group share one multiplier per sample. By
+                default every junction is its own group
+    sampler:    callable(rng, size) returning an array of multipliers, by
+                default Lognormal(cv=0.1). Has to be defined at module level
+                when running on more than one worker
+    properties: node properties (head, pressure, demand) and link properties
+                (flow, velocity, headloss) to collect statistics for
+    nodes:      uids of the nodes to track, all junctions by default
+    links:      uids of the links to track, all pipes by default
+    seed:       seed of the random number generator, every batch of samples
+                gets its own child seed so results do not depend on the
+                number of workers
+
+    Only the statistics are kept, see statistics.SampleStatistics. The
+    histograms used for the quantiles are sized by a pilot run.
+    """
+
+    def __init__(self, network, groups=None, sampler=None, properties=('pressure',),
+                 nodes=None, links=None, simtime=0, seed=None, bins=64):
+
+        self.network = network
+        self.sampler = sampler if sampler is not None else Lognormal()
+        self.properties = list(properties)
+        self.simtime = simtime
+        self.seed = seed
+        self.bins = bins
+        self.failures = 0
+
+        for name in self.properties:
+            if name not in NODE_PROPERTIES and name not in LINK_PROPERTIES:
+                raise ValueError("Unknown property", name)
+
+        if groups is None:
+            junctions = list(network.junctions.keys())
+            codes = np.arange(len(junctions))
+        else:
+            groups = pd.Series(groups)
+            junctions = list(groups.index)
+            codes = pd.factorize(groups)[0]
+
+        self.nodes = list(nodes if nodes is not None else network.junctions.keys())
+        self.links = list(links if links is not None else network.pipes.keys())
+        self.settings = {'junctions': junctions, 'groups': codes, 'sampler': self.sampler,
+                         'nodes': [node if isinstance(node, str) else node.uid for node in self.nodes],
+                         'links': [link if isinstance(link, str) else link.uid for link in self.links],
+                         'properties': self.properties, 'simtime': simtime, 'bins': bins}
+
+    def run(self, samples, workers=1, batch=64, pilot=32):
+        """ Solve the given number of samples, returns a dict of SampleStatistics per property """
+        sizes = [min(batch, samples - start) for start in range(0, samples, batch)]
+        seeds = np.random.SeedSequence(self.seed).spawn(len(sizes) + 1)
+
+        try:
+            # size the histograms from a pilot run with its own seed
+            statistics, _ = _sample(self.network, self.settings, [(seeds[-1], pilot)], None)
+            edges = {}
+            for name, pilot_statistics in statistics.items():
+                spread = pilot_statistics.maximum - pilot_statistics.minimum
+                edges[name] = (pilot_statistics.minimum - spread - 1e-6, pilot_statistics.maximum + spread + 1e-6)
+
+            # one task per worker keeps the number of histograms sent back small
+            count = worker_count(workers)
+            batches = list(zip(seeds[:-1], sizes))
+            tasks = [(self.settings, batches[task::count], edges) for task in range(count)]
+
+            result = None
+            self.failures = 0
+            for statistics, failures in parallel_map(self.network, _sample, tasks, workers):
+                self.failures += failures
+                if result is None:
+                    result = statistics
+                else:
+                    for name in result:
+                        result[name].merge(statistics[name])
+        finally:
+            self.network.close_hydraulics()
+            self.network.reset()
+
+        return result
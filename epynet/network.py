@@ -1,12 +1,28 @@
 """ EPYNET Classes """
 import atexit
 
+import numpy as np
+
 from . import epanet2
 from .objectcollection import ObjectCollection
 from .node import Junction, Tank, Reservoir
 from .link import Pipe, Valve, Pump
-from .curve import Curve
-from .pattern import Pattern
+from .curve import Curve, CurveStore
+from .pattern import Pattern, PatternStore
+from .graph import Topology
+from .segments import Segments, valve_pairs
+from .criticality import pipe_criticality
+from .fireflow import fire_flow
+from .inpfile import InpIndex
+from .spatial import SpatialIndex
+from .pumps import PumpCurves
+from .session import HydraulicSession
+from .snapshot import Snapshot
+from .quality import QualityEngine
+from .contamination import impact_matrix
+from .sensitivity import SensitivityAnalysis
+from .calibration import Calibration
+from . import aio
 
 
 class Network(object):
@@ -33,6 +49,7 @@ class Network(object):
 
 
         self.vertices = {}
+        self.vertices_loaded = False
         # prepare network data
         self.nodes = ObjectCollection()
         self.junctions = ObjectCollection()
@@ -49,6 +66,20 @@ class Network(object):
 
         self.solved = False
         self.solved_for_simtime = None
+        self.hydraulics_open = False
+        # saved hydraulics used by quality analyses instead of the solver, see quality.QualityEngine
+        self.hydraulics_file = None
+
+        # topology caches, cleared when nodes or links are added or deleted
+        self._topology = None
+        self._segments = None
+        # spatial index, updated when nodes or links are added or deleted
+        self._spatial = None
+        # array caches of the time patterns and data curves
+        self._pattern_store = None
+        self._curve_store = None
+        # asyncio lock and its event loop, see aio.network_lock
+        self._async_lock = None
 
         self.load_network()
 
@@ -119,6 +150,7 @@ class Network(object):
             node.reset()
 
     def delete_node(self, uid):
+        self.close_hydraulics()
         index = self.ep.ENgetnodeindex(uid)
         node_type = self.ep.ENgetnodetype(index)
 
@@ -139,7 +171,11 @@ class Network(object):
         self.invalidate_nodes()
         self.invalidate_links()
 
+        if self._spatial is not None:
+            self._spatial.remove_node(uid)
+
     def delete_link(self, uid):
+        self.close_hydraulics()
 
         index = self.ep.ENgetlinkindex(uid)
         link_type = self.ep.ENgetlinktype(index)
@@ -162,8 +198,12 @@ class Network(object):
         self.invalidate_nodes()
         self.invalidate_links()
 
+        if self._spatial is not None:
+            self._spatial.remove_link(uid)
+
 
     def add_reservoir(self, uid, x, y, elevation=0):
+        self.close_hydraulics()
 
         self.ep.ENaddnode(uid, epanet2.EN_RESERVOIR)
 
@@ -179,9 +219,13 @@ class Network(object):
 
         self.invalidate_nodes()
 
+        if self._spatial is not None:
+            self._spatial.add_node(node)
+
         return node
 
     def add_junction(self, uid, x, y, basedemand=0, elevation=0):
+        self.close_hydraulics()
         self.ep.ENaddnode(uid, epanet2.EN_JUNCTION)
         index = self.ep.ENgetnodeindex(uid)
         self.ep.ENsetcoord(index, x, y)
@@ -195,9 +239,13 @@ class Network(object):
 
         self.invalidate_nodes()
 
+        if self._spatial is not None:
+            self._spatial.add_node(node)
+
         return node
 
     def add_tank(self, uid, x, y, diameter=0, maxlevel=0, minlevel=0, tanklevel=0):
+        self.close_hydraulics()
         self.ep.ENaddnode(uid, epanet2.EN_TANK)
         index = self.ep.ENgetnodeindex(uid)
         self.ep.ENsetcoord(index, x, y)
@@ -212,9 +260,13 @@ class Network(object):
 
         self.invalidate_nodes()
 
+        if self._spatial is not None:
+            self._spatial.add_node(node)
+
         return node
 
     def add_pipe(self, uid, from_node, to_node, diameter=100, length=10, roughness=0.1, check_valve=False):
+        self.close_hydraulics()
 
         from_node = from_node if isinstance(from_node, str) else from_node.uid
         to_node = to_node if isinstance(to_node, str) else to_node.uid
@@ -243,9 +295,13 @@ class Network(object):
 
         self.invalidate_links()
 
+        if self._spatial is not None:
+            self._spatial.add_link(link)
+
         return link
 
     def add_pump(self, uid, from_node, to_node, speed=0):
+        self.close_hydraulics()
 
         from_node = from_node if isinstance(from_node, str) else from_node.uid
         to_node = to_node if isinstance(to_node, str) else to_node.uid
@@ -263,26 +319,21 @@ class Network(object):
 
         self.invalidate_links()
 
+        if self._spatial is not None:
+            self._spatial.add_link(link)
+
         return link
 
     def add_curve(self, uid, values):
-        self.ep.ENaddcurve(uid)
-
-        curve = Curve(uid, self)
-        curve.values = values
-        self.curves[uid] = curve
-
-        return curve
+        self.close_hydraulics()
+        return self.curve_store.add(uid, values)
 
     def add_pattern(self, uid, values):
-        self.ep.ENaddpattern(uid)
-        pattern = Pattern(uid, self)
-        pattern.values = values
-        self.patterns[uid] = pattern
-
-        return pattern
+        self.close_hydraulics()
+        return self.pattern_store.add(uid, values)
 
     def add_valve(self, uid, valve_type, from_node, to_node, diameter=100, setting=0):
+        self.close_hydraulics()
 
         from_node = from_node if isinstance(from_node, str) else from_node.uid
         to_node = to_node if isinstance(to_node, str) else to_node.uid
@@ -315,6 +366,9 @@ class Network(object):
 
         self.invalidate_links()
 
+        if self._spatial is not None:
+            self._spatial.add_link(link)
+
         return link
 
     def invalidate_links(self):
@@ -323,6 +377,7 @@ class Network(object):
         # reset link index caches
         for link in self.links:
             link._index = None
+        self.invalidate_topology()
 
     def invalidate_nodes(self):
         # set network as unsolved
@@ -330,24 +385,163 @@ class Network(object):
         # reset node index caches
         for node in self.nodes:
             node._index = None
-
-    def solve(self, simtime=0):
-        """ Solve Hydraulic Network for Single Timestep"""
+        self.invalidate_topology()
+
+    def invalidate_topology(self):
+        self._topology = None
+        self._segments = None
+
+    @property
+    def topology(self):
+        """ Array representation of the network connectivity """
+        if self._topology is None:
+            self._topology = Topology(self)
+        return self._topology
+
+    @property
+    def pattern_store(self):
+        """ Array cache of the time patterns, see pattern.PatternStore """
+        if self._pattern_store is None:
+            self._pattern_store = PatternStore(self)
+        return self._pattern_store
+
+    @property
+    def curve_store(self):
+        """ Array cache of the data curves, see curve.CurveStore """
+        if self._curve_store is None:
+            self._curve_store = CurveStore(self)
+        return self._curve_store
+
+    def pump_curves(self, pumps=None):
+        """ Head curves of the pumps for vectorised evaluation, see pumps.PumpCurves """
+        return PumpCurves(self, pumps)
+
+    @property
+    def spatial_index(self):
+        """ Spatial index of the node coordinates and link paths, see spatial.SpatialIndex """
+        if self._spatial is None:
+            self._spatial = SpatialIndex(self)
+        return self._spatial
+
+    def isolation_segments(self, valves):
+        """ Compute the isolation segments bounded by a table of isolation valves
+
+        valves: DataFrame with 'pipe' and 'node' columns, or a list of
+                (pipe uid, node uid) pairs """
+        pairs = valve_pairs(valves)
+        if self._segments is None or self._segments[0] != pairs:
+            self._segments = (pairs, Segments(self.topology, pairs))
+        return self._segments[1]
+
+    def criticality(self, pipes=None, min_pressure=0, simtime=0, flow_threshold=1e-3, workers=1, output=None):
+        """ Close every pipe in turn and measure the impact, see criticality.pipe_criticality """
+        return pipe_criticality(self, pipes, min_pressure, simtime, flow_threshold, workers, output)
+
+    def fire_flow(self, nodes, min_pressure=None, residual_constraints=None, simtime=0,
+                  max_flow=1000, tolerance=0.01, workers=1):
+        """ Maximum extra demand per node within pressure constraints, see fireflow.fire_flow """
+        return fire_flow(self, nodes, min_pressure, residual_constraints, simtime,
+                         max_flow, tolerance, workers=workers)
+
+    def snapshot(self):
+        """ Capture the input data of the network in arrays, see snapshot.Snapshot """
+        return Snapshot(self)
+
+    def restore(self, snapshot):
+        """ Write back the input data that differs from a snapshot, returns the number of values written """
+        return snapshot.restore(self)
+
+    def session(self, start=0, node_properties=None, link_properties=None):
+        """ Open a real-time simulation that keeps the solver open, see session.HydraulicSession """
+        session = HydraulicSession(self, start, node_properties, link_properties)
+        session.open()
+        return session
+
+    def quality(self, nodes=None, links=None, cache=None):
+        """ Solve the hydraulics once for water quality scenarios, see quality.QualityEngine """
+        return QualityEngine(self, nodes, links, cache)
+
+    def source_contributions(self, sources=None, nodes=None, aggregate=None, workers=1, cache=None):
+        """ Share of the water at the nodes from every source, the reservoirs by default,
+        see quality.QualityEngine.source_contributions """
+        if sources is None:
+            sources = list(self.reservoirs.uid)
+        with QualityEngine(self, nodes, [], cache) as engine:
+            return engine.source_contributions(sources, aggregate, workers)
+
+    def impact_matrix(self, events=None, sensors=None, threshold=0.01, impact='demand', population=None,
+                      strength=1000, source_type='mass', weights=None, workers=1, cache=None):
+        """ Simulate a contamination event at every node, see contamination.impact_matrix """
+        return impact_matrix(self, events, sensors, threshold, impact, population, strength, source_type,
+                             weights, workers, cache=cache)
+
+    def sensitivity(self, parameter, groups=None, outputs=('pressure',), simtime=0, workers=1, threshold=None):
+        """ Jacobians of results with respect to groups of parameters, see sensitivity.SensitivityAnalysis """
+        return SensitivityAnalysis(self, parameter, groups, outputs, simtime=simtime).run(workers, threshold)
+
+    def calibration(self, parameters, measurements, boundaries=None, sigma=None, start=None, workers=1):
+        """ Residuals of parameter vectors against measurements, see calibration.Calibration """
+        return Calibration(self, parameters, measurements, boundaries, sigma, start, workers)
+
+    def open_hydraulics(self):
+        """ Open the hydraulic solver and keep it open between solves """
+        if not self.hydraulics_open:
+            self.ep.ENopenH()
+            self.hydraulics_open = True
+
+    def close_hydraulics(self):
+        """ Close the hydraulic solver, nodes and links can only be added or deleted while it is closed """
+        if self.hydraulics_open:
+            self.ep.ENcloseH()
+            self.hydraulics_open = False
+
+    def solve(self, simtime=0, warm=False):
+        """ Solve Hydraulic Network for Single Timestep
+
+        With warm=True the hydraulic solver stays open, and the next warm
+        solve starts from the flows of this solution instead of from scratch."""
         if self.solved and self.solved_for_simtime == simtime:
             return
 
         self.reset()
-        self.ep.ENsettimeparam(4, simtime)
-        self.ep.ENopenH()
-        self.ep.ENinitH(0)
-        self.ep.ENrunH()
-        self.ep.ENcloseH()
+        self.solve_hydraulics(simtime, warm)
         self.solved = True
         self.solved_for_simtime = simtime
 
-    def run(self):
+    def solve_hydraulics(self, simtime=0, warm=False):
+        """ Solve a single timestep without clearing the values cached on nodes and links
+
+        Used by the analysis engines, which read results in bulk and restore
+        the network when they are done. Returns the solver warning, if any."""
+        self.ep.ENsettimeparam(4, simtime)
+        if warm:
+            self.open_hydraulics()
+        else:
+            self.close_hydraulics()
+            self.ep.ENopenH()
+        self.ep.ENinitH(0)
+        warning = self.ep.ENrunH()
+        if not warm:
+            self.ep.ENcloseH()
+        return warning
+
+    def run(self, reducers=None, abort=None):
+        """ Run an extended period simulation
+
+        By default every dynamic property of every node and link is recorded
+        at every timestep. When reducers are given, a dict of name: Reducer
+        (see epynet.reducers), only the reducers are updated and no time
+        series are kept. The reduced values are returned as a dict of
+        Series with the same names. The simulation stops after the current
+        timestep when abort, a threading.Event, is set."""
+        self.close_hydraulics()
         self.reset()
         self.time = []
+
+        if reducers is not None:
+            for reducer in reducers.values():
+                reducer.start(self)
+
         # open network
         self.ep.ENopenH()
         self.ep.ENinitH(0)
@@ -361,18 +555,44 @@ class Network(object):
 
         self.solved = True
 
-        while timestep > 0:
+        while timestep > 0 and not (abort is not None and abort.is_set()):
             self.ep.ENrunH()
             self.ep.ENrunQ()
             timestep = self.ep.ENnextH()
             self.ep.ENnextQ()
             self.time.append(simtime)
-            self.load_attributes(simtime)
+            if reducers is None:
+                self.load_attributes(simtime)
+            else:
+                self.update_reducers(reducers, simtime, timestep)
             simtime += timestep
 
         self.ep.ENcloseH()
         self.ep.ENcloseQ()
 
+        if reducers is not None:
+            return dict((name, reducer.result()) for name, reducer in reducers.items())
+
+    def asolve(self, simtime=0):
+        """ Solve a single timestep without blocking the event loop, see aio.solve """
+        return aio.solve(self, simtime)
+
+    def arun(self, reducers=None):
+        """ Run an extended period simulation without blocking the event loop, see aio.run """
+        return aio.run(self, reducers)
+
+    def asteps(self, node_properties=None, link_properties=None):
+        """ Async iterator over the timesteps of a simulation, see aio.Steps """
+        return aio.Steps(self, node_properties, link_properties)
+
+    def update_reducers(self, reducers, simtime, timestep):
+        # reducers of the same property share their values
+        values = {}
+        for reducer in reducers.values():
+            if reducer.key not in values:
+                values[reducer.key] = reducer.read()
+            reducer.update(values[reducer.key], simtime, timestep)
+
     def load_attributes(self, simtime):
         for node in self.nodes:
             for property_name in node.properties.keys():
@@ -395,37 +615,37 @@ class Network(object):
     def save_inputfile(self, name):
         self.ep.ENsaveinpfile(name)
 
+    @property
+    def input_index(self):
+        """ Section index of the input file, see inpfile.InpIndex """
+        if not self.inputfile:
+            return None
+        return InpIndex.open(self.inputfile, self.ep.charset)
+
     def get_vertices(self, link_uid):
-        if self.vertices == {}:
+        if not self.vertices_loaded:
             self.parse_vertices()
         return self.vertices.get(link_uid, [])
 
     def parse_vertices(self):
-        vertices = False
+        self.vertices_loaded = True
         if not self.inputfile or len(self.vertices) > 0:
             return
 
-        with open(self.inputfile, 'rb') as handle:
-            for line in handle.readlines():
-                if b'[VERTICES]' in line:
-                    vertices = True
-                    continue
-                elif b'[' in line:
-                    vertices = False
-
-                if b";" in line:
-                    continue
-
-                if vertices:
-                    components = [c.strip() for c in line.decode(self.ep.charset).split()]
-                    if len(components) < 3:
-                        continue
-                    if components[0] not in self.vertices:
-                        self.vertices[components[0]] = []
-                    self.vertices[components[0]].append((float(components[1]), float(components[2])))
-
+        uids, points = self.input_index.vertices()
+        if len(uids) == 0:
+            return
 
+        # group the vertices per link, keeping their order
+        order = np.argsort(uids, kind='stable')
+        links, starts = np.unique(uids[order], return_index=True)
+        ends = np.append(starts[1:], len(order))
+        for uid, start, end in zip(links, starts, ends):
+            self.vertices[uid] = [tuple(point) for point in points[order[start:end]].tolist()]
 
     def close(self):
         print('closing')
-        self.ep.ENdeleteproject()
+        self.close_hydraulics()
+        # frees the project, except projects that would crash the library (see EPANET2.ENaddnode)
+        if self.ep.deletable:
+            self.ep.ENdeleteproject()
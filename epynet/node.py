@@ -24,6 +24,10 @@ class Node(BaseObject):
 
     def get_object_value(self, code):
         return self.network().ep.ENgetnodevalue(self.index, code)
+
+    @staticmethod
+    def set_object_values(network, indices, code, values):
+        return network.ep.ENsetnodevalues(indices, code, values)
     
     @property
     def comment(self):
@@ -95,19 +99,18 @@ class Junction(Node):
     def pattern(self):
         pattern_index = int(self.get_property(epanet2.EN_PATTERN))
         uid = self.network().ep.ENgetpatternid(pattern_index)
-        return Pattern(uid, self.network())
+        return self.network().patterns.get(uid) or Pattern(uid, self.network())
 
     @pattern.setter
     def pattern(self, value):
         if isinstance(value, int):
             pattern_index = value
         elif isinstance(value, str):
-            pattern_index = self.network().ep.ENgetpatternindex(value)
+            pattern_index = self.network().pattern_store.index(value)
         else:
             pattern_index = value.index
 
-        self.network().solved = False
-        self.set_object_value(epanet2.EN_PATTERN, pattern_index)
+        self.set_static_property(epanet2.EN_PATTERN, pattern_index)
 
 class Tank(Node):
     """ EPANET Tank Class """
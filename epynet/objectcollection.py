@@ -1,6 +1,9 @@
 import collections
+import numpy as np
 import pandas as pd
 
+from . import geometry
+
 class ObjectCollection(dict):
 
     # magic methods to transform collection attributes to Pandas Series or, if we return classes, another list
@@ -17,6 +20,9 @@ class ObjectCollection(dict):
 
     def __setattr__(self, name, value):
 
+        if self._set_static_properties(name, value):
+            return
+
         if isinstance(value, pd.Series):
             for key, val in value.items():
                 setattr(self[key],name,val)
@@ -25,6 +31,33 @@ class ObjectCollection(dict):
         for key, item in self.items():
             setattr(item,name,value)
 
+    def _set_static_properties(self, name, value):
+        """ set a static property from a scalar, an array in collection order or a Series indexed by uid
+        in one toolkit pass per object class, returns False when the assignment is not a numeric static property """
+        if isinstance(value, pd.Series):
+            items = [self[key] for key in value.index]
+            value = value.values
+        else:
+            items = list(self.values())
+
+        try:
+            values = np.asarray(value, dtype=float)
+        except (TypeError, ValueError):
+            return False
+        if not items or values.shape not in ((), (len(items),)):
+            return False
+
+        groups = collections.OrderedDict()
+        for position, item in enumerate(items):
+            if name not in item.static_properties:
+                return False
+            groups.setdefault((type(item), item.static_properties[name]), []).append(position)
+
+        values = np.broadcast_to(values, (len(items),))
+        for (cls, code), positions in groups.items():
+            cls.set_static_properties([items[position] for position in positions], code, values[positions])
+        return True
+
     def __getitem__(self, key):
         # support for index slicing through pandas
         if isinstance(key, pd.Series):
@@ -39,3 +72,21 @@ class ObjectCollection(dict):
 
     def __iter__(self):
         return iter(self.values())
+
+    # geometry export
+    def coordinates_array(self):
+        """ return the coordinates of the nodes in the collection as an (n, 2) array """
+        return geometry.node_coordinates(self)
+
+    def geometry(self, wkb=False):
+        """ return the link paths as flat coordinates and offsets, or a list of WKB linestrings """
+        coordinates, offsets = geometry.link_geometry(self)
+        if wkb:
+            return geometry.linestring_wkb(coordinates, offsets)
+        return coordinates, offsets
+
+    def to_geojson(self, path, columns=None):
+        geometry.write_geojson(self, path, columns)
+
+    def to_geoparquet(self, path, columns=None):
+        geometry.write_geoparquet(self, path, columns)
@@ -0,0 +1,116 @@
+""" EPYNET worker pools
+
+Analyses that solve a network many times spread their work over worker
+processes. Every worker loads its own copy of the network from an input
+file written from the current state of the network, so changes that have
+not been saved to disk are included. Analyses that map many times, such
+as optimisers, keep their workers in a WorkerPool so the network is only
+loaded once per worker.
+"""
+import os
+import shutil
+import tempfile
+from multiprocessing import Pool, util
+
+# the network of the current worker process
+_network = None
+
+
+def _initialize(inputfile, charset):
+    global _network
+    from .network import Network
+
+    # every worker gets its own directory for the report and output files
+    directory = tempfile.mkdtemp(prefix='epynet')
+    util.Finalize(None, shutil.rmtree, args=(directory, True), exitpriority=10)
+    path = os.path.join(directory, os.path.basename(inputfile))
+    shutil.copyfile(inputfile, path)
+
+    _network = Network(path, charset=charset)
+
+
+def _execute(task):
+    function, args = task
+    return function(_network, *args)
+
+
+def parallel_map(network, function, tasks, workers=1, chunksize=1):
+    """ Call function(network, *args) for every tuple of args in tasks
+
+    With a single worker the tasks run on the network itself, otherwise
+    every worker process runs them on its own copy. Results are yielded in
+    the order of the tasks, as soon as they are available. Functions have
+    to be defined at module level so they can be sent to the workers, and
+    have to leave the network in the state they found it. workers can also
+    be a WorkerPool of the network.
+    """
+    if isinstance(workers, WorkerPool):
+        for result in workers.map(function, tasks, chunksize):
+            yield result
+        return
+    if workers is None or workers <= 1:
+        for args in tasks:
+            yield function(network, *args)
+        return
+
+    directory = tempfile.mkdtemp(prefix='epynet')
+    try:
+        inputfile = os.path.join(directory, 'network.inp')
+        network.close_hydraulics()
+        network.save_inputfile(inputfile)
+
+        pool = Pool(workers, _initialize, (inputfile, network.ep.charset))
+        try:
+            jobs = ((function, args) for args in tasks)
+            for result in pool.imap(_execute, jobs, chunksize):
+                yield result
+        finally:
+            # lets the workers remove their directories, terminate() would not
+            pool.close()
+            pool.join()
+    finally:
+        shutil.rmtree(directory, True)
+
+
+def worker_count(workers):
+    """ return the number of processes of workers, a number or a WorkerPool """
+    if isinstance(workers, WorkerPool):
+        return workers.workers
+    return max(workers or 1, 1)
+
+
+class WorkerPool(object):
+    """ Worker processes that keep their copy of a network between maps
+
+    network:    the network, its current state is copied to the workers
+    workers:    number of processes
+
+    Changes to the network after the pool is created do not reach the
+    workers. Pass the pool as the workers of parallel_map.
+    """
+
+    def __init__(self, network, workers):
+        self.workers = workers
+        self.directory = tempfile.mkdtemp(prefix='epynet')
+        inputfile = os.path.join(self.directory, 'network.inp')
+        network.close_hydraulics()
+        network.save_inputfile(inputfile)
+        # workers that exit are replaced and load the input file again, it is kept until close()
+        self.pool = Pool(workers, _initialize, (inputfile, network.ep.charset))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def map(self, function, tasks, chunksize=1):
+        """ Call function(network, *args) on the workers for every tuple of args in tasks """
+        jobs = ((function, args) for args in tasks)
+        return self.pool.imap(_execute, jobs, chunksize)
+
+    def close(self):
+        """ Stop the workers and remove the input file """
+        self.pool.close()
+        self.pool.join()
+        shutil.rmtree(self.directory, True)
@@ -1,6 +1,9 @@
 from . import epanet2
 import weakref
 
+import numpy as np
+import pandas as pd
+
 
 class Pattern(object):
 
@@ -13,16 +16,151 @@ class Pattern(object):
 
     @property
     def index(self):
-        return self.network().ep.ENgetpatternindex(self.uid)
+        return self.network().pattern_store.index(self.uid)
 
     @property
     def values(self):
-        values = []
-        n_values = self.network().ep.ENgetpatternlen(self.index)
-        for n in range(1, n_values+1):
-            values.append(self.network().ep.ENgetpatternvalue(self.index, n))
-        return values
+        return self.network().pattern_store.get(self.uid).tolist()
 
     @values.setter
     def values(self, value):
-        self.network().ep.ENsetpattern(self.index, value)
+        self.network().pattern_store.set(self.uid, value)
+
+
+class PatternStore(object):
+    """ Cache of the time patterns of a network as NumPy arrays
+
+    Pattern ids, indices and factors are read from the toolkit once and
+    kept up to date by the writes that go through the store. Patterns can
+    be read and written as a (pattern x period) matrix, and bulk creation
+    reuses existing patterns with identical factors.
+    """
+
+    def __init__(self, network):
+        self.network = weakref.ref(network)
+        self.uids = []
+        self.indices = {}
+        self.arrays = []
+        # pattern uid per distinct set of factors
+        self.interned = {}
+
+        ep = network.ep
+        for index in range(1, ep.ENgetcount(epanet2.EN_PATCOUNT)+1):
+            self._register(ep.ENgetpatternid(index), index, ep.ENgetpattern(index))
+
+    def __len__(self):
+        return len(self.uids)
+
+    def __contains__(self, uid):
+        return uid in self.indices
+
+    def _register(self, uid, index, values):
+        self.uids.append(uid)
+        self.indices[uid] = index
+        self.arrays.append(values)
+        self.interned.setdefault(values.tobytes(), uid)
+
+    def index(self, uid):
+        """ return the toolkit index of a pattern """
+        if uid not in self.indices:
+            raise KeyError("Unknown pattern", uid)
+        return self.indices[uid]
+
+    def get(self, uid):
+        """ return the factors of a pattern as an array """
+        return self.arrays[self.index(uid) - 1].copy()
+
+    def set(self, uid, values):
+        """ set the factors of a pattern """
+        index = self.index(uid)
+        values = np.array(values, dtype=float).ravel()
+        self.network().ep.ENsetpattern(index, values.tolist())
+        old = self.arrays[index - 1].tobytes()
+        if self.interned.get(old) == uid:
+            del self.interned[old]
+        self.arrays[index - 1] = values
+        self.interned.setdefault(values.tobytes(), uid)
+        self.network().solved = False
+
+    def add(self, uid, values):
+        """ add a pattern and return its Pattern object """
+        network = self.network()
+        network.close_hydraulics()
+        network.ep.ENaddpattern(uid)
+        index = network.ep.ENgetpatternindex(uid)
+        values = np.array(values, dtype=float).ravel()
+        network.ep.ENsetpattern(index, values.tolist())
+        self._register(uid, index, values)
+
+        pattern = Pattern(uid, network)
+        network.patterns[uid] = pattern
+        return pattern
+
+    def matrix(self, uids=None):
+        """ return a DataFrame with the factors of the patterns (rows) per period (columns)
+
+        Patterns shorter than the longest one are padded with NaN. """
+        uids = list(self.uids if uids is None else uids)
+        rows = [self.arrays[self.index(uid) - 1] for uid in uids]
+        periods = max([len(row) for row in rows] + [0])
+        matrix = np.full((len(rows), periods), np.nan)
+        for position, row in enumerate(rows):
+            matrix[position, :len(row)] = row
+        return pd.DataFrame(matrix, index=uids, columns=range(1, periods + 1))
+
+    def set_matrix(self, matrix):
+        """ set the factors of existing patterns from a DataFrame indexed by pattern uid, NaN ends a pattern """
+        for uid, row in zip(matrix.index, matrix.values.astype(float)):
+            self.set(uid, _trim(row))
+
+    def intern(self, matrix, prefix='P'):
+        """ create patterns for the rows of a DataFrame, reusing patterns with identical factors
+
+        Rows with the same factors share one pattern, as do rows equal to an
+        existing pattern. New patterns are named prefix plus a number.
+        Returns a Series with the pattern uid of every row. """
+        rows = [_trim(row) for row in np.asarray(matrix, dtype=float)]
+        index = matrix.index if isinstance(matrix, pd.DataFrame) else range(len(rows))
+
+        counter = len(self.uids)
+        result = []
+        for row in rows:
+            key = row.tobytes()
+            uid = self.interned.get(key)
+            if uid is None:
+                counter += 1
+                while prefix + str(counter) in self.indices:
+                    counter += 1
+                uid = prefix + str(counter)
+                self.add(uid, row)
+            result.append(uid)
+        return pd.Series(result, index=index)
+
+    def junction_patterns(self, junctions=None):
+        """ return a Series with the pattern uid of every junction, None for junctions without a pattern """
+        junctions = list(self.network().junctions if junctions is None else junctions)
+        indices = [junction.index for junction in junctions]
+        codes = self.network().ep.ENgetnodevalues(indices, epanet2.EN_PATTERN).astype(int)
+        return pd.Series([self.uids[code - 1] if code > 0 else None for code in codes.tolist()],
+                         index=[junction.uid for junction in junctions])
+
+    def assign(self, patterns):
+        """ set the demand pattern of junctions from a Series or dict of pattern uids indexed by junction uid """
+        network = self.network()
+        patterns = pd.Series(patterns)
+        junctions = [network.junctions[uid] for uid in patterns.index]
+        codes = [self.index(uid) if uid is not None else 0 for uid in patterns.tolist()]
+        if junctions:
+            type(junctions[0]).set_static_properties(junctions, epanet2.EN_PATTERN, codes)
+
+    def assign_values(self, matrix, prefix='P'):
+        """ give every junction in the index of a DataFrame the pattern of its row, see intern """
+        patterns = self.intern(matrix, prefix)
+        self.assign(patterns)
+        return patterns
+
+
+def _trim(row):
+    """ drop the NaN padding at the end of a row """
+    valid = np.flatnonzero(~np.isnan(row))
+    return row[:valid[-1] + 1] if len(valid) else row[:0]
@@ -0,0 +1,192 @@
+""" EPYNET network pools
+
+Keeps loaded networks ready for services that need a clean copy of a
+model per request. While a network is checked out, every change made
+through the toolkit is recorded with its original value in a journal
+(see epynet.journal), so checking it in reverts only what was changed.
+Networks whose structure changed (nodes, links, patterns, curves or
+controls added or deleted) cannot be reverted and are replaced by a
+fresh copy, as are networks that were used too often or when the
+process uses too much memory.
+
+Example:
+    pool = NetworkPool({'north': 'north.inp', 'south': 'south.inp'}, size=4, max_uses=500)
+    with pool.checkout('north') as network:
+        network.pipes['P1'].diameter = 300
+        network.solve()
+    pool.metrics()
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pandas as pd
+
+from .journal import Journal
+from .network import Network
+
+METRICS = ['size', 'idle', 'in_use', 'checkouts', 'reverts', 'reverted_values', 'recycles',
+           'wait_time', 'load_time']
+
+
+def process_memory():
+    """ return the resident memory of the process in bytes """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError):
+        import resource
+        # peak instead of current memory, in kilobytes on Linux and bytes on macOS
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if usage > 2 ** 32 else usage * 1024
+
+
+class PoolTimeout(Exception):
+    """ No network of the model was checked in within the timeout of checkout() """
+
+
+class NetworkPool(object):
+    """ Loaded networks per model, handed out with checkout()
+
+    models:     dict of model name: input file
+    size:       networks loaded per model
+    max_uses:   checkouts after which a network is replaced, unlimited by default
+    max_memory: resident process memory in bytes above which checked in
+                networks are replaced, unlimited by default
+    charset:    of the input files
+
+    Every network is loaded from its own copy of the input file, so the
+    report and output files of the networks do not collide.
+    """
+
+    def __init__(self, models, size=1, max_uses=None, max_memory=None, charset='UTF8'):
+        self.models = dict(models)
+        self.size = size
+        self.max_uses = max_uses
+        self.max_memory = max_memory
+        self.charset = charset
+
+        self._condition = threading.Condition()
+        self._idle = dict((model, deque()) for model in self.models)
+        self._uses = {}
+        self._directories = {}
+        self._metrics = dict((model, dict((name, 0) for name in METRICS)) for model in self.models)
+        self.closed = False
+
+        for model in self.models:
+            for _ in range(size):
+                self._idle[model].append(self._load(model))
+            self._metrics[model]['size'] = size
+
+    def _load(self, model):
+        started = time.time()
+        directory = tempfile.mkdtemp(prefix='epynet')
+        inputfile = self.models[model]
+        path = os.path.join(directory, os.path.basename(inputfile))
+        shutil.copyfile(inputfile, path)
+
+        network = Network(path, charset=self.charset)
+        self._uses[id(network)] = 0
+        self._directories[id(network)] = directory
+        self._metrics[model]['load_time'] += time.time() - started
+        return network
+
+    def _unload(self, network):
+        network.close_hydraulics()
+        # frees the project, except projects that would crash the library (see EPANET2.ENaddnode)
+        if network.ep.deletable:
+            network.ep.ENdeleteproject()
+        self._uses.pop(id(network), None)
+        shutil.rmtree(self._directories.pop(id(network)), True)
+
+    def _restore(self, model, network):
+        """ return the network reverted to its baseline, or a fresh copy """
+        journal = network.ep.journal
+        network.ep.journal = None
+        metrics = self._metrics[model]
+        try:
+            network.close_hydraulics()
+            network.ep.ENcloseQ()
+        except Exception:
+            pass
+
+        recycle = journal is None or journal.irreversible or \
+            (self.max_uses is not None and self._uses[id(network)] >= self.max_uses) or \
+            (self.max_memory is not None and process_memory() > self.max_memory)
+        if not recycle:
+            try:
+                kinds = journal.kinds
+                metrics['reverted_values'] += len(journal)
+                journal.revert(network.ep)
+            except Exception:
+                recycle = True
+        if recycle:
+            self._unload(network)
+            metrics['recycles'] += 1
+            return self._load(model)
+
+        metrics['reverts'] += 1
+        network.reset()
+        network.solved = False
+        if 'pattern' in kinds:
+            network._pattern_store = None
+        if 'curve' in kinds or 'headcurve' in kinds:
+            network._curve_store = None
+        return network
+
+    @contextmanager
+    def checkout(self, model, timeout=None):
+        """ Context that hands out a network of a model and checks it in again
+
+        Waits for a network to be checked in when all are in use, and raises
+        PoolTimeout when none became available within timeout seconds. """
+        if model not in self.models:
+            raise KeyError("Unknown model", model)
+        started = time.time()
+        with self._condition:
+            while not self._idle[model]:
+                if self.closed:
+                    raise RuntimeError("Pool is closed")
+                remaining = None if timeout is None else timeout - (time.time() - started)
+                if remaining is not None and remaining <= 0:
+                    raise PoolTimeout("No network of model %s available" % model)
+                self._condition.wait(remaining)
+            network = self._idle[model].popleft()
+            metrics = self._metrics[model]
+            metrics['checkouts'] += 1
+            metrics['in_use'] += 1
+            metrics['wait_time'] += time.time() - started
+
+        self._uses[id(network)] += 1
+        network.ep.journal = Journal()
+        try:
+            yield network
+        finally:
+            network = self._restore(model, network)
+            with self._condition:
+                self._metrics[model]['in_use'] -= 1
+                if self.closed:
+                    self._unload(network)
+                else:
+                    self._idle[model].append(network)
+                self._condition.notify_all()
+
+    def metrics(self):
+        """ return a DataFrame with the counters per model, times are totals in seconds """
+        with self._condition:
+            table = pd.DataFrame.from_dict(self._metrics, orient='index')[METRICS]
+            table['idle'] = [len(self._idle[model]) for model in table.index]
+        return table
+
+    def close(self):
+        """ Unload the idle networks, networks in use are unloaded when they are checked in """
+        with self._condition:
+            self.closed = True
+            for model, networks in self._idle.items():
+                while networks:
+                    self._unload(networks.popleft())
+            self._condition.notify_all()
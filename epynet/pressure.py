@@ -0,0 +1,231 @@
+""" EPYNET pressure management
+
+Chooses setpoints for the pressure reducing valves (PRVs) of a network.
+Every PRV supplies a zone: the junctions that are cut off from the rest
+of the network when all PRVs are removed. Lowering the setpoint of a PRV
+lowers the pressure in its zone by about the same amount, so the lowest
+setpoint is found by lowering it until the critical node of the zone, the
+junction closest to its minimum pressure, is just at its minimum.
+
+Example:
+    management = PressureManagement(network, min_pressure=20, periods=range(0, 86400, 3600))
+    schedule = management.optimise(workers=4)   # setpoint per period and PRV
+    management.critical_nodes                   # critical junction per period and zone
+    management.evaluate(candidates)             # objectives of candidate setpoints
+"""
+import numpy as np
+import pandas as pd
+
+from . import epanet2
+from .graph import connected_components
+from .node import Junction
+from .parallel import parallel_map, worker_count
+
+
+def prv_zones(network, valves=None):
+    """ return the zone number of every PRV and the junctions of every zone
+
+    valves: collection of PRVs, all PRVs of the network by default
+    Raises ValueError for a PRV that can be bypassed, as it does not
+    bound a zone of its own. """
+    topology = network.topology
+    if valves is None:
+        valves = [valve for valve in network.valves if valve.valve_type == 'PRV']
+    valves = list(valves)
+
+    closed = np.zeros(topology.link_count, dtype=bool)
+    for valve in valves:
+        closed[topology.link_positions[valve.uid]] = True
+    components = connected_components(topology.node_count, topology.from_nodes[~closed], topology.to_nodes[~closed])
+
+    zones = {}
+    for valve in valves:
+        position = topology.link_positions[valve.uid]
+        upstream = components[topology.from_nodes[position]]
+        downstream = components[topology.to_nodes[position]]
+        if upstream == downstream:
+            raise ValueError("PRV does not bound a zone", valve.uid)
+        zones[valve.uid] = downstream
+
+    # number the zones in the order of the valves
+    numbers = {}
+    for uid in zones:
+        zones[uid] = numbers.setdefault(zones[uid], len(numbers))
+
+    nodes = dict((number, []) for number in numbers.values())
+    for node, component in zip(topology.nodes, components.tolist()):
+        if component in numbers and isinstance(node, Junction):
+            nodes[numbers[component]].append(node.uid)
+    return pd.Series(zones), nodes
+
+
+def _prepare(network, settings):
+    ep = network.ep
+    valves = np.array([ep.ENgetlinkindex(uid) for uid in settings['valves']], dtype=np.int64)
+    nodes = np.array([ep.ENgetnodeindex(uid) for uid in settings['nodes']], dtype=np.int64)
+    return valves, nodes, ep.ENgetlinkvalues(valves, epanet2.EN_INITSETTING)
+
+
+def _zone_minimum(values, zones, count):
+    """ return the smallest value and its position per zone, NaN and -1 for zones without values """
+    order = np.lexsort((values, zones))
+    first = np.searchsorted(zones[order], np.arange(count))
+    found = first < len(order)
+    found[found] = zones[order[first[found]]] == np.arange(count)[found]
+
+    positions = np.full(count, -1, dtype=np.int64)
+    positions[found] = order[first[found]]
+    minimum = np.full(count, np.nan)
+    minimum[found] = values[positions[found]]
+    return minimum, positions
+
+
+def _optimise(network, settings, periods):
+    """ Lower the setpoints of every period until the critical nodes are at their minimum pressure """
+    ep = network.ep
+    valves, nodes, original = _prepare(network, settings)
+    node_zones = settings['node_zones']
+    valve_zones = settings['valve_zones']
+    count = settings['zone_count']
+
+    rows = []
+    try:
+        for simtime in periods:
+            setpoints = original.copy()
+            for iteration in range(settings['iterations']):
+                ep.ENsetlinkvalues(valves, epanet2.EN_INITSETTING, setpoints)
+                network.solve_hydraulics(simtime, warm=True)
+                margin = ep.ENgetnodevalues(nodes, epanet2.EN_PRESSURE) - settings['min_pressure']
+                zone_margin, critical = _zone_minimum(margin, node_zones, count)
+                # zones without junctions keep their setpoint
+                step = np.nan_to_num(zone_margin)
+                if np.all(np.abs(step) <= settings['tolerance']):
+                    break
+                setpoints = np.maximum(setpoints - step[valve_zones], 0)
+            rows.append((simtime, setpoints.copy(), critical, zone_margin, iteration + 1))
+    finally:
+        ep.ENsetlinkvalues(valves, epanet2.EN_INITSETTING, original)
+    return rows
+
+
+def _evaluate(network, settings, candidates):
+    """ Solve candidate setpoints for every period, returns mean pressure, leakage and largest deficit """
+    ep = network.ep
+    valves, nodes, original = _prepare(network, settings)
+    periods = settings['periods']
+
+    results = np.zeros((len(candidates), 3))
+    try:
+        for row, candidate in enumerate(candidates):
+            pressure_sum = leakage = 0.0
+            deficit = -np.inf
+            for period, simtime in enumerate(periods):
+                ep.ENsetlinkvalues(valves, epanet2.EN_INITSETTING, candidate[period])
+                network.solve_hydraulics(simtime, warm=True)
+                pressure = ep.ENgetnodevalues(nodes, epanet2.EN_PRESSURE)
+                pressure_sum += pressure.mean()
+                leakage += (settings['weights'] * np.maximum(pressure, 0) ** settings['exponent']).sum()
+                deficit = max(deficit, np.max(settings['min_pressure'] - pressure))
+            results[row] = (pressure_sum / len(periods), leakage / len(periods), deficit)
+    finally:
+        ep.ENsetlinkvalues(valves, epanet2.EN_INITSETTING, original)
+    return results
+
+
+class PressureManagement(object):
+    """ PRV setpoint optimisation over representative demand periods
+
+    network:          the network
+    valves:           collection of PRVs, all PRVs by default
+    min_pressure:     minimum pressure, a number or a Series by junction uid
+    periods:          pattern times in seconds to optimise for, every
+                      pattern step of the simulation duration by default
+    leakage_exponent: exponent N1 of the pressure-leakage relation
+    leakage_weights:  leakage coefficient per junction (Series), for example
+                      the pipe length it represents, 1 by default
+
+    Only junctions in the zones of the PRVs are considered.
+    """
+
+    def __init__(self, network, valves=None, min_pressure=20, periods=None,
+                 leakage_exponent=1.15, leakage_weights=None):
+
+        self.network = network
+        self.zones, self.zone_nodes = prv_zones(network, valves)
+
+        if periods is None:
+            step = network.ep.ENgettimeparam(epanet2.EN_PATTERNSTEP)
+            periods = range(0, max(network.ep.ENgettimeparam(epanet2.EN_DURATION), 1), step)
+        self.periods = list(periods)
+
+        nodes = []
+        node_zones = []
+        for zone, uids in self.zone_nodes.items():
+            nodes += uids
+            node_zones += [zone] * len(uids)
+
+        if isinstance(min_pressure, pd.Series):
+            min_pressure = min_pressure.reindex(nodes).values
+        weights = np.ones(len(nodes)) if leakage_weights is None else \
+            pd.Series(leakage_weights).reindex(nodes).fillna(0).values
+
+        self.settings = {'valves': list(self.zones.index), 'nodes': nodes,
+                         'node_zones': np.array(node_zones, dtype=np.int64),
+                         'valve_zones': self.zones.values.astype(np.int64),
+                         'zone_count': len(self.zone_nodes),
+                         'min_pressure': np.broadcast_to(np.asarray(min_pressure, dtype=float), (len(nodes),)),
+                         'weights': np.asarray(weights, dtype=float), 'exponent': leakage_exponent,
+                         'periods': self.periods}
+
+        self.critical_nodes = None
+        self.margins = None
+
+    def optimise(self, workers=1, iterations=20, tolerance=0.01):
+        """ return the lowest setpoints (periods x PRVs) that keep every zone above its minimum pressure
+
+        Sets critical_nodes, the critical junction per period and zone, and
+        margins, its pressure above the minimum. A negative margin means the
+        PRV cannot supply the minimum pressure in that period. Zones without
+        junctions keep their setpoint and have no critical node. """
+        settings = dict(self.settings, iterations=iterations, tolerance=tolerance)
+        count = worker_count(workers)
+        tasks = [(settings, self.periods[task::count]) for task in range(count)]
+
+        rows = []
+        try:
+            for result in parallel_map(self.network, _optimise, tasks, workers):
+                rows += result
+        finally:
+            self.network.close_hydraulics()
+            self.network.reset()
+
+        rows.sort(key=lambda row: row[0])
+        times = [row[0] for row in rows]
+        # the critical node of zones without junctions, at position -1, is None
+        nodes = np.array(settings['nodes'] + [None], dtype=object)
+        zones = range(settings['zone_count'])
+        self.critical_nodes = pd.DataFrame([nodes[row[2]] for row in rows], index=times, columns=zones)
+        self.margins = pd.DataFrame([row[3] for row in rows], index=times, columns=zones)
+        self.iterations = pd.Series([row[4] for row in rows], index=times)
+        return pd.DataFrame([row[1] for row in rows], index=times, columns=settings['valves'])
+
+    def evaluate(self, candidates, workers=1, chunksize=8):
+        """ return the mean zone pressure, mean leakage and largest pressure deficit of candidate setpoints
+
+        candidates: array of shape (candidates, PRVs) with setpoints for all
+                    periods, or (candidates, periods, PRVs) with a schedule
+        Returns an array with one row per candidate, a candidate is feasible
+        when its deficit is <= 0. """
+        valves = len(self.settings['valves'])
+        candidates = np.asarray(candidates, dtype=float)
+        if candidates.ndim == 2:
+            candidates = np.repeat(candidates[:, None, :], len(self.periods), axis=1)
+        candidates = candidates.reshape(-1, len(self.periods), valves)
+
+        tasks = [(self.settings, candidates[start:start+chunksize]) for start in range(0, len(candidates), chunksize)]
+        try:
+            results = list(parallel_map(self.network, _evaluate, tasks, workers))
+        finally:
+            self.network.close_hydraulics()
+            self.network.reset()
+        return np.concatenate(results) if results else np.zeros((0, 3))
@@ -0,0 +1,158 @@
+""" EPYNET pump head curves
+
+Evaluates the head curves of many pumps for arrays of flows and speeds
+without a hydraulic solve, for example to screen the configurations of a
+pump station against a system curve.
+
+Example:
+    curves = network.pump_curves()
+    curves.heads([[50, 80], [60, 90]], speeds=[1, 0.9])   # one row per configuration
+    flows, heads = curves.operating_points(static_head=20, resistance=0.002)
+"""
+import numpy as np
+import pandas as pd
+
+
+def power_function(points):
+    """ return the coefficients (a, b, c) of H = a + b Q^c through the points of a curve like EPANET does
+
+    A single point (q, h) gives a shutoff head of 4/3 h and zero head at 2 q,
+    three points starting at zero flow are fitted exactly. Returns None for
+    other curves, which EPANET interpolates. """
+    if len(points) == 1:
+        q1, h1 = points[0]
+        h0, q2, h2 = 1.33334 * h1, 2.0 * q1, 0.0
+    elif len(points) == 3 and points[0][0] == 0:
+        h0 = points[0][1]
+        (q1, h1), (q2, h2) = points[1], points[2]
+    else:
+        return None
+    c = np.log((h0 - h2) / (h0 - h1)) / np.log(q2 / q1)
+    b = -(h0 - h1) / q1 ** c
+    return h0, b, c
+
+
+class PumpCurves(object):
+    """ Head curves of a set of pumps, evaluated for many flows and speeds at once
+
+    Curves follow EPANET: curves with one point, or three points starting
+    at zero flow, are power functions H = a + b Q^c, other curves are
+    interpolated linearly between their points and extrapolated along their
+    end segments. Speeds scale the curves with the affinity laws,
+    H(Q, s) = s^2 H(Q / s, 1). Pumps without a head curve (constant power)
+    have NaN heads.
+
+    Flows and speeds broadcast against the pumps, the last axis of the
+    arrays runs over the pumps in the order of uids.
+    """
+
+    def __init__(self, network, pumps=None):
+        pumps = list(network.pumps if pumps is None else pumps)
+        store = network.curve_store
+        ep = network.ep
+
+        self.uids = [pump.uid for pump in pumps]
+        count = len(pumps)
+        self.power = np.zeros(count, dtype=bool)
+        self.custom = np.zeros(count, dtype=bool)
+        self.coefficients = np.full((count, 3), np.nan)
+
+        tables = []
+        for position, pump in enumerate(pumps):
+            curve_index = ep.ENgetheadcurveindex(pump.index)
+            points = store.arrays[curve_index - 1] if curve_index > 0 else np.zeros((0, 2))
+            coefficients = power_function(points) if len(points) else None
+            if coefficients is not None:
+                self.power[position] = True
+                self.coefficients[position] = coefficients
+            elif len(points) > 1:
+                self.custom[position] = True
+            tables.append(points if self.custom[position] else np.zeros((0, 2)))
+
+        # custom curves padded to the longest one, padding repeats the last point
+        width = max([len(points) for points in tables] + [2])
+        self.x = np.zeros((count, width))
+        self.y = np.zeros((count, width))
+        self.sizes = np.array([len(points) for points in tables], dtype=np.int64)
+        for position, points in enumerate(tables):
+            if len(points):
+                self.x[position] = np.append(points[:, 0], np.repeat(points[-1, 0], width - len(points)))
+                self.y[position] = np.append(points[:, 1], np.repeat(points[-1, 1], width - len(points)))
+
+    def __len__(self):
+        return len(self.uids)
+
+    def _broadcast(self, *values):
+        """ broadcast arrays against each other and the pumps """
+        values = [np.asarray(value, dtype=float) for value in values]
+        shape = np.broadcast(np.empty(len(self.uids)), *values).shape
+        return [np.broadcast_to(value, shape) for value in values]
+
+    def _unit_heads(self, flows):
+        """ heads at full speed """
+        heads = np.full(flows.shape, np.nan)
+
+        a, b, c = self.coefficients.T
+        with np.errstate(invalid='ignore'):
+            power = a + b * np.maximum(flows, 0) ** c
+        heads = np.where(self.power, power, heads)
+
+        if self.custom.any():
+            rows = np.arange(len(self.uids))
+            # segment per flow, clipped to the end segments for extrapolation
+            segment = (flows[..., None] > self.x[:, 1:]).sum(axis=-1)
+            segment = np.clip(segment, 0, np.maximum(self.sizes - 2, 0))
+            x0, x1 = self.x[rows, segment], self.x[rows, segment + 1]
+            y0, y1 = self.y[rows, segment], self.y[rows, segment + 1]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                custom = y0 + (flows - x0) * (y1 - y0) / (x1 - x0)
+            heads = np.where(self.custom, custom, heads)
+        return heads
+
+    def heads(self, flows, speeds=1):
+        """ return the head gain of the pumps at the given flows and relative speeds """
+        flows, speeds = self._broadcast(flows, speeds)
+
+        running = speeds > 0
+        scaled = np.where(running, flows / np.where(running, speeds, 1), 0)
+        return np.where(running, speeds ** 2 * self._unit_heads(scaled), 0)
+
+    def shutoff_heads(self, speeds=1):
+        """ return the head of the pumps at zero flow """
+        return self.heads(0, speeds)
+
+    def operating_points(self, static_head, resistance, speeds=1, exponent=2, tolerance=1e-6):
+        """ return the flows and heads where the pumps meet the system curve H = static_head + resistance Q^exponent
+
+        Arguments broadcast against each other and the pumps. Pumps that
+        cannot overcome the static head, or are not running, get NaN. """
+        static_head, resistance, speeds = self._broadcast(static_head, resistance, speeds)
+        shape = speeds.shape
+
+        def surplus(flows):
+            return self.heads(flows, speeds) - (static_head + resistance * flows ** exponent)
+
+        feasible = (speeds > 0) & (surplus(np.zeros(shape)) > 0)
+        lower = np.zeros(shape)
+        upper = np.ones(shape)
+        # grow the bracket until the system curve exceeds the pump curve
+        for _ in range(200):
+            growing = feasible & (surplus(upper) > 0)
+            if not growing.any():
+                break
+            lower = np.where(growing, upper, lower)
+            upper = np.where(growing, upper * 2, upper)
+
+        while np.any(feasible & (upper - lower > tolerance * np.maximum(upper, 1))):
+            middle = (lower + upper) / 2
+            positive = surplus(middle) > 0
+            lower = np.where(positive, middle, lower)
+            upper = np.where(positive, upper, middle)
+
+        flows = np.where(feasible, (lower + upper) / 2, np.nan)
+        return flows, np.where(feasible, self.heads(np.where(feasible, flows, 0), speeds), np.nan)
+
+    def table(self, flows, speeds=1):
+        """ return a DataFrame with the heads of every pump (columns) at a one dimensional array of flows (rows) """
+        flows = np.asarray(flows, dtype=float).ravel()
+        return pd.DataFrame(self.heads(flows[:, None], speeds), index=flows, columns=self.uids)
@@ -0,0 +1,356 @@
+""" EPYNET water quality scenarios
+
+The hydraulics of a network are solved once and saved to a file, after
+which any number of water quality scenarios (water age, source tracing or
+a reacting chemical with its own sources and decay coefficients) run
+against the saved hydraulics. Scenarios only write the quality data they
+change and revert it afterwards, and can run in parallel worker
+processes that share the hydraulics file.
+
+The engine works on its own copy of the network, taken when it is
+created: later changes to the network are not seen by the engine, create
+a new one after changing the hydraulics.
+
+Example:
+    engine = network.quality()
+    age = engine.run(QualityScenario('age'))
+    age['nodes']    # DataFrame of time x node uid
+    scenarios = [QualityScenario('chemical', sources={'R1': 1.0}, bulk=k) for k in (-0.1, -0.5, -1.0)]
+    results = engine.run_many(scenarios, output='maximum', workers=4)
+    engine.close()
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from . import epanet2
+from .journal import Journal
+from .parallel import parallel_map
+
+MODES = {'chemical': epanet2.EN_CHEM, 'age': epanet2.EN_AGE, 'trace': epanet2.EN_TRACE}
+SOURCE_TYPES = {'concen': epanet2.EN_CONCEN, 'mass': epanet2.EN_MASS, 'setpoint': epanet2.EN_SETPOINT,
+                'flowpaced': epanet2.EN_FLOWPACED}
+OUTPUTS = ['series', 'final', 'minimum', 'maximum', 'mean']
+
+
+class QualityScenario(object):
+    """ Water quality analysis to run against saved hydraulics
+
+    mode:       'age', 'trace' or 'chemical'
+    trace:      uid of the node traced in a 'trace' analysis
+    sources:    dict of node uid: strength, or (strength, type) or
+                (strength, type, pattern uid), with type one of
+                SOURCE_TYPES, 'concen' by default
+    bulk:       bulk reaction coefficient of all pipes and tanks, or a dict
+                of link uid: coefficient
+    wall:       wall reaction coefficient of all pipes, or a dict of link
+                uid: coefficient
+    initial:    initial quality of all nodes, or a dict of node uid: quality
+    chemical:   name and units of the chemical
+    name:       to recognise the scenario by
+
+    Quality data that is not given keeps the value of the network.
+    """
+
+    def __init__(self, mode='chemical', trace=None, sources=None, bulk=None, wall=None, initial=None,
+                 chemical=('Chemical', 'mg/L'), name=None):
+        if mode not in MODES:
+            raise ValueError("Unknown quality mode", mode)
+        if mode == 'trace' and trace is None:
+            raise ValueError("A trace analysis needs the uid of the traced node")
+        self.mode = mode
+        self.trace = trace
+        self.sources = sources or {}
+        self.bulk = bulk
+        self.wall = wall
+        self.initial = initial
+        self.chemical = chemical
+        self.name = name
+
+    def __repr__(self):
+        return "<epynet.QualityScenario with mode '{mode}' and name '{name}'>".format(mode=self.mode, name=self.name)
+
+    def apply(self, ep, pipes, tanks):
+        """ Write the scenario to the toolkit, pipes and tanks are arrays of toolkit indices """
+        chemical = self.chemical if self.mode == 'chemical' else ('', '')
+        ep.ENsetqualtype(MODES[self.mode], chemical[0], chemical[1], self.trace if self.mode == 'trace' else '')
+
+        for uid, source in self.sources.items():
+            index = ep.ENgetnodeindex(uid)
+            if not isinstance(source, (tuple, list)):
+                source = (source,)
+            ep.ENsetnodevalue(index, epanet2.EN_SOURCETYPE, SOURCE_TYPES[source[1] if len(source) > 1 else 'concen'])
+            ep.ENsetnodevalue(index, epanet2.EN_SOURCEQUAL, source[0])
+            if len(source) > 2:
+                ep.ENsetnodevalue(index, epanet2.EN_SOURCEPAT, ep.ENgetpatternindex(source[2]) if source[2] else 0)
+
+        for values, code, indices, getindex in [
+                (self.bulk, epanet2.EN_KBULK, pipes, ep.ENgetlinkindex),
+                (self.wall, epanet2.EN_KWALL, pipes, ep.ENgetlinkindex)]:
+            if isinstance(values, dict):
+                ep.ENsetlinkvalues([getindex(uid) for uid in values.keys()], code, list(values.values()))
+            elif values is not None:
+                ep.ENsetlinkvalues(indices, code, np.full(len(indices), float(values)))
+        if self.bulk is not None and not isinstance(self.bulk, dict) and len(tanks):
+            ep.ENsetnodevalues(tanks, epanet2.EN_TANK_KBULK, np.full(len(tanks), float(self.bulk)))
+
+        if isinstance(self.initial, dict):
+            ep.ENsetnodevalues([ep.ENgetnodeindex(uid) for uid in self.initial.keys()], epanet2.EN_INITQUAL,
+                               list(self.initial.values()))
+        elif self.initial is not None:
+            count = ep.ENgetcount(epanet2.EN_NODECOUNT)
+            ep.ENsetnodevalues(np.arange(1, count + 1), epanet2.EN_INITQUAL, np.full(count, float(self.initial)))
+
+
+class _Accumulator(object):
+    """ Reduce the quality of elements over the timesteps of a simulation """
+
+    def __init__(self, output):
+        self.output = output
+        self.times = []
+        self.series = []
+        self.values = None
+        self.total = 0
+        self.weights = 0
+
+    def update(self, simtime, values, timestep):
+        """ Add the values at simtime, valid until the next timestep """
+        if self.output == 'series':
+            self.times.append(simtime)
+            self.series.append(values)
+        elif self.values is None or self.output in ('final', 'mean'):
+            self.values = values
+        elif self.output == 'minimum':
+            self.values = np.minimum(self.values, values)
+        else:
+            self.values = np.maximum(self.values, values)
+        if self.output == 'mean':
+            self.total = self.total + values * timestep
+            self.weights += timestep
+
+    def result(self):
+        """ return the times and values of a series, or None and the reduced values """
+        if self.output == 'series':
+            return np.array(self.times, dtype=np.int64), np.array(self.series)
+        if self.output == 'mean' and self.weights:
+            # without timesteps the mean is the only value
+            return None, self.total / self.weights
+        return None, self.values
+
+
+def simulate(network, settings, scenario, recorder, quality_steps=False):
+    """ Run a scenario against the hydraulics file in settings and revert its changes
+
+    Calls recorder.read(ep) for the values at every timestep and then
+    recorder.update(simtime, values, timestep) with the length of the
+    timestep. Timesteps are the hydraulic timesteps, or the shorter water
+    quality timesteps with quality_steps. Used by the analyses that run on
+    a QualityEngine, such as epynet.contamination.
+    """
+    ep = network.ep
+    if network.hydraulics_file != settings['hydraulics']:
+        network.close_hydraulics()
+        ep.ENusehydfile(settings['hydraulics'])
+        network.hydraulics_file = settings['hydraulics']
+
+    journal = ep.journal
+    ep.journal = changes = Journal()
+    try:
+        scenario.apply(ep, settings['pipes'], settings['tanks'])
+        duration = ep.ENgettimeparam(epanet2.EN_DURATION)
+        ep.ENopenQ()
+        try:
+            ep.ENinitQ(epanet2.EN_NOSAVE)
+            running = True
+            while running:
+                ep.ENrunQ()
+                simtime = ep._current_simulation_time.value
+                values = recorder.read(ep)
+                if quality_steps:
+                    # the last step runs until the end of the simulation
+                    left = ep.ENstepQ()
+                    timestep = duration - left - simtime
+                    running = left > 0
+                else:
+                    timestep = ep.ENnextQ()
+                    running = timestep > 0
+                recorder.update(simtime, values, timestep)
+        finally:
+            ep.ENcloseQ()
+    finally:
+        changes.revert(ep)
+        ep.journal = journal
+
+
+class _Recorder(object):
+    """ Records the quality of the nodes and links in settings """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.nodes = _Accumulator(settings['output'])
+        self.links = _Accumulator(settings['output'])
+
+    def read(self, ep):
+        return (ep.ENgetnodevalues(self.settings['nodes'], epanet2.EN_QUALITY),
+                ep.ENgetlinkvalues(self.settings['links'], epanet2.EN_LINKQUAL))
+
+    def update(self, simtime, values, timestep):
+        self.nodes.update(simtime, values[0], timestep)
+        self.links.update(simtime, values[1], timestep)
+
+
+def _run(network, settings, scenario):
+    """ Run a scenario, returns the recorded quality of the nodes and the links """
+    recorder = _Recorder(settings)
+    simulate(network, settings, scenario, recorder)
+    return recorder.nodes.result(), recorder.links.result()
+
+
+def _contribution(network, settings, source):
+    """ Trace a source, returns the times and the float32 share of the water at the nodes """
+    (times, values), _ = _run(network, settings, QualityScenario('trace', trace=source))
+    return times, values.astype(np.float32)
+
+
+class SourceContributions(object):
+    """ Share of the water at nodes that comes from each source, in percent
+
+    values:     float32 array of time x node x source
+    times:      Index of the times in seconds, or of the name of the time
+                aggregation with a single entry
+    nodes:      uids of the nodes
+    sources:    uids of the source nodes
+    """
+
+    def __init__(self, times, nodes, sources, values):
+        self.times = times
+        self.nodes = nodes
+        self.sources = sources
+        self.values = values
+
+    def __repr__(self):
+        return "<epynet.SourceContributions of {count} sources>".format(count=len(self.sources))
+
+    def source(self, uid):
+        """ return a DataFrame of time x node with the share of a source """
+        return pd.DataFrame(self.values[:, :, self.sources.index(uid)], index=self.times, columns=self.nodes)
+
+    def at(self, time=None):
+        """ return a DataFrame of node x source at a time, the last or aggregated one by default """
+        position = -1 if time is None else self.times.get_loc(time)
+        return pd.DataFrame(self.values[position], index=self.nodes, columns=self.sources)
+
+
+class QualityEngine(object):
+    """ Runs water quality scenarios against hydraulics that are solved once
+
+    network:    the network, copied when the engine is created
+    nodes:      uids of the nodes to report, all by default
+    links:      uids of the links to report, all by default
+    cache:      HydraulicsCache to take the hydraulics from, or to add
+                them to when they are not cached (see epynet.cache)
+
+    See the module documentation. The engine keeps its copy of the network
+    and the hydraulics file in a temporary directory until it is closed.
+    """
+
+    def __init__(self, network, nodes=None, links=None, cache=None):
+        self.directory = tempfile.mkdtemp(prefix='epynet')
+        try:
+            inputfile = os.path.join(self.directory, 'network.inp')
+            network.close_hydraulics()
+            network.save_inputfile(inputfile)
+            self.network = network.__class__(inputfile, charset=network.ep.charset)
+
+            ep = self.network.ep
+            self.hydraulics = os.path.join(self.directory, 'network.hyd')
+            if cache is not None:
+                cache.fetch(self.network, self.hydraulics)
+            else:
+                ep.ENsolveH()
+                ep.ENsavehydfile(self.hydraulics)
+        except Exception:
+            shutil.rmtree(self.directory, True)
+            raise
+
+        self.nodes = list(self.network.nodes.uid) if nodes is None else list(nodes)
+        self.links = list(self.network.links.uid) if links is None else list(links)
+        self.settings = {
+            'hydraulics': self.hydraulics,
+            'nodes': np.array([ep.ENgetnodeindex(uid) for uid in self.nodes], dtype=np.int64),
+            'links': np.array([ep.ENgetlinkindex(uid) for uid in self.links], dtype=np.int64),
+            'pipes': np.array([pipe.index for pipe in self.network.pipes], dtype=np.int64),
+            'tanks': np.array([tank.index for tank in self.network.tanks], dtype=np.int64),
+        }
+
+    def _result(self, result):
+        (times, node_values), (_, link_values) = result
+        if times is None:
+            return {'nodes': pd.Series(node_values, index=self.nodes),
+                    'links': pd.Series(link_values, index=self.links)}
+        index = pd.Index(times, name='time')
+        return {'nodes': pd.DataFrame(node_values.reshape(len(times), -1), index=index, columns=self.nodes),
+                'links': pd.DataFrame(link_values.reshape(len(times), -1), index=index, columns=self.links)}
+
+    def run(self, scenario, output='series'):
+        """ Run a scenario, see run_many """
+        return self.run_many([scenario], output)[0]
+
+    def run_many(self, scenarios, output='series', workers=1, chunksize=1):
+        """ Run QualityScenarios and return a list with a dict per scenario
+
+        With output 'series' the dict holds a DataFrame of the quality of
+        the nodes and one of the links (time x uid) at every hydraulic
+        timestep, under 'nodes' and 'links'. With 'final', 'minimum',
+        'maximum' or the time weighted 'mean' they hold a Series per uid.
+        """
+        if output not in OUTPUTS:
+            raise ValueError("Unknown output", output)
+        if self.network is None:
+            raise RuntimeError("Quality engine is closed")
+        settings = dict(self.settings, output=output)
+        tasks = [(settings, scenario) for scenario in scenarios]
+        return [self._result(result) for result in
+                parallel_map(self.network, _run, tasks, workers, chunksize)]
+
+    def source_contributions(self, sources, aggregate=None, workers=1, chunksize=1):
+        """ Trace every source and return the SourceContributions to the nodes
+
+        sources:    uids of the source nodes, such as reservoirs and the
+                    nodes where treatment plants supply the network
+        aggregate:  None to keep every hydraulic timestep, or 'final',
+                    'minimum', 'maximum' or 'mean' to reduce the times
+        """
+        output = 'series' if aggregate is None else aggregate
+        if output not in OUTPUTS:
+            raise ValueError("Unknown aggregation", aggregate)
+        if self.network is None:
+            raise RuntimeError("Quality engine is closed")
+        sources = list(sources)
+        settings = dict(self.settings, output=output)
+        tasks = [(settings, uid) for uid in sources]
+
+        index = pd.Index([], name='time')
+        values = np.empty((0, len(self.nodes), 0), dtype=np.float32)
+        for position, (times, shares) in enumerate(parallel_map(self.network, _contribution, tasks, workers, chunksize)):
+            if position == 0:
+                index = pd.Index([aggregate]) if aggregate is not None else pd.Index(times, name='time')
+                values = np.empty((len(index), len(self.nodes), len(sources)), dtype=np.float32)
+            values[:, :, position] = shares.reshape(len(index), -1)
+        return SourceContributions(index, self.nodes, sources, values)
+
+    def close(self):
+        """ Unload the copy of the network and remove the hydraulics file """
+        if self.network is not None:
+            self.network.ep.ENdeleteproject()
+            self.network = None
+            shutil.rmtree(self.directory, True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
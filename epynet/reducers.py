@@ -0,0 +1,184 @@
+""" EPYNET reducers
+
+Reducers summarise a property of a collection of nodes or links over the
+timesteps of Network.run() without keeping the time series. Values are
+weighted by the length of the hydraulic timestep that follows them.
+
+Example:
+    results = network.run(reducers={'min_pressure': Minimum(network.junctions, 'pressure'),
+                                    'max_velocity': Maximum(network.pipes, 'velocity'),
+                                    'low_pressure': Duration(network.junctions, 'pressure', 20),
+                                    'energy': Sum(network.pumps, 'energy', unit=3600)})
+    results['min_pressure'] # Series indexed by junction uid
+"""
+import numpy as np
+import pandas as pd
+
+from .node import Node
+
+
+class Reducer(object):
+    """ Base class of the reducers
+
+    objects: collection of nodes or links
+    name:    name of the property to reduce
+    """
+
+    def __init__(self, objects, name):
+        self.objects = objects
+        self.name = name
+
+    @property
+    def key(self):
+        """ reducers with the same key read the same values """
+        return (id(self.objects), self.name)
+
+    def start(self, network):
+        """ Resolve the objects to toolkit indices, called at the start of a run """
+        objects = list(self.objects)
+        self.uids = [item.uid for item in objects]
+        self.indices = np.array([item.index for item in objects], dtype=np.int64)
+
+        codes = [item.properties[self.name] for item in objects if self.name in item.properties]
+        if not codes:
+            codes = [item.static_properties[self.name] for item in objects if self.name in item.static_properties]
+        if not codes:
+            raise AttributeError('Nonexistant Attribute', self.name)
+        self.code = codes[0]
+
+        ep = network.ep
+        self.getter = ep.ENgetnodevalues if objects and isinstance(objects[0], Node) else ep.ENgetlinkvalues
+        self.initialize(len(objects))
+
+    def read(self):
+        return self.getter(self.indices, self.code)
+
+    def initialize(self, size):
+        raise NotImplementedError
+
+    def update(self, values, time, duration):
+        raise NotImplementedError
+
+    def value(self):
+        raise NotImplementedError
+
+    def result(self):
+        return pd.Series(self.value(), index=self.uids)
+
+
+class Minimum(Reducer):
+    """ Smallest value over all timesteps """
+
+    def initialize(self, size):
+        self.minimum = np.full(size, np.inf)
+
+    def update(self, values, time, duration):
+        np.minimum(self.minimum, values, out=self.minimum)
+
+    def value(self):
+        return self.minimum
+
+
+class Maximum(Reducer):
+    """ Largest value over all timesteps """
+
+    def initialize(self, size):
+        self.maximum = np.full(size, -np.inf)
+
+    def update(self, values, time, duration):
+        np.maximum(self.maximum, values, out=self.maximum)
+
+    def value(self):
+        return self.maximum
+
+
+class Sum(Reducer):
+    """ Time integral of the values, durations are expressed in unit seconds
+
+    Sum(network.pumps, 'energy', unit=3600) gives the energy use in kWh. """
+
+    def __init__(self, objects, name, unit=1):
+        super(Sum, self).__init__(objects, name)
+        self.unit = unit
+
+    def initialize(self, size):
+        self.total = np.zeros(size)
+
+    def update(self, values, time, duration):
+        self.total += values * (duration / float(self.unit))
+
+    def value(self):
+        return self.total
+
+
+class Mean(Reducer):
+    """ Time weighted mean, the plain mean of the values when the run has no duration """
+
+    def initialize(self, size):
+        self.total = np.zeros(size)
+        self.duration = 0
+        self.plain = np.zeros(size)
+        self.count = 0
+
+    def update(self, values, time, duration):
+        self.total += values * duration
+        self.duration += duration
+        self.plain += values
+        self.count += 1
+
+    def value(self):
+        if self.duration > 0:
+            return self.total / self.duration
+        return self.plain / max(self.count, 1)
+
+
+class Duration(Reducer):
+    """ Time the values spend below (or above) a threshold, in unit seconds """
+
+    def __init__(self, objects, name, threshold, below=True, unit=1):
+        super(Duration, self).__init__(objects, name)
+        self.threshold = threshold
+        self.below = below
+        self.unit = unit
+
+    def initialize(self, size):
+        self.duration = np.zeros(size)
+
+    def update(self, values, time, duration):
+        exceeded = values < self.threshold if self.below else values > self.threshold
+        self.duration += exceeded * (duration / float(self.unit))
+
+    def value(self):
+        return self.duration
+
+
+class ArgMinimum(Reducer):
+    """ Time at which the smallest value occurs first """
+
+    def initialize(self, size):
+        self.minimum = np.full(size, np.inf)
+        self.time = np.zeros(size)
+
+    def update(self, values, time, duration):
+        smaller = values < self.minimum
+        self.minimum[smaller] = values[smaller]
+        self.time[smaller] = time
+
+    def value(self):
+        return self.time
+
+
+class ArgMaximum(Reducer):
+    """ Time at which the largest value occurs first """
+
+    def initialize(self, size):
+        self.maximum = np.full(size, -np.inf)
+        self.time = np.zeros(size)
+
+    def update(self, values, time, duration):
+        larger = values > self.maximum
+        self.maximum[larger] = values[larger]
+        self.time[larger] = time
+
+    def value(self):
+        return self.time
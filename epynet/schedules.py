@@ -0,0 +1,206 @@
+""" EPYNET pump schedule optimisation
+
+Evaluates candidate pump schedules for an optimiser. A schedule gives
+the relative speed of every pump for every pattern step, 0 switches a
+pump off. Schedules are written to speed patterns of the pumps, the
+extended period simulation stops as soon as a hard constraint is
+violated, and duplicate candidates are only simulated once.
+
+Example:
+    problem = ScheduleProblem(network, periods=24, tariff=tariff, min_pressure=20)
+    objectives, constraints = problem.evaluate(population, workers=4)
+    # objectives: cost and energy per candidate
+    # constraints: pressure deficit, tank level violation and final level deficit, feasible when <= 0
+    problem.restore()   # the pumps follow their own speed patterns again
+"""
+import numpy as np
+
+from . import epanet2
+from .energy import EnergyAccount, Tariff
+from .objectcollection import ObjectCollection
+from .parallel import parallel_map
+
+OBJECTIVES = ['cost', 'energy']
+CONSTRAINTS = ['pressure_deficit', 'level_violation', 'final_deficit']
+
+
+def _evaluate(network, settings, candidates):
+    """ Simulate candidate schedules, returns their objectives and constraints """
+    ep = network.ep
+    network.close_hydraulics()
+
+    store = network.pattern_store
+    patterns = settings['patterns']
+    junctions = np.array([ep.ENgetnodeindex(uid) for uid in settings['junctions']], dtype=np.int64)
+    tanks = np.array([ep.ENgetnodeindex(uid) for uid in settings['tanks']], dtype=np.int64)
+    elevations = ep.ENgetnodevalues(tanks, epanet2.EN_ELEVATION)
+    lower, upper = settings['levels']
+
+    pumps = ObjectCollection()
+    for uid in settings['pumps']:
+        pumps[uid] = network.pumps[uid]
+    account = EnergyAccount(pumps, settings['tariff'])
+    account.start(network)
+
+    duration = ep.ENgettimeparam(epanet2.EN_DURATION)
+    ep.ENsettimeparam(epanet2.EN_DURATION, settings['duration'])
+
+    objectives = np.full((len(candidates), len(OBJECTIVES)), np.inf)
+    constraints = np.zeros((len(candidates), len(CONSTRAINTS)))
+    ep.ENopenH()
+    try:
+        for row, schedule in enumerate(candidates):
+            for pattern, speeds in zip(patterns, schedule):
+                store.set(pattern, speeds)
+            ep.ENinitH(0)
+            account.initialize(len(pumps))
+            initial = None
+            simtime = 0
+            timestep = 1
+            violated = False
+
+            while timestep > 0:
+                ep.ENrunH()
+                if len(junctions) and settings['min_pressure'] is not None:
+                    pressure = ep.ENgetnodevalues(junctions, epanet2.EN_PRESSURE)
+                    constraints[row, 0] = max(constraints[row, 0], np.max(settings['min_pressure'] - pressure))
+                if len(tanks):
+                    levels = ep.ENgetnodevalues(tanks, epanet2.EN_HEAD) - elevations
+                    if initial is None:
+                        initial = levels
+                    violation = np.max(np.maximum(lower - levels, levels - upper))
+                    constraints[row, 1] = max(constraints[row, 1], violation)
+                timestep = ep.ENnextH()
+                account.update(account.read(), simtime, timestep)
+                simtime += timestep
+
+                if settings['hard'] and constraints[row, :2].max() > settings['tolerance']:
+                    violated = True
+                    break
+
+            if len(tanks):
+                constraints[row, 2] = np.max(initial - levels) if settings['final_level'] else 0
+            if not violated:
+                result = account.result()
+                objectives[row] = (result['cost'].sum(), result['energy'].sum())
+    finally:
+        ep.ENcloseH()
+        ep.ENsettimeparam(epanet2.EN_DURATION, duration)
+        for pattern, speeds in zip(patterns, settings['initial']):
+            store.set(pattern, speeds)
+
+    return objectives, constraints
+
+
+class ScheduleProblem(object):
+    """ Pump schedules as arrays, evaluated against energy cost and constraints
+
+    network:      the network, every pump gets a speed pattern named
+                  prefix + pump uid with the current schedule, which
+                  replaces its own speed pattern until restore()
+    pumps:        collection of the scheduled pumps, all pumps by default
+    periods:      number of pattern steps in a schedule
+    tariff:       Tariff or flat energy price for the cost objective
+    min_pressure: minimum pressure at the junctions (hard constraint)
+    junctions:    junctions for the pressure constraint, all by default
+    tank_levels:  dict of tank uid to (min, max) level (hard constraint)
+    final_level:  constrain tanks to end at least at their initial level
+    hard:         stop a simulation as soon as the pressure or tank level
+                  constraint is violated, its objectives are then infinite
+
+    Candidates are arrays of shape (candidates, pumps, periods), or
+    (candidates, pumps * periods) as used by most optimisers, with the
+    relative speed of every pump in every period.
+    """
+
+    def __init__(self, network, pumps=None, periods=24, tariff=0, min_pressure=None, junctions=None,
+                 tank_levels=None, final_level=True, hard=True, tolerance=1e-6, prefix='schedule_'):
+
+        self.network = network
+        pumps = list(network.pumps if pumps is None else pumps)
+        self.pumps = [pump.uid for pump in pumps]
+        self.periods = periods
+        self.step = network.ep.ENgettimeparam(epanet2.EN_PATTERNSTEP)
+        self.cache = {}
+
+        # every pump follows its own speed pattern
+        patterns = []
+        self.pump_patterns = [network.ep.ENgetlinkvalue(pump.index, epanet2.EN_LINKPATTERN) for pump in pumps]
+        for pump in pumps:
+            uid = prefix + pump.uid
+            if uid not in network.pattern_store:
+                network.add_pattern(uid, np.full(periods, pump.speed))
+            network.ep.ENsetlinkvalue(pump.index, epanet2.EN_LINKPATTERN, network.pattern_store.index(uid))
+            patterns.append(uid)
+
+        tank_levels = tank_levels or {}
+        tanks = list(tank_levels.keys())
+        if final_level:
+            tanks += [uid for uid in network.tanks.keys() if uid not in tank_levels]
+        bounds = [tank_levels.get(uid, (-np.inf, np.inf)) for uid in tanks]
+
+        self.settings = {'pumps': self.pumps, 'patterns': patterns,
+                         'initial': [network.pattern_store.get(uid) for uid in patterns],
+                         'junctions': list(network.junctions.keys() if junctions is None else
+                                           [junction if isinstance(junction, str) else junction.uid
+                                            for junction in junctions]),
+                         'tanks': tanks,
+                         'levels': (np.array([bound[0] for bound in bounds], dtype=float),
+                                    np.array([bound[1] for bound in bounds], dtype=float)),
+                         'tariff': tariff if isinstance(tariff, Tariff) else Tariff([tariff]),
+                         'min_pressure': min_pressure, 'final_level': final_level, 'hard': hard,
+                         'tolerance': tolerance, 'duration': periods * self.step}
+
+    def restore(self):
+        """ Bind the pumps to the speed patterns they had before, the schedule patterns are kept """
+        ep = self.network.ep
+        self.network.close_hydraulics()
+        for uid, pattern in zip(self.pumps, self.pump_patterns):
+            ep.ENsetlinkvalue(self.network.pumps[uid].index, epanet2.EN_LINKPATTERN, pattern)
+        self.network.reset()
+
+    @property
+    def size(self):
+        """ number of decision variables of a schedule """
+        return len(self.pumps) * self.periods
+
+    def decode(self, candidates):
+        """ return candidates as an array of shape (candidates, pumps, periods) """
+        candidates = np.asarray(candidates, dtype=float)
+        return candidates.reshape(-1, len(self.pumps), self.periods)
+
+    def apply(self, schedule):
+        """ Write a schedule to the speed patterns of the pumps """
+        schedule = self.decode(schedule)[0]
+        for uid, speeds in zip(self.settings['patterns'], schedule):
+            self.network.pattern_store.set(uid, speeds)
+        self.settings['initial'] = [speeds.copy() for speeds in schedule]
+
+    def evaluate(self, candidates, workers=1, chunksize=16):
+        """ return the objectives (cost, energy) and constraints of the candidates as arrays
+
+        Constraints are the largest pressure deficit, the largest tank level
+        violation and the largest shortfall of the final tank levels, a
+        candidate is feasible when all are <= 0. """
+        candidates = self.decode(candidates)
+        keys = [candidate.tobytes() for candidate in candidates]
+
+        # simulate every new candidate once
+        pending = []
+        for key, candidate in zip(keys, candidates):
+            if key not in self.cache:
+                self.cache[key] = None
+                pending.append(candidate)
+        tasks = [(self.settings, np.array(pending[start:start+chunksize]))
+                 for start in range(0, len(pending), chunksize)]
+
+        position = 0
+        for objectives, constraints in parallel_map(self.network, _evaluate, tasks, workers):
+            for row in range(len(objectives)):
+                self.cache[pending[position].tobytes()] = (objectives[row], constraints[row])
+                position += 1
+
+        objectives = np.array([self.cache[key][0] for key in keys]).reshape(-1, len(OBJECTIVES))
+        constraints = np.array([self.cache[key][1] for key in keys]).reshape(-1, len(CONSTRAINTS))
+        self.network.reset()
+        return objectives, constraints
@@ -0,0 +1,107 @@
+""" EPYNET isolation valve segments """
+import numpy as np
+import pandas as pd
+
+from .graph import connected_components
+from .objectcollection import ObjectCollection
+
+
+def valve_pairs(valves):
+    """ Normalise a valve table to a tuple of (pipe uid, node uid) pairs
+
+    The table is either a DataFrame with 'pipe' and 'node' columns or an
+    iterable of (pipe uid, node uid) pairs. """
+    if isinstance(valves, pd.DataFrame):
+        valves = zip(valves['pipe'], valves['node'])
+    return tuple((str(pipe), str(node)) for pipe, node in valves)
+
+
+class Segments(object):
+    """ Isolation segments of a network
+
+    A segment is the set of links and nodes that is cut off from the rest of
+    the network when the isolation valves around it are closed. Every valve
+    sits on a pipe, at the end that connects to the given node.
+    """
+
+    def __init__(self, topology, valves):
+
+        self.topology = topology
+        pairs = valve_pairs(valves)
+
+        node_count = topology.node_count
+        link_count = topology.link_count
+
+        valve_links = np.empty(len(pairs), dtype=np.int64)
+        valve_nodes = np.empty(len(pairs), dtype=np.int64)
+
+        for position, (pipe, node) in enumerate(pairs):
+            if pipe not in topology.link_positions:
+                raise ValueError("Unknown pipe in valve table", pipe)
+            if node not in topology.node_positions:
+                raise ValueError("Unknown node in valve table", node)
+            valve_links[position] = topology.link_positions[pipe]
+            valve_nodes[position] = topology.node_positions[node]
+
+        at_from = valve_nodes == topology.from_nodes[valve_links]
+        at_to = valve_nodes == topology.to_nodes[valve_links]
+
+        if not np.all(at_from | at_to):
+            pipe, node = pairs[np.flatnonzero(~(at_from | at_to))[0]]
+            raise ValueError("Valve node is not an end node of its pipe", pipe, node)
+
+        # a link stays connected to an end node unless a valve sits in between
+        from_open = np.ones(link_count, dtype=bool)
+        to_open = np.ones(link_count, dtype=bool)
+        from_open[valve_links[at_from]] = False
+        to_open[valve_links[at_to]] = False
+
+        # elements are the nodes followed by the links
+        link_elements = node_count + np.arange(link_count)
+        sources = np.concatenate([link_elements[from_open], link_elements[to_open]])
+        targets = np.concatenate([topology.from_nodes[from_open], topology.to_nodes[to_open]])
+
+        labels = connected_components(node_count + link_count, sources, targets)
+
+        self.count = int(labels.max()) + 1 if len(labels) else 0
+        self.node_segments = pd.Series(labels[:node_count], index=topology.node_uids)
+        self.link_segments = pd.Series(labels[node_count:], index=topology.link_uids)
+
+        self.valves = pd.DataFrame({'pipe': [pair[0] for pair in pairs],
+                                    'node': [pair[1] for pair in pairs],
+                                    'pipe_segment': labels[node_count + valve_links],
+                                    'node_segment': labels[valve_nodes]},
+                                   columns=['pipe', 'node', 'pipe_segment', 'node_segment'])
+
+        # segments are adjacent when a valve separates them
+        self.adjacency = dict((segment, set()) for segment in range(self.count))
+        separating = self.valves['pipe_segment'] != self.valves['node_segment']
+        for first, second in zip(self.valves['pipe_segment'][separating], self.valves['node_segment'][separating]):
+            self.adjacency[first].add(second)
+            self.adjacency[second].add(first)
+
+    def nodes(self, segment):
+        """ return the nodes in a segment """
+        nodes = ObjectCollection()
+        for position in np.flatnonzero(self.node_segments.values == segment):
+            node = self.topology.nodes[position]
+            nodes[node.uid] = node
+        return nodes
+
+    def links(self, segment):
+        """ return the links in a segment """
+        links = ObjectCollection()
+        for position in np.flatnonzero(self.link_segments.values == segment):
+            link = self.topology.links[position]
+            links[link.uid] = link
+        return links
+
+    def boundary(self, segment):
+        """ return the valves that have to be closed to isolate a segment """
+        pipe_side = self.valves['pipe_segment'] == segment
+        node_side = self.valves['node_segment'] == segment
+        return self.valves[pipe_side != node_side]
+
+    def isolate(self, link_uid):
+        """ return the valves that have to be closed to isolate a failing link """
+        return self.boundary(self.link_segments[link_uid])
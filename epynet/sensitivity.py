@@ -0,0 +1,272 @@
+""" EPYNET finite difference sensitivities
+
+Computes Jacobians of hydraulic results, such as pressures or flows, with
+respect to groups of parameters, such as the base demands of junctions or
+the roughness of pipes, by forward differences with warm started solves
+spread over worker processes.
+
+Groups that do not influence each other share a solve: reservoirs and
+tanks have a fixed head in a single period solve, so the parts of the
+network between them are independent, and groups in different parts are
+perturbed together. Groups whose perturbation hardly changes the results
+are solved again with larger steps.
+
+Example:
+    analysis = SensitivityAnalysis(network, 'roughness', groups=zones, outputs=['flow', 'pressure'])
+    jacobians = analysis.run(workers=4, threshold=1e-6)
+    jacobians['flow']   # DataFrame of link uid x group
+"""
+import numpy as np
+import pandas as pd
+
+from . import epanet2
+from .graph import connected_components
+from .node import Reservoir, Tank
+from .parallel import parallel_map
+
+# name: (kind, EN_* code, collection of the elements by default)
+PARAMETERS = {'basedemand': ('node', epanet2.EN_BASEDEMAND, 'junctions'),
+              'emitter': ('node', epanet2.EN_EMITTER, 'junctions'),
+              'elevation': ('node', epanet2.EN_ELEVATION, 'junctions'),
+              'roughness': ('link', epanet2.EN_ROUGHNESS, 'pipes'),
+              'diameter': ('link', epanet2.EN_DIAMETER, 'pipes'),
+              'minorloss': ('link', epanet2.EN_MINORLOSS, 'pipes')}
+# name: (kind, EN_* code)
+OUTPUTS = {'pressure': ('node', epanet2.EN_PRESSURE), 'head': ('node', epanet2.EN_HEAD),
+           'demand': ('node', epanet2.EN_DEMAND), 'flow': ('link', epanet2.EN_FLOW),
+           'velocity': ('link', epanet2.EN_VELOCITY), 'headloss': ('link', epanet2.EN_HEADLOSS)}
+
+
+def _read(ep, settings):
+    """ return the outputs of the last solve """
+    values = {}
+    for name in settings['outputs']:
+        kind, code = OUTPUTS[name]
+        if kind == 'node':
+            values[name] = ep.ENgetnodevalues(settings['nodes'], code)
+        else:
+            values[name] = ep.ENgetlinkvalues(settings['links'], code)
+    return values
+
+
+def _perturb(network, settings, colors):
+    """ Solve with the groups of every color perturbed, returns the derivatives per group """
+    ep = network.ep
+    kind, code, _ = PARAMETERS[settings['parameter']]
+    getter, setter = (ep.ENgetnodevalues, ep.ENsetnodevalues) if kind == 'node' else \
+        (ep.ENgetlinkvalues, ep.ENsetlinkvalues)
+    members, labels = settings['members'], settings['labels']
+    threshold = settings['threshold']
+
+    accuracy = ep.ENgetoption(epanet2.EN_ACCURACY)
+    if settings['accuracy'] is not None:
+        ep.ENsetoption(epanet2.EN_ACCURACY, settings['accuracy'])
+    try:
+        network.solve_hydraulics(settings['simtime'], warm=True)
+        baseline = _read(ep, settings)
+
+        results = []
+        for groups, steps in colors:
+            indices = np.concatenate([members[group] for group in groups])
+            original = getter(indices, code)
+            setter(indices, code, original + np.repeat(steps, [len(members[group]) for group in groups]))
+            try:
+                network.solve_hydraulics(settings['simtime'], warm=True)
+                values = _read(ep, settings)
+            except epanet2.ENtoolkitError:
+                values = None
+                network.close_hydraulics()
+            finally:
+                setter(indices, code, original)
+
+            # only the rows in the part of the network of a group change
+            owners = np.full(settings['label_count'], -1, dtype=np.int64)
+            for position, group in enumerate(groups):
+                owners[labels[group]] = position
+            rows = {}
+            for name in settings['outputs']:
+                row_owners = owners[settings['rows'][name]]
+                order = np.argsort(row_owners, kind='stable')
+                bounds = np.searchsorted(row_owners[order], np.arange(len(groups) + 1))
+                rows[name] = [order[bounds[position]:bounds[position + 1]] for position in range(len(groups))]
+
+            for position, (group, step) in enumerate(zip(groups, steps)):
+                derivatives = {}
+                change = 0.0
+                for name in settings['outputs']:
+                    positions = rows[name][position]
+                    if values is None:
+                        derivative = np.full(len(positions), np.nan)
+                    else:
+                        difference = values[name][positions] - baseline[name][positions]
+                        change = max(change, np.abs(difference).max() if len(difference) else 0)
+                        derivative = difference / step
+                    if threshold is not None:
+                        keep = ~(np.abs(derivative) <= threshold)
+                        positions, derivative = positions[keep], derivative[keep]
+                    derivatives[name] = (positions, derivative)
+                results.append((group, step, change, derivatives))
+    finally:
+        ep.ENsetoption(epanet2.EN_ACCURACY, accuracy)
+    return results
+
+
+def _color(labels, groups):
+    """ Assign colors to groups so groups of the same color have no labels in common """
+    colors = []
+    used = []
+    for group in groups:
+        group_labels = set(labels[group].tolist())
+        for color, color_labels in enumerate(used):
+            if not color_labels & group_labels:
+                colors[color].append(group)
+                color_labels |= group_labels
+                break
+        else:
+            colors.append([group])
+            used.append(group_labels)
+    return colors
+
+
+class SensitivityAnalysis(object):
+    """ Jacobians of hydraulic results with respect to groups of parameters
+
+    network:        the network
+    parameter:      one of PARAMETERS
+    groups:         uids of the elements, each its own group, a dict of
+                    group name: uids or a Series of uid: group name, by
+                    default every junction or pipe is its own group
+    outputs:        names of the results, see OUTPUTS
+    nodes:          uids of the nodes of the node results, all junctions by default
+    links:          uids of the links of the link results, all links by default
+    simtime:        pattern time in seconds of the solve
+    relative_step:  step relative to the mean absolute parameter value of
+                    the group, or of all elements when that is zero
+    min_change:     largest change of the results below which a group is
+                    solved again with a ten times larger step
+    max_step:       relative step above which the step is not enlarged
+    accuracy:       hydraulic accuracy during the solves, the accuracy of
+                    the network by default
+
+    The parameters of all elements in a group are changed by the same
+    step, the derivatives are per unit of the parameter. The number of
+    solves of the last run is kept in solves, and its steps per group in
+    used_steps.
+    """
+
+    def __init__(self, network, parameter, groups=None, outputs=('pressure',), nodes=None, links=None,
+                 simtime=0, relative_step=1e-2, min_change=1e-6, max_step=1.0, accuracy=None):
+        if parameter not in PARAMETERS:
+            raise ValueError("Unknown parameter", parameter)
+        for name in outputs:
+            if name not in OUTPUTS:
+                raise ValueError("Unknown output", name)
+        self.network = network
+        self.parameter = parameter
+        self.outputs = list(outputs)
+        self.simtime = simtime
+        self.relative_step = relative_step
+        self.min_change = min_change
+        self.max_step = max_step
+        self.accuracy = accuracy
+        self.solves = 0
+
+        kind, code, collection = PARAMETERS[parameter]
+        elements = getattr(network, collection)
+        if groups is None:
+            groups = list(elements.keys())
+        if isinstance(groups, pd.Series):
+            groups = dict((name, list(uids)) for name, uids in groups.groupby(groups).groups.items())
+        elif not isinstance(groups, dict):
+            groups = dict((uid, [uid]) for uid in groups)
+        self.groups = list(groups.keys())
+
+        topology = network.topology
+        self.nodes = list(network.junctions.keys()) if nodes is None else list(nodes)
+        self.links = list(network.links.keys()) if links is None else list(links)
+        node_labels, link_labels = self._labels(topology)
+        positions = topology.node_positions if kind == 'node' else topology.link_positions
+        element_labels = node_labels if kind == 'node' else link_labels
+        indices = topology.node_indices if kind == 'node' else topology.link_indices
+
+        members = [np.array([positions[uid] for uid in groups[name]], dtype=np.int64) for name in self.groups]
+        values = (network.ep.ENgetnodevalues if kind == 'node' else network.ep.ENgetlinkvalues)(indices, code)
+        scale = np.abs(values).mean() if len(values) and np.abs(values).mean() > 0 else 1.0
+        self.steps = np.array([np.abs(values[group]).mean() if len(group) else 0 for group in members])
+        self.steps = relative_step * np.where(self.steps > 0, self.steps, scale)
+        self.scales = self.steps / relative_step
+
+        node_rows = node_labels[[topology.node_positions[uid] for uid in self.nodes]]
+        link_rows = link_labels[[topology.link_positions[uid] for uid in self.links]]
+        self.settings = {
+            'parameter': parameter, 'outputs': self.outputs, 'simtime': simtime, 'accuracy': accuracy,
+            'members': [indices[group] for group in members],
+            'labels': [np.unique(element_labels[group]) for group in members],
+            'label_count': topology.node_count,
+            'nodes': topology.node_indices[[topology.node_positions[uid] for uid in self.nodes]],
+            'links': topology.link_indices[[topology.link_positions[uid] for uid in self.links]],
+            'rows': dict((name, node_rows if OUTPUTS[name][0] == 'node' else link_rows) for name in self.outputs),
+        }
+
+    def _labels(self, topology):
+        """ return the part of the network of every node and link
+
+        Links to reservoirs and tanks do not connect parts, as their head
+        is fixed, unless the demand of reservoirs and tanks is an output. """
+        fixed = np.array([isinstance(node, (Reservoir, Tank)) for node in topology.nodes])
+        sources, targets = topology.from_nodes, topology.to_nodes
+        if 'demand' not in self.outputs:
+            connecting = ~(fixed[sources] | fixed[targets])
+            sources, targets = sources[connecting], targets[connecting]
+        node_labels = connected_components(topology.node_count, sources, targets)
+        # a link belongs to the part of a node without fixed head
+        link_labels = np.where(fixed[topology.from_nodes], node_labels[topology.to_nodes],
+                               node_labels[topology.from_nodes])
+        return node_labels, link_labels
+
+    @property
+    def colors(self):
+        """ return the number of solves that perturb all groups once """
+        return len(_color(self.settings['labels'], range(len(self.groups))))
+
+    def run(self, workers=1, threshold=None, chunksize=16):
+        """ Compute the Jacobians, returns a dict of output name: DataFrame of element uid x group
+
+        With a threshold the DataFrames are sparse and only keep the
+        derivatives whose absolute value exceeds it. Groups that fail to
+        solve have NaN derivatives. """
+        settings = dict(self.settings, threshold=threshold)
+        steps = self.steps.copy()
+        pending = list(range(len(self.groups)))
+        derivatives = [None] * len(self.groups)
+        self.solves = 0
+
+        try:
+            while pending:
+                colors = [(groups, steps[groups]) for groups in _color(settings['labels'], pending)]
+                tasks = [(settings, colors[start:start+chunksize]) for start in range(0, len(colors), chunksize)]
+                self.solves += len(colors) + len(tasks)
+                pending = []
+                for results in parallel_map(self.network, _perturb, tasks, workers):
+                    for group, step, change, group_derivatives in results:
+                        derivatives[group] = group_derivatives
+                        # changes within the solver accuracy give no useful derivative
+                        if change < self.min_change and step * 10 <= self.max_step * self.scales[group] * (1 + 1e-9):
+                            steps[group] = step * 10
+                            pending.append(group)
+        finally:
+            self.network.close_hydraulics()
+            self.network.reset()
+        self.used_steps = pd.Series(steps, index=self.groups)
+
+        jacobians = {}
+        for name in self.outputs:
+            uids = self.nodes if OUTPUTS[name][0] == 'node' else self.links
+            columns = {}
+            for group, group_derivatives in zip(self.groups, derivatives):
+                positions, values = group_derivatives[name]
+                column = np.zeros(len(uids))
+                column[positions] = values
+                columns[group] = column if threshold is None else pd.arrays.SparseArray(column, fill_value=0.0)
+            jacobians[name] = pd.DataFrame(columns, index=uids, columns=self.groups)
+        return jacobians
@@ -0,0 +1,187 @@
+""" EPYNET real-time hydraulic sessions
+
+A session keeps the hydraulic solver of a network open for operational
+use, as in a digital twin: boundary conditions measured in the field are
+written in bulk between steps and the simulation advances by arbitrary
+time deltas, with EPANET integrating the tank levels in between. Zone
+inflows are best modelled as flow control valves, whose settings are
+updated like those of any other valve.
+
+Example:
+    with network.session(start=8 * 3600) as session:
+        session.update(tank_levels={'T1': 3.2}, pump_status={'P1': 0}, pump_speeds={'P2': 0.9})
+        state = session.advance(60)
+        state['pressure']   # array in the order of session.node_uids
+"""
+import numpy as np
+
+from . import epanet2
+
+NODE_STATE = {'head': epanet2.EN_HEAD, 'pressure': epanet2.EN_PRESSURE, 'demand': epanet2.EN_DEMAND}
+LINK_STATE = {'flow': epanet2.EN_FLOW, 'velocity': epanet2.EN_VELOCITY,
+              'status': epanet2.EN_STATUS, 'setting': epanet2.EN_SETTING}
+
+# the session never reaches the end of the simulation
+DURATION = 2 ** 31 - 1
+# link values of the solver state, other values written by updates are input data
+TRANSIENT = (epanet2.EN_STATUS, epanet2.EN_SETTING)
+
+
+class HydraulicSession(object):
+    """ Open ended simulation that accepts boundary conditions between steps
+
+    network:          the network, its hydraulic solver belongs to the
+                      session until it is closed
+    start:            time of day in seconds at which the patterns start
+    node_properties:  dict of name: EN_* code of the node state, see NODE_STATE
+    link_properties:  dict of name: EN_* code of the link state, see LINK_STATE
+
+    Updates are applied at the current time: the network is solved again
+    before the next advance or state. Simple controls, rules and speed
+    patterns still act on the network and may override updated values.
+    Input data changed by updates, such as tank levels and base demands,
+    is restored when the session is closed.
+    """
+
+    def __init__(self, network, start=0, node_properties=None, link_properties=None):
+        self.network = network
+        self.start = start
+        self.node_properties = NODE_STATE if node_properties is None else node_properties
+        self.link_properties = LINK_STATE if link_properties is None else link_properties
+
+        ep = network.ep
+        self.node_uids = [ep.ENgetnodeid(index) for index in range(1, ep.ENgetcount(epanet2.EN_NODECOUNT) + 1)]
+        self.link_uids = [ep.ENgetlinkid(index) for index in range(1, ep.ENgetcount(epanet2.EN_LINKCOUNT) + 1)]
+        self.node_indices = np.arange(1, len(self.node_uids) + 1, dtype=np.int64)
+        self.link_indices = np.arange(1, len(self.link_uids) + 1, dtype=np.int64)
+        self._node_positions = dict(zip(self.node_uids, self.node_indices.tolist()))
+        self._link_positions = dict(zip(self.link_uids, self.link_indices.tolist()))
+
+        self.time = None
+        self.warning = None
+        self.stale = False
+        self._parameters = None
+        # (kind, EN_* code): {index: original value} of the input data changed by updates
+        self._originals = {}
+
+    @property
+    def is_open(self):
+        return self._parameters is not None
+
+    def open(self):
+        """ Open the solver and solve the network at the start time """
+        if self.is_open:
+            return
+        network = self.network
+        ep = network.ep
+        network.close_hydraulics()
+        network.reset()
+
+        # hydraulic step first, setting it also limits the quality step
+        codes = [epanet2.EN_DURATION, epanet2.EN_HYDSTEP, epanet2.EN_QUALSTEP, epanet2.EN_PATTERNSTART]
+        self._parameters = [(code, ep.ENgettimeparam(code)) for code in codes]
+        ep.ENsettimeparam(epanet2.EN_DURATION, DURATION)
+        ep.ENsettimeparam(epanet2.EN_PATTERNSTART, self.start)
+
+        network.open_hydraulics()
+        ep.ENinitH(0)
+        self.time = self.start
+        self.warning = ep.ENrunH()
+        self.stale = False
+
+    def close(self):
+        """ Close the solver and restore the time parameters and the input data of the network """
+        if not self.is_open:
+            return
+        network = self.network
+        network.close_hydraulics()
+        for code, value in self._parameters:
+            network.ep.ENsettimeparam(code, value)
+        for (kind, code), originals in self._originals.items():
+            setter = network.ep.ENsetnodevalues if kind == 'node' else network.ep.ENsetlinkvalues
+            setter(list(originals.keys()), code, list(originals.values()))
+        self._parameters = None
+        self._originals = {}
+        network.reset()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _record(self, kind, code, indices):
+        """ Keep the original values of input data before it is first changed """
+        if kind == 'link' and code in TRANSIENT:
+            return
+        originals = self._originals.setdefault((kind, code), {})
+        new = [index for index in indices if index not in originals]
+        if new:
+            getter = self.network.ep.ENgetnodevalues if kind == 'node' else self.network.ep.ENgetlinkvalues
+            originals.update(zip(new, getter(new, code).tolist()))
+
+    def set_nodes(self, code, values):
+        """ Set an EN_* property of nodes from a dict or Series of uid: value """
+        indices = [self._node_positions[uid] for uid in values.keys()]
+        self._record('node', code, indices)
+        self.network.ep.ENsetnodevalues(indices, code, list(values.values()) if isinstance(values, dict) else values.values)
+        self.stale = True
+
+    def set_links(self, code, values):
+        """ Set an EN_* property of links from a dict or Series of uid: value """
+        indices = [self._link_positions[uid] for uid in values.keys()]
+        self._record('link', code, indices)
+        self.network.ep.ENsetlinkvalues(indices, code, list(values.values()) if isinstance(values, dict) else values.values)
+        self.stale = True
+
+    def update(self, tank_levels=None, pump_status=None, pump_speeds=None, valve_settings=None,
+               valve_status=None, demands=None):
+        """ Apply measured boundary conditions, each a dict or Series of uid: value
+
+        Statuses are 0 (closed) or 1 (open), demands are base demands. """
+        if not self.is_open:
+            raise RuntimeError("Session is not open")
+        updates = [(self.set_nodes, epanet2.EN_TANKLEVEL, tank_levels),
+                   (self.set_links, epanet2.EN_STATUS, pump_status),
+                   (self.set_links, epanet2.EN_SETTING, pump_speeds),
+                   (self.set_links, epanet2.EN_SETTING, valve_settings),
+                   (self.set_links, epanet2.EN_STATUS, valve_status),
+                   (self.set_nodes, epanet2.EN_BASEDEMAND, demands)]
+        for method, code, values in updates:
+            if values is not None and len(values):
+                method(code, values)
+
+    def solve(self):
+        """ Solve the network at the current time if it was updated """
+        if self.stale:
+            self.warning = self.network.ep.ENrunH()
+            self.stale = False
+
+    def advance(self, delta):
+        """ Advance the simulation by delta seconds and return the state """
+        if not self.is_open:
+            raise RuntimeError("Session is not open")
+        ep = self.network.ep
+        self.solve()
+        target = self.time + delta
+        while self.time < target:
+            # EPANET shortens the step at pattern, report and control times
+            ep.ENsettimeparam(epanet2.EN_HYDSTEP, target - self.time)
+            step = ep.ENnextH()
+            if step <= 0:
+                break
+            self.time += step
+            self.warning = ep.ENrunH()
+        return self.state()
+
+    def state(self):
+        """ return a dict of name: array with the state of every node and link in index order """
+        self.solve()
+        ep = self.network.ep
+        state = {}
+        for name, code in self.node_properties.items():
+            state[name] = ep.ENgetnodevalues(self.node_indices, code)
+        for name, code in self.link_properties.items():
+            state[name] = ep.ENgetlinkvalues(self.link_indices, code)
+        return state
@@ -0,0 +1,188 @@
+""" EPYNET snapshots
+
+A snapshot keeps the input data of a network in arrays: the static
+properties of the nodes, tanks and links, the head curves and patterns of
+the pumps, the time patterns, curves, simple controls, time parameters
+and options. Restoring a snapshot only writes back the values that
+differ.
+
+Taking a snapshot attaches a journal (see epynet.journal) to the network
+when it has none, so restoring only compares the data that was written
+since. Without that journal, for example after it was replaced, the
+whole network is compared. Quality sources and rules are not part of a
+snapshot, and neither is the structure of the network: restoring raises
+ValueError when nodes, links, patterns, curves or controls were added or
+deleted.
+
+Example:
+    snapshot = network.snapshot()
+    network.pipes.diameter = 300
+    network.restore(snapshot)   # number of values written back
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+from . import epanet2
+from .journal import Journal
+
+NODE_CODES = [epanet2.EN_ELEVATION, epanet2.EN_BASEDEMAND, epanet2.EN_PATTERN, epanet2.EN_EMITTER,
+              epanet2.EN_INITQUAL]
+# in the order they are restored, the initial level last
+TANK_CODES = [epanet2.EN_TANKDIAM, epanet2.EN_MINLEVEL, epanet2.EN_MAXLEVEL, epanet2.EN_MINVOLUME,
+              epanet2.EN_VOLCURVE, epanet2.EN_MIXMODEL, epanet2.EN_MIXFRACTION, epanet2.EN_TANK_KBULK,
+              epanet2.EN_TANKLEVEL]
+LINK_CODES = [epanet2.EN_DIAMETER, epanet2.EN_LENGTH, epanet2.EN_ROUGHNESS, epanet2.EN_MINORLOSS,
+              epanet2.EN_INITSTATUS, epanet2.EN_INITSETTING, epanet2.EN_KBULK, epanet2.EN_KWALL]
+PUMP_CODES = [epanet2.EN_LINKPATTERN]
+# steps that limit other steps first
+TIME_CODES = [epanet2.EN_DURATION, epanet2.EN_PATTERNSTEP, epanet2.EN_PATTERNSTART, epanet2.EN_REPORTSTEP,
+              epanet2.EN_REPORTSTART, epanet2.EN_RULESTEP, epanet2.EN_HYDSTEP, epanet2.EN_QUALSTEP,
+              epanet2.EN_STATISTIC]
+OPTION_CODES = [epanet2.EN_TRIALS, epanet2.EN_ACCURACY, epanet2.EN_TOLERANCE, epanet2.EN_EMITEXPON,
+                epanet2.EN_DEMANDMULT]
+COUNT_CODES = [epanet2.EN_NODECOUNT, epanet2.EN_LINKCOUNT, epanet2.EN_PATCOUNT, epanet2.EN_CURVECOUNT,
+               epanet2.EN_CONTROLCOUNT]
+
+
+def _ragged(arrays, width):
+    """ return arrays concatenated and the offsets of their starts """
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(array) for array in arrays])
+    values = np.concatenate(arrays) if arrays else np.zeros((0,) + width)
+    return values.reshape((-1,) + width), offsets
+
+
+class Snapshot(object):
+    """ Input data of a network at one moment, see the module documentation
+
+    nodes and links are dicts of EN_* code: (indices, values) arrays.
+    """
+
+    def __init__(self, network):
+        ep = network.ep
+        self.counts = [ep.ENgetcount(code) for code in COUNT_CODES]
+        node_count, link_count, pattern_count, curve_count, control_count = self.counts
+
+        nodes = np.arange(1, node_count + 1, dtype=np.int64)
+        links = np.arange(1, link_count + 1, dtype=np.int64)
+        tanks = np.array([index for index in nodes.tolist() if ep.ENgetnodetype(index) == epanet2.EN_TANK], dtype=np.int64)
+        link_types = np.array([ep.ENgetlinktype(index) for index in links.tolist()], dtype=np.int64)
+        self.pumps = links[link_types == epanet2.EN_PUMP]
+
+        self.nodes = OrderedDict()
+        for code in NODE_CODES:
+            self.nodes[code] = (nodes, ep.ENgetnodevalues(nodes, code))
+        for code in TANK_CODES:
+            self.nodes[code] = (tanks, ep.ENgetnodevalues(tanks, code))
+        self.links = OrderedDict()
+        for code in LINK_CODES:
+            self.links[code] = (links, ep.ENgetlinkvalues(links, code))
+        for code in PUMP_CODES:
+            self.links[code] = (self.pumps, ep.ENgetlinkvalues(self.pumps, code))
+        self.head_curves = np.array([ep.ENgetheadcurveindex(index) for index in self.pumps.tolist()], dtype=np.int64)
+
+        self.patterns, self.pattern_offsets = _ragged([ep.ENgetpattern(index) for index in range(1, pattern_count + 1)], ())
+        self.curves, self.curve_offsets = _ragged([ep.ENgetcurvepoints(index) for index in range(1, curve_count + 1)], (2,))
+        self.controls = np.array([ep.ENgetcontrol(index) for index in range(1, control_count + 1)], dtype=float).reshape(-1, 5)
+        self.times = np.array([ep.ENgettimeparam(code) for code in TIME_CODES], dtype=np.int64)
+        self.options = np.array([ep.ENgetoption(code) for code in OPTION_CODES], dtype=float)
+
+        if ep.journal is None:
+            ep.journal = Journal()
+        self.journal = ep.journal
+
+    def pattern(self, index):
+        """ return the factors of a pattern by toolkit index """
+        return self.patterns[self.pattern_offsets[index - 1]:self.pattern_offsets[index]]
+
+    def curve(self, index):
+        """ return the points of a curve by toolkit index """
+        return self.curves[self.curve_offsets[index - 1]:self.curve_offsets[index]]
+
+    def _touched(self, journal):
+        """ return the toolkit indices per (kind, code) that were written, or None for all """
+        if journal is not self.journal or journal.irreversible:
+            return None
+        touched = {}
+        for kind, code, index in journal.originals.keys():
+            touched.setdefault((kind, code), []).append(index)
+        return touched
+
+    def _candidates(self, touched, key, indices):
+        """ return the positions in indices to compare """
+        if touched is None:
+            return np.arange(len(indices))
+        written = np.unique(np.array(touched.get(key, []), dtype=np.int64))
+        positions = np.searchsorted(indices, written)
+        valid = positions < len(indices)
+        positions, written = positions[valid], written[valid]
+        return positions[indices[positions] == written]
+
+    def restore(self, network):
+        """ Write back the values that differ from the snapshot, returns their number """
+        ep = network.ep
+        if [ep.ENgetcount(code) for code in COUNT_CODES] != self.counts:
+            raise ValueError("The structure of the network changed since the snapshot")
+        network.close_hydraulics()
+        touched = self._touched(ep.journal)
+        restored = 0
+
+        for kind, values, getter, setter, collection, uid in [
+                ('node', self.nodes, ep.ENgetnodevalues, ep.ENsetnodevalues, network.nodes, ep.ENgetnodeid),
+                ('link', self.links, ep.ENgetlinkvalues, ep.ENsetlinkvalues, network.links, ep.ENgetlinkid)]:
+            for code, (indices, original) in values.items():
+                positions = self._candidates(touched, (kind, code), indices)
+                if not len(positions):
+                    continue
+                differ = positions[getter(indices[positions], code) != original[positions]]
+                if len(differ):
+                    setter(indices[differ], code, original[differ])
+                    restored += len(differ)
+                    # like setting a property, only the restored objects forget their cached value
+                    for index in indices[differ].tolist():
+                        collection[uid(index)]._values.pop(code, None)
+
+        positions = self._candidates(touched, ('headcurve', None), self.pumps)
+        for position in positions.tolist():
+            if ep.ENgetheadcurveindex(int(self.pumps[position])) != self.head_curves[position]:
+                ep.ENsetheadcurveindex(int(self.pumps[position]), int(self.head_curves[position]))
+                restored += 1
+
+        patterns = range(1, self.counts[2] + 1) if touched is None else sorted(set(touched.get(('pattern', None), [])))
+        for index in patterns:
+            current, original = ep.ENgetpattern(index), self.pattern(index)
+            if len(current) != len(original) or np.any(current != original):
+                ep.ENsetpattern(index, original)
+                restored += 1
+                network._pattern_store = None
+
+        curves = range(1, self.counts[3] + 1) if touched is None else sorted(set(touched.get(('curve', None), [])))
+        for index in curves:
+            current, original = ep.ENgetcurvepoints(index), self.curve(index)
+            if current.shape != original.shape or np.any(current != original):
+                ep.ENsetcurve(index, original)
+                restored += 1
+                network._curve_store = None
+        if touched is None or ('headcurve', None) in touched:
+            network._curve_store = None
+
+        controls = range(1, self.counts[4] + 1) if touched is None else sorted(set(touched.get(('control', None), [])))
+        for index in controls:
+            original = self.controls[index - 1]
+            if np.any(np.array(ep.ENgetcontrol(index), dtype=float) != original):
+                ctype, link, setting, node, level = original.tolist()
+                ep.ENsetcontrol(index, int(ctype), int(link), setting, int(node), level)
+                restored += 1
+
+        for kind, codes, originals, getter, setter in [('time', TIME_CODES, self.times, ep.ENgettimeparam, ep.ENsettimeparam),
+                                                       ('option', OPTION_CODES, self.options, ep.ENgetoption, ep.ENsetoption)]:
+            for code, original in zip(codes, originals.tolist()):
+                if touched is not None and (kind, code) not in touched:
+                    continue
+                if getter(code) != original:
+                    setter(code, original)
+                    restored += 1
+
+        network.solved = False
+        return restored
@@ -0,0 +1,529 @@
+""" EPYNET spatial index
+
+Nearest node, nearest link and region queries on the coordinates of a
+network. Node coordinates are held in a KD-tree and link segments
+(including vertices) in an R-tree packed with Sort-Tile-Recursive.
+
+Both trees are static. Nodes and links added after the trees were built
+are kept in a small buffer that is searched exhaustively and removed
+objects are masked out, the trees are rebuilt once the buffer and the
+removed objects make up a given fraction of the index.
+
+Example:
+    index = network.spatial_index
+    index.nearest_nodes(meters[['x', 'y']])     # DataFrame with node and distance per meter
+    index.nearest_links([(2500, 5800)])          # link, distance, offset along the link
+    index.nodes_in_polygon([(0, 0), (100, 0), (100, 100)])  # ObjectCollection
+"""
+import heapq
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from . import geometry
+from .objectcollection import ObjectCollection
+
+
+def _box_distance(lower, upper, point):
+    """ squared distance from a point to boxes given by their lower and upper corners """
+    delta = np.maximum(np.maximum(lower - point, point - upper), 0)
+    return (delta ** 2).sum(axis=-1)
+
+
+def _segment_projection(segments, point):
+    """ return the distance from a point to segments and the position of its projection along them """
+    start = segments[:, 0:2]
+    direction = segments[:, 2:4] - start
+    length2 = (direction ** 2).sum(axis=1)
+    fraction = ((point - start) * direction).sum(axis=1) / np.where(length2 > 0, length2, 1)
+    np.clip(fraction, 0, 1, out=fraction)
+    projection = start + fraction[:, None] * direction
+    return np.sqrt(((point - projection) ** 2).sum(axis=1)), fraction
+
+
+def _points_in_polygon(points, polygon):
+    """ even-odd test of points against a polygon """
+    inside = np.zeros(len(points), dtype=bool)
+    x, y = points[:, 0], points[:, 1]
+    for (x0, y0), (x1, y1) in zip(polygon, np.roll(polygon, -1, axis=0)):
+        crossing = (y0 > y) != (y1 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            intersect = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+        inside ^= crossing & (x < intersect)
+    return inside
+
+
+def _segments_cross(segments, x0, y0, x1, y1):
+    """ test segments for intersection with the segment (x0, y0)-(x1, y1), touching counts """
+    ax, ay, bx, by = segments[:, 0], segments[:, 1], segments[:, 2], segments[:, 3]
+
+    def orientation(px, py, qx, qy, rx, ry):
+        return np.sign((qx - px) * (ry - py) - (qy - py) * (rx - px))
+
+    o1 = orientation(ax, ay, bx, by, x0, y0)
+    o2 = orientation(ax, ay, bx, by, x1, y1)
+    o3 = orientation(x0, y0, x1, y1, ax, ay)
+    o4 = orientation(x0, y0, x1, y1, bx, by)
+    # bounding boxes have to overlap for collinear segments
+    overlap = ((np.minimum(ax, bx) <= max(x0, x1)) & (min(x0, x1) <= np.maximum(ax, bx)) &
+               (np.minimum(ay, by) <= max(y0, y1)) & (min(y0, y1) <= np.maximum(ay, by)))
+    return (o1 * o2 <= 0) & (o3 * o4 <= 0) & overlap
+
+
+def _segments_in_polygon(segments, polygon):
+    """ test segments for intersection with a polygon """
+    result = _points_in_polygon(segments[:, 0:2], polygon) | _points_in_polygon(segments[:, 2:4], polygon)
+    for (x0, y0), (x1, y1) in zip(polygon, np.roll(polygon, -1, axis=0)):
+        result |= _segments_cross(segments, x0, y0, x1, y1)
+    return result
+
+
+def _box_polygon(bbox):
+    xmin, ymin, xmax, ymax = bbox
+    return np.array([(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)], dtype=float)
+
+
+class KDTree(object):
+    """ KD-tree over an (n, 2) array of points
+
+    Every tree node keeps the bounding box of its points, which are
+    order[start:end]. Inner nodes are split at the median of their widest
+    dimension.
+    """
+
+    def __init__(self, points, leafsize=16):
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.order = np.arange(len(self.points))
+        self.leafsize = leafsize
+
+        lower, upper, start, end, left, right = [], [], [], [], [], []
+
+        def create(first, last):
+            subset = self.points[self.order[first:last]]
+            lower.append(subset.min(axis=0))
+            upper.append(subset.max(axis=0))
+            start.append(first)
+            end.append(last)
+            left.append(-1)
+            right.append(-1)
+            return len(start) - 1
+
+        if len(self.points):
+            stack = [create(0, len(self.points))]
+            while stack:
+                node = stack.pop()
+                first, last = start[node], end[node]
+                if last - first <= leafsize:
+                    continue
+                dimension = np.argmax(upper[node] - lower[node])
+                middle = (first + last) // 2
+                subset = self.order[first:last]
+                self.order[first:last] = subset[np.argpartition(self.points[subset, dimension], middle - first)]
+                left[node] = create(first, middle)
+                right[node] = create(middle, last)
+                stack.extend([left[node], right[node]])
+
+        self.lower = np.array(lower).reshape(-1, 2)
+        self.upper = np.array(upper).reshape(-1, 2)
+        self.start = start
+        self.end = end
+        self.left = left
+        self.right = right
+
+    def __len__(self):
+        return len(self.points)
+
+    def query(self, point, k=1, mask=None):
+        """ return the squared distances and positions of the k points nearest to a point
+
+        mask: optional boolean array, points where it is False are skipped.
+        Missing neighbours have an infinite distance and position -1. """
+        point = np.asarray(point, dtype=float)
+        distances = np.full(k, np.inf)
+        positions = np.full(k, -1, dtype=np.int64)
+        if not len(self.points):
+            return distances, positions
+
+        heap = [(0.0, 0)]
+        while heap:
+            bound, node = heapq.heappop(heap)
+            if bound > distances[-1]:
+                break
+            if self.left[node] == -1:
+                candidates = self.order[self.start[node]:self.end[node]]
+                if mask is not None:
+                    candidates = candidates[mask[candidates]]
+                squared = ((self.points[candidates] - point) ** 2).sum(axis=1)
+                merged = np.concatenate([distances, squared])
+                order = np.argsort(merged, kind='stable')[:k]
+                positions = np.concatenate([positions, candidates])[order]
+                distances = merged[order]
+                continue
+            for child in (self.left[node], self.right[node]):
+                bound = _box_distance(self.lower[child], self.upper[child], point)
+                if bound <= distances[-1]:
+                    heapq.heappush(heap, (bound, child))
+        return distances, positions
+
+    def query_box(self, bbox):
+        """ return the positions of the points inside a bounding box """
+        if not len(self.points):
+            return np.zeros(0, dtype=np.int64)
+        lower = np.array(bbox[:2], dtype=float)
+        upper = np.array(bbox[2:], dtype=float)
+        found = []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if np.any(self.lower[node] > upper) or np.any(self.upper[node] < lower):
+                continue
+            candidates = self.order[self.start[node]:self.end[node]]
+            if np.all(self.lower[node] >= lower) and np.all(self.upper[node] <= upper):
+                found.append(candidates)
+            elif self.left[node] == -1:
+                points = self.points[candidates]
+                found.append(candidates[np.all((points >= lower) & (points <= upper), axis=1)])
+            else:
+                stack.extend([self.left[node], self.right[node]])
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate(found))
+
+
+def _str_order(boxes, capacity):
+    """ Sort-Tile-Recursive order of boxes: vertical slices by x, sorted by y within a slice """
+    count = len(boxes)
+    if count == 0:
+        return np.zeros(0, dtype=np.int64)
+    centers = (boxes[:, 0:2] + boxes[:, 2:4]) / 2
+    pages = int(np.ceil(count / float(capacity)))
+    slice_size = capacity * int(np.ceil(np.sqrt(pages)))
+    order = np.argsort(centers[:, 0], kind='stable')
+    for first in range(0, count, slice_size):
+        part = order[first:first+slice_size]
+        order[first:first+slice_size] = part[np.argsort(centers[part, 1], kind='stable')]
+    return order
+
+
+class RTree(object):
+    """ R-tree over an (n, 4) array of boxes (xmin, ymin, xmax, ymax), packed with Sort-Tile-Recursive
+
+    levels[0] holds the boxes in packed order, levels[i] the bounding boxes
+    of groups of at most capacity entries of levels[i-1]. The children of
+    entry j of level i are entries starts[i][j]:ends[i][j] of level i-1.
+    """
+
+    def __init__(self, boxes, capacity=16):
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        self.capacity = capacity
+        self.order = _str_order(boxes, capacity)
+        self.levels = [boxes[self.order]]
+        self.starts = [None]
+        self.ends = [None]
+
+        while len(self.levels[-1]) > capacity:
+            children = self.levels[-1]
+            first = np.arange(0, len(children), capacity)
+            parents = np.column_stack([np.minimum.reduceat(children[:, 0], first),
+                                       np.minimum.reduceat(children[:, 1], first),
+                                       np.maximum.reduceat(children[:, 2], first),
+                                       np.maximum.reduceat(children[:, 3], first)])
+            order = _str_order(parents, capacity)
+            self.levels.append(parents[order])
+            self.starts.append(first[order])
+            self.ends.append(np.minimum(first[order] + capacity, len(children)))
+
+    def __len__(self):
+        return len(self.order)
+
+    def _children(self, level, entries):
+        starts = self.starts[level][entries]
+        counts = self.ends[level][entries] - starts
+        return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+    def query_box(self, bbox):
+        """ return the numbers of the boxes that intersect a bounding box """
+        xmin, ymin, xmax, ymax = bbox
+        top = len(self.levels) - 1
+        entries = np.arange(len(self.levels[top]))
+        for level in range(top, -1, -1):
+            boxes = self.levels[level][entries]
+            entries = entries[(boxes[:, 0] <= xmax) & (boxes[:, 2] >= xmin) &
+                              (boxes[:, 1] <= ymax) & (boxes[:, 3] >= ymin)]
+            if level > 0:
+                entries = self._children(level, entries)
+        return np.sort(self.order[entries])
+
+    def nearest(self, point, distance, mask=None):
+        """ return the number of the box with the smallest distance to a point and that distance
+
+        distance: callable(numbers, point) returning the exact distance from
+                  the point to the objects in the given boxes
+        mask:     optional boolean array, boxes where it is False are skipped """
+        point = np.asarray(point, dtype=float)
+        best, number = np.inf, -1
+        if not len(self.order):
+            return number, best
+
+        top = len(self.levels) - 1
+        heap = [(0.0, top + 1, 0)]
+        while heap:
+            bound, level, entry = heapq.heappop(heap)
+            if bound > best:
+                break
+            if level > top:
+                children = np.arange(len(self.levels[top]))
+            else:
+                children = np.arange(self.starts[level][entry], self.ends[level][entry])
+            child_level = min(level - 1, top)
+            if child_level == 0:
+                numbers = self.order[children]
+                if mask is not None:
+                    numbers = numbers[mask[numbers]]
+                if len(numbers):
+                    distances = distance(numbers, point)
+                    position = np.argmin(distances)
+                    if distances[position] < best:
+                        best, number = distances[position], numbers[position]
+                continue
+            boxes = self.levels[child_level][children]
+            bounds = np.sqrt(_box_distance(boxes[:, 0:2], boxes[:, 2:4], point))
+            for child, child_bound in zip(children.tolist(), bounds.tolist()):
+                if child_bound <= best:
+                    heapq.heappush(heap, (child_bound, child_level, child))
+        return number, best
+
+
+class SpatialIndex(object):
+    """ Spatial index of the nodes and links of a network, see Network.spatial_index
+
+    leafsize: number of points in a KD-tree leaf and entries in an R-tree node
+    rebuild:  fraction of added and removed objects after which a tree is rebuilt
+    """
+
+    def __init__(self, network, leafsize=16, rebuild=0.25):
+        self.network = weakref.ref(network)
+        self.leafsize = leafsize
+        self.rebuild = rebuild
+        self.build_nodes()
+        self.build_links()
+
+    # nodes
+    def build_nodes(self):
+        """ Rebuild the KD-tree from the nodes of the network """
+        nodes = list(self.network().nodes)
+        self.nodes = nodes
+        self.node_positions = dict((node.uid, position) for position, node in enumerate(nodes))
+        self.node_points = geometry.node_coordinates(nodes)
+        self.node_alive = np.ones(len(nodes), dtype=bool)
+        self.node_tree = KDTree(self.node_points, self.leafsize)
+        self.nodes_removed = 0
+
+    def add_node(self, node):
+        """ Add a node to the index """
+        if node.uid in self.node_positions:
+            self.remove_node(node.uid)
+        self.node_positions[node.uid] = len(self.nodes)
+        self.nodes.append(node)
+        self.node_points = np.vstack([self.node_points, [node.coordinates]])
+        self.node_alive = np.append(self.node_alive, True)
+        self._check_nodes()
+
+    def remove_node(self, uid):
+        """ Remove a node from the index """
+        position = self.node_positions.pop(uid)
+        self.node_alive[position] = False
+        self.nodes_removed += 1
+        self._check_nodes()
+
+    def _check_nodes(self):
+        changes = len(self.nodes) - len(self.node_tree) + self.nodes_removed
+        if changes > max(self.rebuild * len(self.node_tree), self.leafsize):
+            self.build_nodes()
+
+    # links
+    def build_links(self):
+        """ Rebuild the R-tree from the link segments of the network """
+        links = list(self.network().links)
+        self.links = links
+        self.link_positions = dict((link.uid, position) for position, link in enumerate(links))
+        self.link_alive = np.ones(len(links), dtype=bool)
+        self.segments, self.segment_links, self.segment_offsets = self._segments(links, 0)
+        self.link_tree = RTree(self._segment_boxes(self.segments), self.leafsize)
+        self.link_tree_count = len(links)
+        self.links_removed = 0
+
+    def _segments(self, links, first):
+        """ return the segments of links, the position of their link and their offset along it """
+        coordinates, offsets = geometry.link_geometry(links)
+        counts = np.diff(offsets)
+        starts = np.ones(len(coordinates), dtype=bool)
+        starts[offsets[1:] - 1] = False
+        segments = np.column_stack([coordinates[:-1], coordinates[1:]])[starts[:-1]]
+        owners = np.repeat(np.arange(first, first + len(links)), counts - 1)
+
+        # distance along the link to the start of every segment
+        lengths = np.sqrt(((segments[:, 2:4] - segments[:, 0:2]) ** 2).sum(axis=1))
+        cumulative = np.cumsum(lengths) - lengths
+        first_segment = np.repeat(offsets[:-1] - np.arange(len(links)), counts - 1)
+        return segments, owners, cumulative - cumulative[first_segment]
+
+    @staticmethod
+    def _segment_boxes(segments):
+        return np.column_stack([np.minimum(segments[:, 0], segments[:, 2]), np.minimum(segments[:, 1], segments[:, 3]),
+                                np.maximum(segments[:, 0], segments[:, 2]), np.maximum(segments[:, 1], segments[:, 3])])
+
+    def add_link(self, link):
+        """ Add a link to the index """
+        if link.uid in self.link_positions:
+            self.remove_link(link.uid)
+        position = len(self.links)
+        self.link_positions[link.uid] = position
+        self.links.append(link)
+        segments, owners, offsets = self._segments([link], position)
+        self.segments = np.vstack([self.segments, segments])
+        self.segment_links = np.append(self.segment_links, owners)
+        self.segment_offsets = np.append(self.segment_offsets, offsets)
+        self.link_alive = np.append(self.link_alive, True)
+        self._check_links()
+
+    def remove_link(self, uid):
+        """ Remove a link from the index """
+        position = self.link_positions.pop(uid)
+        self.link_alive[position] = False
+        self.links_removed += 1
+        self._check_links()
+
+    def _check_links(self):
+        changes = len(self.links) - self.link_tree_count + self.links_removed
+        if changes > max(self.rebuild * self.link_tree_count, self.leafsize):
+            self.build_links()
+
+    # queries
+    @staticmethod
+    def _points(points):
+        """ return an (n, 2) array and an index of query points """
+        if isinstance(points, pd.DataFrame):
+            return points.values[:, :2].astype(float), points.index
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        return points, pd.RangeIndex(len(points))
+
+    def nearest_nodes(self, points, k=1):
+        """ return the k nodes nearest to every point
+
+        points: (n, 2) array, list of (x, y) tuples or DataFrame with the x
+                and y coordinates in its first two columns
+        Returns a DataFrame with the node uid and distance, indexed like the
+        points. For k > 1 the index has a second level with the rank. """
+        points, index = self._points(points)
+        tree_count = len(self.node_tree)
+        alive = self.node_alive[:tree_count]
+        pending = np.flatnonzero(self.node_alive[tree_count:]) + tree_count
+
+        uids = np.empty((len(points), k), dtype=object)
+        distances = np.empty((len(points), k))
+        for row, point in enumerate(points):
+            squared, positions = self.node_tree.query(point, k, alive)
+            if len(pending):
+                squared = np.concatenate([squared, ((self.node_points[pending] - point) ** 2).sum(axis=1)])
+                positions = np.concatenate([positions, pending])
+                order = np.argsort(squared, kind='stable')[:k]
+                squared, positions = squared[order], positions[order]
+            distances[row] = np.sqrt(squared)
+            uids[row] = [self.nodes[position].uid if position >= 0 else None for position in positions.tolist()]
+
+        if k == 1:
+            return pd.DataFrame({'node': uids[:, 0], 'distance': distances[:, 0]}, index=index,
+                                columns=['node', 'distance'])
+        index = pd.MultiIndex.from_product([index, range(k)], names=[index.name, 'rank'])
+        return pd.DataFrame({'node': uids.ravel(), 'distance': distances.ravel()}, index=index,
+                            columns=['node', 'distance'])
+
+    def nearest_links(self, points):
+        """ return the link nearest to every point
+
+        Returns a DataFrame indexed like the points with the link uid, the
+        distance to the link, the offset of the nearest point along the link
+        measured from its start node, and the coordinates (x, y) of that point. """
+        points, index = self._points(points)
+        alive = self.link_alive[self.segment_links]
+        tree_count = len(self.link_tree)
+        pending = np.flatnonzero(alive[tree_count:]) + tree_count
+
+        def distance(numbers, point):
+            return _segment_projection(self.segments[numbers], point)[0]
+
+        segments = np.full(len(points), -1, dtype=np.int64)
+        for row, point in enumerate(points):
+            number, best = self.link_tree.nearest(point, distance, alive[:tree_count])
+            if len(pending):
+                distances = distance(pending, point)
+                position = np.argmin(distances)
+                if distances[position] < best:
+                    number = pending[position]
+            segments[row] = number
+
+        found = segments >= 0
+        result = pd.DataFrame({'link': None, 'distance': np.nan, 'offset': np.nan, 'x': np.nan, 'y': np.nan},
+                              index=index, columns=['link', 'distance', 'offset', 'x', 'y'])
+        if found.any():
+            numbers = segments[found]
+            selected = self.segments[numbers]
+            rows = points[found]
+            start = selected[:, 0:2]
+            direction = selected[:, 2:4] - start
+            length2 = (direction ** 2).sum(axis=1)
+            fraction = np.clip(((rows - start) * direction).sum(axis=1) / np.where(length2 > 0, length2, 1), 0, 1)
+            projection = start + fraction[:, None] * direction
+            result.loc[found, 'link'] = [self.links[position].uid for position in self.segment_links[numbers].tolist()]
+            result.loc[found, 'distance'] = np.sqrt(((rows - projection) ** 2).sum(axis=1))
+            result.loc[found, 'offset'] = self.segment_offsets[numbers] + fraction * np.sqrt(length2)
+            result.loc[found, 'x'] = projection[:, 0]
+            result.loc[found, 'y'] = projection[:, 1]
+        return result
+
+    def _collection(self, objects, positions):
+        collection = ObjectCollection()
+        for position in positions.tolist():
+            item = objects[position]
+            collection[item.uid] = item
+        return collection
+
+    def _node_candidates(self, bbox):
+        tree_count = len(self.node_tree)
+        points = self.node_points[tree_count:]
+        pending = np.flatnonzero(np.all((points >= bbox[:2]) & (points <= bbox[2:]), axis=1)) + tree_count
+        candidates = np.concatenate([self.node_tree.query_box(bbox), pending])
+        return candidates[self.node_alive[candidates]]
+
+    def _segment_candidates(self, bbox):
+        tree_count = len(self.link_tree)
+        boxes = self._segment_boxes(self.segments[tree_count:])
+        pending = np.flatnonzero((boxes[:, 0] <= bbox[2]) & (boxes[:, 2] >= bbox[0]) &
+                                 (boxes[:, 1] <= bbox[3]) & (boxes[:, 3] >= bbox[1])) + tree_count
+        candidates = np.concatenate([self.link_tree.query_box(bbox), pending])
+        return candidates[self.link_alive[self.segment_links[candidates]]]
+
+    def nodes_in_bbox(self, bbox):
+        """ return the nodes inside a bounding box (xmin, ymin, xmax, ymax) as an ObjectCollection """
+        bbox = np.asarray(bbox, dtype=float)
+        return self._collection(self.nodes, self._node_candidates(bbox))
+
+    def links_in_bbox(self, bbox):
+        """ return the links that intersect a bounding box (xmin, ymin, xmax, ymax) as an ObjectCollection """
+        return self.links_in_polygon(_box_polygon(bbox))
+
+    def nodes_in_polygon(self, polygon):
+        """ return the nodes inside a polygon, a sequence of (x, y) vertices, as an ObjectCollection """
+        polygon = np.asarray(polygon, dtype=float)
+        candidates = self._node_candidates(np.concatenate([polygon.min(axis=0), polygon.max(axis=0)]))
+        inside = _points_in_polygon(self.node_points[candidates], polygon)
+        return self._collection(self.nodes, candidates[inside])
+
+    def links_in_polygon(self, polygon):
+        """ return the links that intersect a polygon, a sequence of (x, y) vertices, as an ObjectCollection """
+        polygon = np.asarray(polygon, dtype=float)
+        candidates = self._segment_candidates(np.concatenate([polygon.min(axis=0), polygon.max(axis=0)]))
+        inside = _segments_in_polygon(self.segments[candidates], polygon)
+        return self._collection(self.links, np.unique(self.segment_links[candidates[inside]]))
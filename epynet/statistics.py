@@ -0,0 +1,102 @@
+""" EPYNET streaming statistics """
+import numpy as np
+import pandas as pd
+
+
+class SampleStatistics(object):
+    """ Statistics of a set of elements, accumulated over batches of samples
+
+    Keeps the count, mean and variance (Welford/Chan), the minimum and
+    maximum, and a histogram per element from which quantiles are
+    estimated. Memory only depends on the number of elements and bins,
+    not on the number of samples. Statistics with the same bins can be
+    merged, so batches can be accumulated in different processes.
+
+    index:  element uids
+    lower:  lower edge of the histogram per element
+    upper:  upper edge of the histogram per element, values outside
+            [lower, upper] are counted in the outer bins
+    """
+
+    def __init__(self, index, lower, upper, bins=64):
+        self.index = list(index)
+        size = len(self.index)
+        self.lower = np.broadcast_to(np.asarray(lower, dtype=float), (size,)).copy()
+        upper = np.broadcast_to(np.asarray(upper, dtype=float), (size,))
+        self.width = np.maximum(upper - self.lower, 1e-9) / bins
+        self.bins = bins
+
+        self.count = 0
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+        self.minimum = np.full(size, np.inf)
+        self.maximum = np.full(size, -np.inf)
+        self.histogram = np.zeros((size, bins), dtype=np.uint32)
+
+    def update(self, values):
+        """ Add a batch of samples, an array with one row per sample """
+        values = np.atleast_2d(np.asarray(values, dtype=float))
+        count = values.shape[0]
+        if count == 0:
+            return
+
+        mean = values.mean(axis=0)
+        m2 = ((values - mean) ** 2).sum(axis=0)
+        self._combine(count, mean, m2)
+        np.minimum(self.minimum, values.min(axis=0), out=self.minimum)
+        np.maximum(self.maximum, values.max(axis=0), out=self.maximum)
+
+        bins = np.floor((values - self.lower) / self.width).astype(np.int64)
+        np.clip(bins, 0, self.bins - 1, out=bins)
+        flat = (np.arange(values.shape[1]) * self.bins + bins).ravel()
+        self.histogram += np.bincount(flat, minlength=self.histogram.size).reshape(self.histogram.shape).astype(np.uint32)
+
+    def merge(self, other):
+        """ Add the samples of statistics with the same elements and bins """
+        if other.count == 0:
+            return
+        self._combine(other.count, other.mean, other.m2)
+        np.minimum(self.minimum, other.minimum, out=self.minimum)
+        np.maximum(self.maximum, other.maximum, out=self.maximum)
+        self.histogram += other.histogram
+
+    def _combine(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return np.full(len(self.index), np.nan)
+        return self.m2 / (self.count - 1)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    def quantile(self, q):
+        """ Estimate a quantile per element from the histogram """
+        cumulative = np.cumsum(self.histogram, axis=1)
+        total = cumulative[:, -1]
+        target = q * total
+        position = np.argmax(cumulative >= target[:, None], axis=1)
+        rows = np.arange(len(self.index))
+        before = np.where(position > 0, cumulative[rows, np.maximum(position - 1, 0)], 0)
+        inside = self.histogram[rows, position]
+        fraction = np.where(inside > 0, (target - before) / np.maximum(inside, 1), 0.5)
+        estimate = self.lower + (position + fraction) * self.width
+        # the outer bins also hold values beyond the edges
+        return np.clip(estimate, self.minimum, self.maximum)
+
+    def summary(self, quantiles=(0.05, 0.5, 0.95)):
+        """ return a DataFrame with the statistics per element """
+        columns = {'mean': self.mean, 'std': self.std, 'min': self.minimum, 'max': self.maximum}
+        order = ['mean', 'std', 'min', 'max']
+        for q in quantiles:
+            name = 'q%g' % (100 * q)
+            columns[name] = self.quantile(q)
+            order.append(name)
+        return pd.DataFrame(columns, index=self.index, columns=order)
@@ -9,7 +9,9 @@ setup(name='epynet',
       license='Apache Licence 2.0',
       packages=['epynet'],
       package_data={'epynet': ['lib/*']},
+      python_requires='>=3.6',
       install_requires = [
+          'numpy>=1.17',
           'pandas'
       ],
       zip_safe=False)
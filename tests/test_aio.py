@@ -0,0 +1,103 @@
+from epynet import Network
+from epynet.reducers import Minimum, Reducer
+from nose.tools import assert_equal, assert_almost_equal
+import asyncio
+import threading
+import numpy as np
+
+def run(coroutine):
+    """ asyncio.run, which needs Python 3.7 """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+class Count(Reducer):
+    """ Counts the timesteps, optionally waiting for an event at the first one """
+
+    def __init__(self, objects, started=None):
+        super(Count, self).__init__(objects, 'head')
+        self.started = started
+
+    def initialize(self, size):
+        self.count = 0
+
+    def update(self, values, time, duration):
+        self.count += 1
+        if self.started is not None:
+            self.started.set()
+
+    def value(self):
+        return np.full(len(self.uids), self.count)
+
+class TestAsync(object):
+    @classmethod
+    def setup_class(self):
+        self.network = Network(inputfile="tests/testnetwork.inp")
+        self.other = Network(inputfile="tests/testnetwork.inp")
+
+    def test01_solve(self):
+        self.network.solve(3600)
+        expected = self.network.junctions.pressure
+        self.network.reset()
+
+        run(self.network.asolve(3600))
+        np.testing.assert_allclose(self.network.junctions.pressure, expected)
+
+    def test02_run(self):
+        expected = self.network.run(reducers={'min': Minimum(self.network.junctions, 'pressure')})['min']
+        other = self.other.run(reducers={'min': Minimum(self.other.junctions, 'pressure')})['min']
+
+        async def both():
+            return await asyncio.gather(self.network.arun({'min': Minimum(self.network.junctions, 'pressure')}),
+                                        self.other.arun({'min': Minimum(self.other.junctions, 'pressure')}),
+                                        self.network.asolve(0))
+
+        first, second, solved = run(both())
+        np.testing.assert_allclose(first['min'], expected)
+        np.testing.assert_allclose(second['min'], other)
+
+    def test03_steps(self):
+        async def steps():
+            times = []
+            async for simtime, state in self.network.asteps():
+                times.append(simtime)
+                assert_equal(len(state['pressure']), len(self.network.nodes))
+            return times
+
+        times = run(steps())
+        assert_equal(times, list(range(0, 36001, 3600)))
+
+        async def first_step():
+            async with self.network.asteps() as steps:
+                async for simtime, state in steps:
+                    break
+            # the network is unlocked again
+            await self.network.asolve(0)
+
+        run(first_step())
+
+    def test04_cancel(self):
+        network = self.network
+        network.ep.ENsettimeparam(0, 3600 * 24 * 365)
+        network.ep.ENsettimeparam(1, 60)
+        started = threading.Event()
+        counter = Count(network.junctions, started)
+
+        async def cancel():
+            task = asyncio.ensure_future(network.arun({'count': counter}))
+            await asyncio.get_event_loop().run_in_executor(None, started.wait)
+            task.cancel()
+            try:
+                await task
+                assert False
+            except asyncio.CancelledError:
+                pass
+
+        run(cancel())
+        assert(counter.count < 365 * 24 * 60)
+        network.ep.ENsettimeparam(0, 36000)
+        network.ep.ENsettimeparam(1, 3600)
+        network.solve()
+        assert(network.pumps['2'].flow > 0)
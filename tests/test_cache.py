@@ -0,0 +1,69 @@
+from epynet import Network, epanet2
+from epynet.cache import HydraulicsCache, hydraulics_key
+from epynet.quality import QualityScenario
+from nose.tools import assert_equal, assert_not_equal
+import numpy as np
+import os
+import shutil
+import tempfile
+
+class TestHydraulicsCache(object):
+    @classmethod
+    def setup_class(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = HydraulicsCache(os.path.join(self.directory, 'cache'))
+        self.network = Network(inputfile="tests/testnetwork.inp")
+
+    @classmethod
+    def teardown_class(self):
+        shutil.rmtree(self.directory, True)
+
+    def test01_key(self):
+        key = hydraulics_key(self.network)
+        assert_equal(key, hydraulics_key(Network(inputfile="tests/testnetwork.inp")))
+        # water quality data does not change the hydraulics
+        self.network.ep.ENsetqualtype(epanet2.EN_AGE, '', '', '')
+        assert_equal(hydraulics_key(self.network), key)
+        self.network.ep.ENsetqualtype(epanet2.EN_NONE, '', '', '')
+        self.network.pipes['4'].diameter = 90
+        assert_not_equal(hydraulics_key(self.network), key)
+        self.network.pipes['4'].diameter = 100
+        assert_equal(hydraulics_key(self.network), key)
+
+    def test02_hydraulics(self):
+        assert self.cache.get(self.network) is None
+        path = self.cache.hydraulics(self.network)
+        assert os.path.exists(path)
+        assert_equal(self.cache.hydraulics(self.network), path)
+        assert_equal((self.cache.hits, self.cache.misses), (1, 1))
+        assert_equal(len(self.cache.files()), 1)
+        assert not [name for name in os.listdir(self.cache.directory) if name.endswith('.tmp')]
+
+    def test03_quality(self):
+        scenario = QualityScenario('age')
+        with self.network.quality(cache=self.cache) as engine:
+            cached = engine.run(scenario, output='final')
+        assert_equal(self.cache.hits, 2)
+        with self.network.quality() as engine:
+            solved = engine.run(scenario, output='final')
+        np.testing.assert_allclose(cached['nodes'], solved['nodes'])
+
+    def test04_evict(self):
+        network = Network(inputfile="tests/testnetwork.inp")
+        network.pipes['4'].diameter = 90
+        self.cache.max_size = 1
+        path = self.cache.hydraulics(network)
+        # the file just added is kept, even when it is too large
+        assert_equal([entry[2] for entry in self.cache.files()], [path])
+        self.cache.max_size = None
+
+    def test05_use(self):
+        network = Network(inputfile="tests/testnetwork.inp")
+        path = self.cache.use(network)
+        assert_equal(network.hydraulics_file, path)
+        network.ep.ENsetqualtype(epanet2.EN_AGE, '', '', '')
+        network.ep.ENsolveQ()
+
+    def test06_clear(self):
+        self.cache.clear()
+        assert_equal(self.cache.size(), 0)
@@ -0,0 +1,117 @@
+from epynet import Network
+from epynet.calibration import Parameter, Calibration
+from nose.tools import assert_equal, assert_almost_equal, raises
+import numpy as np
+import pandas as pd
+
+class TestCalibration(object):
+    @classmethod
+    def setup_class(self):
+        self.network = Network(inputfile="tests/testnetwork.inp")
+        self.parameters = [Parameter('roughness', 'roughness', ['3', '4', '5', '6']),
+                           Parameter('demand', 'demand', ['5', '6', '7', '8'])]
+        self.times = [0, 3600, 7200]
+        self.true = np.array([0.5, 1.3])
+
+        # measurements simulated with the true parameters
+        empty = {'pressure': pd.DataFrame(0.0, index=self.times, columns=['4', '6', '8', '10']),
+                 'flow': pd.DataFrame(0.0, index=self.times, columns=['1', '7'])}
+        simulated = Calibration(self.network, self.parameters, empty).frame(self.true)['simulated']
+        tables = simulated.unstack(['result', 'uid'])
+        self.measurements = {'pressure': tables['pressure'], 'flow': tables['flow']}
+        self.calibration = self.network.calibration(self.parameters, self.measurements)
+
+    def test01_layout(self):
+        calibration = self.calibration
+        assert_equal(len(calibration), 18)
+        assert_equal(calibration.times, self.times)
+        assert_equal(calibration.names, ['roughness', 'demand'])
+        np.testing.assert_allclose(calibration.x0, [0.1, 1.0])
+        assert_equal(list(calibration.index[:2]), [(0, 'flow', '1'), (0, 'flow', '7')])
+
+    def test02_residuals(self):
+        residuals = self.calibration.residuals(self.true)
+        np.testing.assert_allclose(residuals, 0, atol=1e-9)
+
+        # compare with setting the properties and solving every timestamp
+        residuals = self.calibration.residuals(self.calibration.x0)
+        for simtime in self.times:
+            self.network.solve(simtime)
+            measured = self.measurements['pressure'].loc[simtime]
+            expected = self.network.nodes.pressure[measured.index] - measured
+            np.testing.assert_allclose(residuals[self.calibration.index.get_locs([simtime, 'pressure'])],
+                                       expected.values, atol=1e-3)
+        # the network is restored
+        assert_almost_equal(self.network.pipes['3'].roughness, 0.1)
+        assert_almost_equal(self.network.junctions['5'].basedemand, 1)
+
+    def test03_gauss_newton(self):
+        calibration = self.calibration
+        vector = calibration.x0
+        for _ in range(8):
+            step = np.linalg.lstsq(calibration.jacobian(vector), -calibration.residuals(vector), rcond=None)[0]
+            vector = np.maximum(vector + step, 1e-3)
+        np.testing.assert_allclose(vector, self.true, rtol=1e-3)
+        assert calibration.cost(vector) < 1e-6
+
+    def test04_parallel(self):
+        vectors = np.random.RandomState(0).uniform(0.5, 1.5, (6, 2)) * self.true
+        serial = Calibration(self.network, self.parameters, self.measurements).evaluate(vectors)
+        with Calibration(self.network, self.parameters, self.measurements, workers=2) as calibration:
+            parallel = calibration.evaluate(vectors)
+            assert_equal(calibration.solves, 6 * len(self.times))
+            # cached vectors are not solved again
+            calibration.evaluate(vectors[::-1])
+            assert_equal(calibration.solves, 6 * len(self.times))
+        np.testing.assert_allclose(parallel, serial, rtol=1e-4, atol=1e-4)
+
+    def test05_parallel_jacobian(self):
+        # values that the input file of the workers rounds
+        network = Network(inputfile="tests/testnetwork.inp")
+        for pipe in network.pipes:
+            pipe.roughness = 0.1234567
+            pipe.length = 100.123456
+        jacobians = []
+        for workers in (1, 2):
+            with Calibration(network, self.parameters, self.measurements, workers=workers,
+                             relative_step=1e-4, accuracy=1e-8) as calibration:
+                calibration.residuals(self.true)
+                jacobians.append(calibration.jacobian(self.true))
+        np.testing.assert_allclose(jacobians[1], jacobians[0], rtol=1e-2, atol=1e-2)
+
+    def test06_status(self):
+        parameters = self.parameters + [Parameter('status', 'valve', ['9'])]
+        calibration = Calibration(self.network, parameters, self.measurements)
+        assert_equal(calibration.x0[2], 1)
+        opened = calibration.residuals(np.append(self.true, 1))
+        closed = calibration.residuals(np.append(self.true, 0))
+        np.testing.assert_allclose(opened, 0, atol=1e-9)
+        assert np.abs(closed).max() > 1
+        assert np.all(calibration.jacobian(np.append(self.true, 1))[:, 2] == 0)
+        # the valve controls its pressure again
+        self.network.solve()
+        assert_almost_equal(self.network.nodes['10'].pressure, 5, 3)
+
+    def test07_boundaries(self):
+        # a long table with Timedeltas
+        long = self.measurements['pressure'].stack().reset_index()
+        long.columns = ['time', 'uid', 'value']
+        long['time'] = pd.to_timedelta(long['time'], unit='s')
+        levels = pd.DataFrame({'11': [5.0]}, index=[0])
+        calibration = Calibration(self.network, self.parameters, {'pressure': long},
+                                  boundaries={'tanklevel': levels})
+        assert_equal(len(calibration), 12)
+        residuals = calibration.residuals(self.true)
+        assert np.abs(residuals).max() > 0.1
+        assert_almost_equal(self.network.tanks['11'].tanklevel, 10)
+
+    def test08_apply(self):
+        network = Network(inputfile="tests/testnetwork.inp")
+        calibration = Calibration(network, self.parameters, self.measurements)
+        calibration.apply(self.true)
+        assert_almost_equal(network.pipes['4'].roughness, 0.5)
+        assert_almost_equal(network.junctions['5'].basedemand, 1.3)
+
+    @raises(ValueError)
+    def test09_unknown(self):
+        Calibration(self.network, self.parameters, {'quality': self.measurements['pressure']})
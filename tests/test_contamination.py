@@ -0,0 +1,64 @@
+from epynet import Network
+from epynet.contamination import ImpactMatrix
+from nose.tools import assert_equal, assert_almost_equal, raises
+import numpy as np
+
+class TestImpactMatrix(object):
+    @classmethod
+    def setup_class(self):
+        self.network = Network(inputfile="tests/testnetwork.inp")
+        self.matrix = self.network.impact_matrix(threshold=0.01)
+
+    def test01_matrix(self):
+        matrix = self.matrix
+        junctions = list(self.network.junctions.uid)
+        assert_equal(matrix.events, junctions)
+        assert_equal(matrix.sensors, junctions)
+        # an injection is detected where it is injected, at the first quality step
+        frame = matrix.frame()
+        own = frame[frame['event'] == frame['sensor']]
+        assert_equal(len(own), len(junctions))
+        assert np.all(own['time'] == own['time'].min())
+        assert np.all(matrix.impact <= matrix.undetected[matrix.event] + 1e-9)
+
+    def test02_detection_times(self):
+        times = self.matrix.detection_times()
+        assert_equal(times.shape, (len(self.matrix.events), len(self.matrix.sensors)))
+        assert_equal(int(np.isfinite(times.values).sum()), len(self.matrix))
+
+    def test03_impacts(self):
+        matrix = self.matrix
+        assert_almost_equal(matrix.expected_impact([]), matrix.undetected.mean())
+        impacts = matrix.impacts(matrix.sensors)
+        assert np.all(impacts <= matrix.undetected + 1e-9)
+
+    def test04_place_sensors(self):
+        matrix = self.matrix
+        greedy = matrix.place_sensors(2, method='greedy')
+        local = matrix.place_sensors(2)
+        assert len(greedy) <= 2
+        assert matrix.expected_impact(local) <= matrix.expected_impact(greedy) + 1e-9
+        assert matrix.expected_impact(greedy) < matrix.expected_impact([])
+
+    def test05_population(self):
+        population = dict((uid, 10) for uid in self.network.junctions.uid)
+        matrix = self.network.impact_matrix(impact='population', population=population, workers=2)
+        assert_almost_equal(matrix.undetected.max(), 10 * len(self.network.junctions))
+
+    @raises(ValueError)
+    def test06_population_missing(self):
+        self.network.impact_matrix(impact='population')
+
+def test_local_search():
+    # one sensor detects every event late, two others detect half of them early
+    event = np.array([0, 1, 2, 3, 0, 1, 2, 3])
+    sensor = np.array([0, 0, 0, 0, 1, 1, 2, 2])
+    impact = np.array([3., 3., 3., 3., 0., 0., 0., 0.])
+    matrix = ImpactMatrix(['a', 'b', 'c', 'd'], ['x', 'y', 'z'], event, sensor, np.zeros(8), impact,
+                          np.full(4, 10.))
+    greedy = matrix.place_sensors(2, method='greedy')
+    assert_equal(greedy[0], 'x')
+    assert_almost_equal(matrix.expected_impact(greedy), 1.5)
+    local = matrix.place_sensors(2)
+    assert_equal(sorted(local), ['y', 'z'])
+    assert_almost_equal(matrix.expected_impact(local), 0)
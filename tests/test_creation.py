@@ -270,3 +270,16 @@ class TestGeneratedNetwork(object):
         self.network.solve()
 
         assert_almost_equal(self.network.junctions['9'].pressure, 9.99, 2)
+
+def test_close():
+    network = Network(inputfile='tests/testnetwork.inp')
+    network.close()
+    assert(network.ep.ph.value is None)
+
+    # a junction inserted before the reservoir and tank
+    network = Network(inputfile='tests/testnetwork.inp')
+    network.add_junction('JX', x=0, y=0)
+    network.add_pipe('PX', 'JX', '4')
+    network.solve()
+    network.close()
+    assert(not network.ep.deletable)
@@ -0,0 +1,57 @@
+from epynet import Network
+from epynet.graph import DepthFirstForest
+from nose.tools import assert_equal, assert_almost_equal
+import os
+import tempfile
+import pandas as pd
+
+class TestCriticality(object):
+    @classmethod
+    def setup_class(self):
+        self.network = Network(inputfile="tests/testnetwork.inp")
+        # dead end junction behind a single pipe
+        self.network.add_junction('J1', 0, 0, basedemand=5)
+        self.network.add_pipe('P1', '10', 'J1')
+
+    def test01_bridges(self):
+        # triangle 0-1-2 with a tail 2-3
+        forest = DepthFirstForest(4, [0, 1, 2, 2], [1, 2, 0, 3])
+        assert_equal(list(forest.bridges), [False, False, False, True])
+        totals = forest.subtree_totals([1, 1, 1, 1])
+        assert_equal(totals[forest.below[3]], 1)
+        assert_equal(totals[forest.root[3]], 4)
+
+    def test02_criticality(self):
+        self.network.solve()
+        flow = self.network.pipes['11'].flow
+
+        table = self.network.criticality(min_pressure=10)
+        assert_equal(len(table), 11)
+        # the bridge to J1 is evaluated without solving
+        assert_equal(table.loc['P1', 'method'], 'bridge')
+        assert_equal(table.loc['P1', 'isolated_nodes'], 1)
+        assert_almost_equal(table.loc['P1', 'unsupplied_demand'], 5, 2)
+        # closing the supply pipe leaves the network on the tank
+        assert_equal(table.loc['1', 'method'], 'solved')
+        assert_equal(table.loc['1', 'nodes_below'], 7)
+        assert_equal(table.loc['4', 'nodes_below'], 0)
+
+        # the network is restored afterwards
+        self.network.solve()
+        assert_almost_equal(self.network.pipes['11'].flow, flow, 4)
+
+    def test03_parallel(self):
+        serial = self.network.criticality(min_pressure=10)
+        output = os.path.join(tempfile.mkdtemp(), 'criticality.csv')
+        parallel = self.network.criticality(min_pressure=10, workers=2, output=output)
+        pd.testing.assert_frame_equal(serial, parallel)
+
+        streamed = pd.read_csv(output, index_col=0)
+        assert_equal(len(streamed), 11)
+
+    def test04_check_valve(self):
+        network = Network(inputfile="tests/testnetwork.inp")
+        network.add_pipe('CV', '4', '8', check_valve=True)
+        table = network.criticality(min_pressure=10)
+        assert_equal(table.loc['CV', 'method'], 'failed')
+        assert_equal(table.loc['1', 'method'], 'solved')
@@ -0,0 +1,54 @@
+from epynet import Network
+from epynet.design import PipeDesign
+from nose.tools import assert_equal, assert_almost_equal
+import numpy as np
+
+class TestDesign(object):
+    @classmethod
+    def setup_class(self):
+        self.network = Network(inputfile="tests/testnetwork.inp")
+        self.pipes = ['3', '4', '11']
+        self.diameters = [50, 100, 150, 300]
+        self.design = PipeDesign(self.network, self.pipes, self.diameters, [1, 2, 3, 5], min_pressure=5)
+        self.population = np.random.RandomState(0).randint(0, 4, (20, 3))
+
+    def test01_cost(self):
+        lengths = np.array([self.network.pipes[uid].length for uid in self.pipes])
+        cost = self.design.cost([[0, 1, 3]])
+        assert_almost_equal(cost[0], lengths.dot([1, 2, 5]))
+
+    def test02_evaluate(self):
+        cost, violation = self.design.evaluate(self.population)
+        assert_equal(cost.shape, (20,))
+        assert_equal(violation.shape, (20, 2))
+        assert_equal(self.design.solves, len(set(row.tobytes() for row in self.population)))
+
+        # compare with solving every individual on its own
+        for individual, row in zip(self.population[:4], violation):
+            for uid, option in zip(self.pipes, individual):
+                self.network.pipes[uid].diameter = self.diameters[option]
+            self.network.solve()
+            deficit = np.maximum(5 - self.network.junctions.pressure, 0)
+            assert_almost_equal(row[0], deficit.max(), 4)
+            assert_almost_equal(row[1], deficit.sum(), 4)
+        for uid, diameter in zip(self.pipes, [100, 100, 150]):
+            self.network.pipes[uid].diameter = diameter
+
+        # cached individuals are not solved again
+        solves = self.design.solves
+        self.design.evaluate(self.population[::-1])
+        assert_equal(self.design.solves, solves)
+
+    def test03_parallel(self):
+        cost, violation = self.design.evaluate(self.population)
+        design = PipeDesign(self.network, self.pipes, self.diameters, [1, 2, 3, 5], min_pressure=5)
+        parallel_cost, parallel_violation = design.evaluate(self.population, workers=2, chunksize=4)
+        np.testing.assert_allclose(parallel_cost, cost)
+        np.testing.assert_allclose(parallel_violation, violation, rtol=1e-4, atol=1e-4)
+
+    def test04_invalid(self):
+        try:
+            self.design.evaluate([[0, 1, 4]])
+            assert False
+        except ValueError:
+            pass
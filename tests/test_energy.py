@@ -0,0 +1,47 @@
+from epynet import Network
+from epynet.energy import EnergyAccount, Tariff
+from epynet.reducers import Sum
+from nose.tools import assert_equal, assert_almost_equal
+import numpy as np
+
+class TestEnergy(object):
+    @classmethod
+    def setup_class(self):
+        self.network = Network(inputfile="tests/testnetwork.inp")
+        self.network.run()
+        self.energy = self.network.pumps.energy
+        self.flow = self.network.pumps.flow
+
+    def test01_tariff(self):
+        tariff = Tariff([1, 2, 3], step=10)
+        assert_equal(tariff.price(25), 3)
+        assert_equal(tariff.price(35), 1)
+        # 5 seconds at 2 and 10 seconds at 3
+        assert_almost_equal(tariff.mean_price(15, 15), 40 / 15.0)
+        # across the end of the period
+        assert_almost_equal(tariff.mean_price(25, 10), 2)
+
+    def test02_account(self):
+        tariff = Tariff([0.1] * 5 + [0.3] * 5, step=3600, demand_charge=2)
+        account = EnergyAccount(self.network.pumps, tariff, stations={'2': 'north'})
+        results = self.network.run(reducers={'account': account, 'energy': Sum(self.network.pumps, 'energy', unit=3600)})
+        table = results['account']
+
+        durations = np.diff(self.energy.index.values, append=self.energy.index.values[-1])
+        energy = (self.energy['2'] * durations).sum() / 3600
+        assert_almost_equal(table.loc['2', 'energy'], energy)
+        assert_almost_equal(results['energy']['2'], energy)
+
+        prices = np.where(self.energy.index.values < 5 * 3600, 0.1, 0.3)
+        assert_almost_equal(table.loc['2', 'energy_cost'], (self.energy['2'] * durations * prices).sum() / 3600)
+        assert_almost_equal(table.loc['2', 'demand_charge'], 2 * self.energy['2'].max())
+        assert_almost_equal(table.loc['2', 'volume'], (self.flow['2'] * durations).sum() / 3600)
+        assert_almost_equal(table.loc['2', 'specific_energy'], table.loc['2', 'energy'] / table.loc['2', 'volume'])
+        assert_almost_equal(table.loc['2', 'running_time'], 10)
+
+        # the network uses a global pump efficiency of 75%
+        assert_almost_equal(table.loc['2', 'efficiency'], 0.75, 2)
+
+        stations = account.station_result()
+        assert_equal(list(stations.index), ['north'])
+        assert_almost_equal(stations.loc['north', 'cost'], table.loc['2', 'cost'])
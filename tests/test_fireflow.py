@@ -0,0 +1,36 @@
+from epynet import Network
+from nose.tools import assert_equal, assert_almost_equal
+import pandas as pd
+
+class TestFireFlow(object):
+    @classmethod
+    def setup_class(self):
+        self.network = Network(inputfile="tests/testnetwork.inp")
+
+    def test01_capacity(self):
+        table = self.network.fire_flow(['5', '7'], min_pressure=5, residual_constraints={'7': 10})
+        assert_equal(list(table.index), ['5', '7'])
+        assert_equal(table.loc['7', 'limiting_node'], '7')
+        assert(table['solves'].max() <= 20)
+
+        # the capacity just meets the constraints
+        for uid in ['5', '7']:
+            junction = self.network.junctions[uid]
+            junction.basedemand += table.loc[uid, 'capacity']
+            self.network.solve()
+            pressures = self.network.junctions.pressure.drop('2')
+            assert(pressures.min() > 4.9)
+            assert(self.network.junctions['7'].pressure > 9.9)
+            junction.basedemand -= table.loc[uid, 'capacity']
+
+        self.network.solve()
+        assert_almost_equal(self.network.junctions['5'].demand, 1, 4)
+
+    def test02_parallel(self):
+        serial = self.network.fire_flow(self.network.junctions, min_pressure=5)
+        parallel = self.network.fire_flow(self.network.junctions, min_pressure=5, workers=2)
+        pd.testing.assert_frame_equal(serial, parallel)
+
+    def test03_unconstrained(self):
+        table = self.network.fire_flow(['5'], max_flow=300)
+        assert_equal(table.loc['5', 'capacity'], 300)
@@ -0,0 +1,70 @@
+from epynet import Network
+from nose.tools import assert_equal, assert_almost_equal
+from unittest import SkipTest
+import json
+import os
+import shutil
+import struct
+import tempfile
+import numpy as np
+
+class TestGeometry(object):
+    @classmethod
+    def setup_class(self):
+        self.directory = tempfile.mkdtemp()
+        inputfile = os.path.join(self.directory, 'vertices.inp')
+        with open('tests/testnetwork.inp') as handle:
+            content = handle.read()
+        content = content.replace("[VERTICES]\n", "[VERTICES]\n 11\t2500\t5800\n 11\t3000\t5800\n")
+        with open(inputfile, 'w') as handle:
+            handle.write(content)
+        self.network = Network(inputfile=inputfile)
+        self.network.solve()
+
+    @classmethod
+    def teardown_class(self):
+        shutil.rmtree(self.directory)
+
+    def test01_coordinates(self):
+        coordinates = self.network.nodes.coordinates_array()
+        assert_equal(coordinates.shape, (11, 2))
+        for position, node in enumerate(self.network.nodes):
+            np.testing.assert_allclose(coordinates[position], node.coordinates)
+
+    def test02_geometry(self):
+        coordinates, offsets = self.network.links.geometry()
+        assert_equal(len(offsets), len(self.network.links) + 1)
+        # every link path matches Link.path
+        for position, link in enumerate(self.network.links):
+            np.testing.assert_allclose(coordinates[offsets[position]:offsets[position+1]], link.path)
+
+        wkb = self.network.links.geometry(wkb=True)
+        position = list(self.network.links.keys()).index('11')
+        assert_equal(struct.unpack('<BII', wkb[position][:9]), (1, 2, 4))
+
+    def test03_geojson(self):
+        path = os.path.join(self.directory, 'pipes.geojson')
+        self.network.pipes.to_geojson(path, columns=['diameter', 'flow'])
+        with open(path) as handle:
+            collection = json.load(handle)
+        assert_equal(len(collection['features']), len(self.network.pipes))
+        feature = collection['features'][0]
+        assert_equal(feature['geometry']['type'], 'LineString')
+        assert_almost_equal(feature['properties']['flow'], self.network.pipes[feature['properties']['uid']].flow, 4)
+
+        path = os.path.join(self.directory, 'nodes.geojson')
+        self.network.nodes.to_geojson(path, columns={'pressure': self.network.nodes.pressure})
+        with open(path) as handle:
+            assert_equal(json.load(handle)['features'][0]['geometry']['type'], 'Point')
+
+    def test04_geoparquet(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SkipTest("pyarrow is not installed")
+        path = os.path.join(self.directory, 'pipes.parquet')
+        self.network.pipes.to_geoparquet(path, columns=['diameter'])
+        table = pq.read_table(path)
+        assert_equal(table.num_rows, len(self.network.pipes))
+        assert(b'geo' in table.schema.metadata)
+        assert_equal(table.column_names, ['uid', 'diameter', 'geometry'])
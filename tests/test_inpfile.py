@@ -0,0 +1,65 @@
+from epynet import Network
+from epynet.inpfile import InpIndex
+from nose.tools import assert_equal, assert_almost_equal
+import os
+import shutil
+import tempfile
+
+class TestInpFile(object):
+    @classmethod
+    def setup_class(self):
+        self.directory = tempfile.mkdtemp()
+        self.inputfile = os.path.join(self.directory, 'vertices.inp')
+        with open('tests/testnetwork.inp') as handle:
+            content = handle.read()
+        content = content.replace("[VERTICES]\n;Link            \tX-Coord         \tY-Coord\n",
+                                  "[VERTICES]\n;Link\tX-Coord\tY-Coord\n 11\t2500\t5800\n 3\t1500\t5700\n 11\t3000\t5800 ;comment\n")
+        content = content.replace("[TAGS]\n", "[TAGS]\n NODE 4 hydrant\n LINK 11 main pipe\n")
+        content = content.replace("[LABELS]\n;X-Coord           Y-Coord          Label & Anchor Node\n",
+                                  "[LABELS]\n;X-Coord Y-Coord Label\n 100 200 \"Pump station\" 2\n 300 400 \"Zone A\"\n")
+        with open(self.inputfile, 'w') as handle:
+            handle.write(content)
+        self.network = Network(inputfile=self.inputfile)
+
+    @classmethod
+    def teardown_class(self):
+        shutil.rmtree(self.directory)
+
+    def test01_sections(self):
+        index = InpIndex.open(self.inputfile)
+        assert('JUNCTIONS' in index.sections)
+        # duplicate sections are all kept
+        assert_equal(len(index.sections['REACTIONS']), 2)
+        # reopening an unchanged file uses the cache
+        assert(InpIndex.open(self.inputfile) is index)
+
+    def test02_vertices(self):
+        uids, points = self.network.input_index.vertices()
+        assert_equal(list(uids), ['11', '3', '11'])
+        assert_equal(points.shape, (3, 2))
+
+        assert_equal(self.network.links['11'].vertices, [(2500.0, 5800.0), (3000.0, 5800.0)])
+        assert_equal(self.network.links['3'].vertices, [(1500.0, 5700.0)])
+        assert_equal(self.network.links['4'].vertices, [])
+        path = self.network.links['11'].path
+        assert_equal(len(path), 4)
+
+    def test03_other_sections(self):
+        index = self.network.input_index
+        uids, points = index.coordinates()
+        assert_equal(len(uids), 11)
+        assert_almost_equal(points[list(uids).index('4')][0], 2103.02, 2)
+
+        tags = index.tags()
+        assert_equal(list(tags['tag']), ['hydrant', 'main pipe'])
+
+        labels = index.labels()
+        assert_equal(list(labels['label']), ['Pump station', 'Zone A'])
+        assert_equal(labels['anchor'][0], '2')
+
+        assert_equal(index.backdrop()['DIMENSIONS'], (0.0, 0.0, 10000.0, 10000.0))
+
+    def test04_no_vertices(self):
+        network = Network(inputfile='tests/testnetwork.inp')
+        assert_equal(network.links['11'].vertices, [])
+        assert(network.vertices_loaded)
@@ -0,0 +1,52 @@
+from epynet import Network
+from epynet.montecarlo import MonteCarlo
+from epynet.parallel import WorkerPool
+from epynet.statistics import SampleStatistics
+from nose.tools import assert_equal, assert_almost_equal
+import numpy as np
+
+class TestMonteCarlo(object):
+    @classmethod
+    def setup_class(self):
+        self.network = Network(inputfile="tests/testnetwork.inp")
+        self.network.solve()
+        self.pressure = self.network.junctions.pressure
+
+    def test01_statistics(self):
+        values = np.random.default_rng(1).normal(10, 2, (1000, 3))
+        statistics = SampleStatistics(['a', 'b', 'c'], 0, 20, bins=100)
+        statistics.update(values[:400])
+        other = SampleStatistics(['a', 'b', 'c'], 0, 20, bins=100)
+        other.update(values[400:])
+        statistics.merge(other)
+
+        assert_equal(statistics.count, 1000)
+        np.testing.assert_allclose(statistics.mean, values.mean(axis=0))
+        np.testing.assert_allclose(statistics.std, values.std(axis=0, ddof=1))
+        np.testing.assert_allclose(statistics.minimum, values.min(axis=0))
+        np.testing.assert_allclose(statistics.quantile(0.5), np.median(values, axis=0), atol=0.2)
+
+    def test02_run(self):
+        runner = MonteCarlo(self.network, properties=['pressure', 'flow'], seed=42)
+        result = runner.run(100, batch=32)
+        assert_equal(result['pressure'].count, 100)
+        assert_equal(runner.failures, 0)
+
+        summary = result['pressure'].summary()
+        assert_almost_equal(summary.loc['9', 'mean'], self.pressure['9'], 0)
+        assert((summary['q5'] <= summary['q95']).all())
+        assert_equal(len(result['flow'].summary()), len(self.network.pipes))
+
+        # demands are restored
+        self.network.solve()
+        assert_almost_equal(self.network.junctions['9'].pressure, self.pressure['9'], 4)
+
+    def test03_reproducible(self):
+        groups = dict((uid, 'zone') for uid in self.network.junctions.keys())
+        serial = MonteCarlo(self.network, groups=groups, seed=7).run(40, batch=8)
+        parallel = MonteCarlo(self.network, groups=groups, seed=7).run(40, batch=8, workers=2)
+        np.testing.assert_allclose(serial['pressure'].mean, parallel['pressure'].mean, rtol=1e-4)
+        np.testing.assert_allclose(serial['pressure'].minimum, parallel['pressure'].minimum, rtol=1e-4)
+        with WorkerPool(self.network, 2) as pool:
+            pooled = MonteCarlo(self.network, groups=groups, seed=7).run(40, batch=8, workers=pool)
+        np.testing.assert_allclose(serial['pressure'].mean, pooled['pressure'].mean, rtol=1e-4)
@@ -1,5 +1,6 @@
 from epynet import Network
 from nose.tools import assert_equal, assert_almost_equal
+import numpy as np
 import pandas as pd
 
 class TestNetwork(object):
@@ -194,3 +195,27 @@ class TestNetwork(object):
         assert_equal(self.network.links['1'].comment, 'testwrite')
 
 
+
+    def test13_bulk_assignment(self):
+        self.network.solve()
+        roughness = self.network.pipes.roughness
+
+        # arrays are assigned in collection order
+        values = np.linspace(0.1, 1, len(self.network.pipes))
+        self.network.pipes.roughness = values
+        assert(not self.network.solved)
+        assert_almost_equal(self.network.pipes.roughness.iloc[-1], 1)
+        last = list(self.network.pipes)[-1]
+        assert_almost_equal(self.network.ep.ENgetlinkvalue(last.index, last.static_properties['roughness']), 1)
+
+        # series are aligned by uid
+        self.network.pipes.roughness = roughness
+        assert_almost_equal((self.network.pipes.roughness - roughness).abs().max(), 0)
+
+        # scalars on a collection with several object classes
+        elevation = self.network.nodes.elevation
+        self.network.nodes.elevation = 5
+        for node in self.network.nodes:
+            assert_almost_equal(self.network.ep.ENgetnodevalue(node.index, node.static_properties['elevation']), 5)
+        self.network.nodes.elevation = elevation
+        assert_almost_equal(self.network.nodes['11'].elevation, elevation['11'])
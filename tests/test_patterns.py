@@ -0,0 +1,46 @@
+from epynet import Network
+from nose.tools import assert_equal, assert_almost_equal
+import numpy as np
+import pandas as pd
+
+class TestPatterns(object):
+    @classmethod
+    def setup_class(self):
+        self.network = Network(inputfile="tests/testnetwork.inp")
+
+    def test01_store(self):
+        store = self.network.pattern_store
+        assert_equal(store.uids, ['1'])
+        assert_equal(self.network.patterns['1'].values, [1, 2, 3, 4, 5, 4, 3, 2, 1, 1])
+
+        pattern = self.network.add_pattern('2', [1, 0.5])
+        assert(pattern is self.network.patterns['2'])
+        assert_equal(pattern.index, 2)
+
+        matrix = store.matrix()
+        assert_equal(matrix.shape, (2, 10))
+        assert_almost_equal(matrix.loc['2', 2], 0.5)
+        assert(np.isnan(matrix.loc['2', 3]))
+
+        matrix.loc['2', 3] = 0.25
+        store.set_matrix(matrix.loc[['2']])
+        assert_equal(self.network.ep.ENgetpatternlen(2), 3)
+        assert_almost_equal(self.network.ep.ENgetpatternvalue(2, 3), 0.25)
+
+    def test02_intern(self):
+        store = self.network.pattern_store
+        count = len(store)
+        matrix = pd.DataFrame([[1, 2], [1, 2], [2, 1], [1, 0.5, 0.25]], index=['2', '3', '4', '5'])
+        patterns = store.assign_values(matrix, prefix='meter')
+
+        # identical rows share a pattern and the last row reuses pattern 2
+        assert_equal(len(store), count + 2)
+        assert_equal(patterns['2'], patterns['3'])
+        assert_equal(patterns['5'], '2')
+        assert_equal(list(store.get(patterns['4'])), [2, 1])
+
+        assigned = store.junction_patterns()
+        assert_equal(assigned['3'], patterns['3'])
+        assert_equal(self.network.junctions['5'].pattern.uid, '2')
+        assert(self.network.junctions['5'].pattern is self.network.patterns['2'])
+        assert(not self.network.solved)
@@ -0,0 +1,72 @@
+from epynet.pool import NetworkPool, PoolTimeout
+from epynet import epanet2
+from nose.tools import assert_equal, assert_almost_equal, raises
+import numpy as np
+
+class TestPool(object):
+    @classmethod
+    def setup_class(self):
+        self.pool = NetworkPool({'test': 'tests/testnetwork.inp'}, size=2, max_uses=3)
+        with self.pool.checkout('test') as network:
+            network.solve()
+            self.pressure = network.junctions.pressure
+
+    @classmethod
+    def teardown_class(self):
+        self.pool.close()
+
+    def test01_revert(self):
+        with self.pool.checkout('test') as network:
+            first = network
+            network.pipes['4'].diameter = 50
+            network.pipes.roughness = 2
+            network.junctions['4'].basedemand = 10
+            network.patterns['1'].values = [3, 3]
+            network.ep.ENsettimeparam(epanet2.EN_DURATION, 7200)
+            network.solve()
+            assert(not np.allclose(network.junctions.pressure, self.pressure))
+            assert_equal(len(network.ep.journal), len(network.pipes) + 5)
+
+        with self.pool.checkout('test') as network:
+            with self.pool.checkout('test') as other:
+                assert(first in (network, other))
+                for item in (network, other):
+                    assert_equal(item.pipes['4'].diameter, 100)
+                    assert_equal(item.patterns['1'].values[:2], [1, 2])
+                    assert_equal(item.ep.ENgettimeparam(epanet2.EN_DURATION), 36000)
+                    item.solve()
+                    np.testing.assert_allclose(item.junctions.pressure, self.pressure)
+
+        metrics = self.pool.metrics()
+        assert_equal(metrics.loc['test', 'idle'], 2)
+        assert_equal(metrics.loc['test', 'in_use'], 0)
+        assert(metrics.loc['test', 'reverted_values'] > 0)
+
+    def test02_recycle(self):
+        recycles = self.pool.metrics().loc['test', 'recycles']
+        with self.pool.checkout('test') as network:
+            network.add_junction('J1', 0, 0)
+        assert_equal(self.pool.metrics().loc['test', 'recycles'], recycles + 1)
+
+        for _ in range(4):
+            with self.pool.checkout('test') as network:
+                assert('J1' not in network.junctions)
+        assert(self.pool.metrics().loc['test', 'recycles'] > recycles + 1)
+
+    @raises(PoolTimeout)
+    def test03_timeout(self):
+        with self.pool.checkout('test'):
+            with self.pool.checkout('test'):
+                with self.pool.checkout('test', timeout=0.01):
+                    pass
+
+def test_unload_frees_projects():
+    pool = NetworkPool({'test': 'tests/testnetwork.inp'}, max_uses=1)
+    with pool.checkout('test') as network:
+        network.add_pipe('PX', '4', '8')
+    # recycled networks give their toolkit project back
+    assert(network.ep.ph.value is None)
+    with pool.checkout('test') as network:
+        network.solve()
+    assert(network.ep.ph.value is None)
+    pool.close()
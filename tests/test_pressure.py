@@ -0,0 +1,59 @@
+from epynet import Network
+from epynet.pressure import PressureManagement, prv_zones, _zone_minimum
+from epynet.parallel import WorkerPool
+from nose.tools import assert_equal, assert_almost_equal
+import numpy as np
+
+class TestPressure(object):
+    @classmethod
+    def setup_class(self):
+        self.network = Network(inputfile="tests/testnetwork.inp")
+        junction = self.network.add_junction('J1', 5500, 5700, basedemand=2, elevation=2)
+        junction.pattern = '1'
+        self.network.add_pipe('P1', '10', 'J1', diameter=80, length=500)
+        self.management = PressureManagement(self.network, min_pressure=1.5)
+
+    def test01_zones(self):
+        zones, nodes = prv_zones(self.network)
+        assert_equal(zones['9'], 0)
+        assert_equal(sorted(nodes[0]), ['10', 'J1'])
+
+    def test02_optimise(self):
+        schedule = self.management.optimise()
+        assert_equal(schedule.shape, (10, 1))
+        assert((self.management.critical_nodes[0] == 'J1').all())
+        assert(np.abs(self.management.margins.values).max() < 0.01)
+        # higher demand needs a higher setpoint
+        assert(schedule['9'].max() > schedule['9'].min())
+
+        # the optimised setpoints are feasible and lower than the original one
+        self.network.valves['9'].setting = schedule.loc[3600, '9']
+        self.network.solve(3600)
+        assert_almost_equal(self.network.junctions['J1'].pressure, 1.5, 2)
+        self.network.valves['9'].setting = 5
+
+        parallel = self.management.optimise(workers=2)
+        np.testing.assert_allclose(parallel, schedule)
+        with WorkerPool(self.network, 2) as pool:
+            np.testing.assert_allclose(self.management.optimise(workers=pool), schedule)
+
+    def test03_evaluate(self):
+        schedule = self.management.optimise()
+        results = self.management.evaluate([[5], [3]])
+        assert_equal(results.shape, (2, 3))
+        # lower setpoints lower pressure and leakage
+        assert(results[1, 0] < results[0, 0])
+        assert(results[1, 1] < results[0, 1])
+        assert(results[1, 2] > 0)
+
+        optimal = self.management.evaluate(schedule.values[None])
+        assert(optimal[0, 2] < 0.01)
+        assert(optimal[0, 1] < results[0, 1])
+
+def test_zone_minimum():
+    # zones 1 and 3 have no values
+    values = np.array([3.0, 1.0, 2.0, 5.0])
+    zones = np.array([0, 0, 2, 2])
+    minimum, positions = _zone_minimum(values, zones, 4)
+    np.testing.assert_allclose(minimum, [1, np.nan, 2, np.nan])
+    assert_equal(list(positions), [1, -1, 2, -1])
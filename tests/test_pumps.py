@@ -0,0 +1,56 @@
+from epynet import Network
+from nose.tools import assert_equal, assert_almost_equal
+import numpy as np
+
+class TestPumps(object):
+    @classmethod
+    def setup_class(self):
+        self.network = Network(inputfile="tests/testnetwork.inp")
+
+    def test01_curve_store(self):
+        store = self.network.curve_store
+        assert_equal(store.uids, ['1'])
+        np.testing.assert_allclose(store.get('1'), [[100, 50]])
+
+        # curves longer than the old 100 point buffers
+        points = [(flow, 100 - 0.1 * flow) for flow in range(150)]
+        curve = self.network.add_curve('long', points)
+        assert(curve is self.network.curves['long'])
+        assert_equal(len(self.network.ep.ENgetcurve(curve.index)), 150)
+        assert_equal(self.network.ep.ENgetcurveid(curve.index), 'long')
+        assert_equal(curve.values[-1], (149, 85.1))
+
+    def test02_power_function(self):
+        self.network.solve()
+        pump = self.network.pumps['2']
+        assert(pump.curve is self.network.curves['1'])
+
+        curves = self.network.pump_curves()
+        head = pump.to_node.head - pump.from_node.head
+        assert_almost_equal(curves.heads(pump.flow)[0], head, 4)
+        assert_almost_equal(curves.shutoff_heads()[0], 1.33334 * 50, 4)
+
+    def test03_custom_curve(self):
+        self.network.add_curve('station', [(0, 60), (50, 55), (100, 45), (150, 30), (200, 5)])
+        pump = self.network.pumps['2']
+        pump.curve = 'station'
+        pump.speed = 0.9
+        self.network.solve()
+
+        curves = self.network.pump_curves()
+        head = pump.to_node.head - pump.from_node.head
+        assert_almost_equal(curves.heads(pump.flow, 0.9)[0], head, 4)
+
+        # affinity laws and extrapolation along the end segments
+        table = curves.table([0, 100, 250], speeds=[0.5])
+        np.testing.assert_allclose(table['2'], [0.25 * 60, 0.25 * 5, 0.25 * (5 - 0.5 * 300)])
+
+    def test04_operating_points(self):
+        curves = self.network.pump_curves()
+        flows, heads = curves.operating_points(20, [[0.001], [0.002]], speeds=[[1], [0.9]])
+        assert_equal(flows.shape, (2, 1))
+        np.testing.assert_allclose(heads, 20 + np.array([[0.001], [0.002]]) * flows ** 2, rtol=1e-4)
+
+        # a static head above the shutoff head has no operating point
+        flows, heads = curves.operating_points(100, 0.001)
+        assert(np.isnan(flows[0]))
@@ -0,0 +1,120 @@
+from epynet import Network, epanet2
+from epynet.journal import Journal
+from epynet.quality import QualityScenario
+from nose.tools import assert_equal, assert_almost_equal, raises
+import numpy as np
+
+class TestQuality(object):
+    @classmethod
+    def setup_class(self):
+        self.network = Network(inputfile="tests/testnetwork.inp")
+        self.network.solve()
+        self.pressure = self.network.junctions.pressure
+        self.engine = self.network.quality()
+        self.chemical = QualityScenario('chemical', sources={'in': 1.0}, bulk=-1.0)
+
+    @classmethod
+    def teardown_class(self):
+        self.engine.close()
+
+    def test01_age(self):
+        result = self.engine.run(QualityScenario('age'))
+        nodes = result['nodes']
+        assert_equal(list(nodes.columns), list(self.network.nodes.uid))
+        assert_equal(list(result['links'].columns), list(self.network.links.uid))
+        assert_equal(nodes.index[0], 0)
+        assert_equal(nodes.index[-1], 36000)
+        # water leaving the reservoir is new, the tank ages
+        assert_equal(nodes['in'].max(), 0)
+        assert nodes['11'].iloc[-1] > nodes['11'].iloc[1] > 0
+
+    def test02_trace(self):
+        result = self.engine.run(QualityScenario('trace', trace='in'), output='final')
+        # all water reaching the junctions comes from the reservoir or the tank
+        assert_almost_equal(result['nodes']['in'], 100)
+        assert np.all(result['nodes'] <= 100 + 1e-6)
+
+    def test03_chemical(self):
+        decay = self.engine.run(self.chemical, output='maximum')
+        conservative = self.engine.run(QualityScenario('chemical', sources={'in': 1.0}), output='maximum')
+        assert_almost_equal(conservative['nodes']['2'], 1)
+        assert np.all(decay['nodes'] <= conservative['nodes'] + 1e-9)
+        assert decay['nodes']['6'] < conservative['nodes']['6']
+        # the scenario was reverted
+        again = self.engine.run(self.chemical, output='maximum')
+        np.testing.assert_array_equal(again['nodes'], decay['nodes'])
+
+    def test04_outputs(self):
+        series = self.engine.run(self.chemical)
+        final = self.engine.run(self.chemical, output='final')
+        minimum = self.engine.run(self.chemical, output='minimum')
+        mean = self.engine.run(self.chemical, output='mean')
+        np.testing.assert_allclose(final['links'], series['links'].iloc[-1])
+        np.testing.assert_allclose(minimum['nodes'], series['nodes'].min())
+        assert np.all(mean['nodes'] >= minimum['nodes'] - 1e-9)
+
+    def test05_parallel(self):
+        scenarios = [QualityScenario('chemical', sources={'in': 1.0}, bulk=bulk) for bulk in (0, -0.5, -1.0)]
+        serial = self.engine.run_many(scenarios, output='mean')
+        parallel = self.engine.run_many(scenarios, output='mean', workers=2)
+        for a, b in zip(serial, parallel):
+            np.testing.assert_allclose(a['nodes'], b['nodes'])
+            np.testing.assert_allclose(a['links'], b['links'])
+
+    def test06_network_untouched(self):
+        # the engine works on a copy, the network still solves
+        self.network.solved = False
+        self.network.solve()
+        np.testing.assert_allclose(self.network.junctions.pressure, self.pressure)
+        assert_equal(self.network.ep.ENgetqualtype()[0], epanet2.EN_NONE)
+
+    def test07_journal(self):
+        ep = self.network.ep
+        ep.journal = Journal()
+        ep.ENsetqualtype(epanet2.EN_TRACE, '', '', 'in')
+        assert not ep.journal.irreversible
+        ep.journal.revert(ep)
+        ep.journal = None
+        assert_equal(ep.ENgetqualinfo()[0], epanet2.EN_NONE)
+
+    @raises(ValueError)
+    def test08_trace_node(self):
+        QualityScenario('trace')
+
+    def test09_close(self):
+        engine = self.network.quality()
+        copy = engine.network
+        engine.close()
+        # the toolkit project of the copy is freed
+        assert copy.ep.ph.value is None
+
+class TestSourceContributions(object):
+    @classmethod
+    def setup_class(self):
+        self.network = Network(inputfile="tests/testnetwork.inp")
+        self.contributions = self.network.source_contributions(['in', '11'])
+
+    def test01_shape(self):
+        contributions = self.contributions
+        assert_equal(contributions.values.dtype, np.float32)
+        assert_equal(contributions.values.shape, (len(contributions.times), len(self.network.nodes), 2))
+        assert_equal(contributions.nodes, list(self.network.nodes.uid))
+        assert_equal(contributions.times[-1], 36000)
+
+    def test02_shares(self):
+        final = self.contributions.at()
+        assert_almost_equal(final.loc['in', 'in'], 100, 4)
+        assert_almost_equal(final.loc['11', '11'], 100, 4)
+        assert np.all(self.contributions.values <= 100 + 1e-4)
+        source = self.contributions.source('in')
+        np.testing.assert_allclose(source.iloc[-1], final['in'])
+
+    def test03_aggregate(self):
+        mean = self.network.source_contributions(['in', '11'], aggregate='mean', workers=2)
+        assert_equal(list(mean.times), ['mean'])
+        assert_equal(mean.values.shape, (1, len(self.network.nodes), 2))
+        assert np.all(mean.at('mean') <= self.contributions.values.max(axis=0) + 1e-4)
+
+    def test04_default_sources(self):
+        contributions = self.network.source_contributions(aggregate='final')
+        assert_equal(contributions.sources, list(self.network.reservoirs.uid))
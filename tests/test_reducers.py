@@ -0,0 +1,40 @@
+from epynet import Network
+from epynet.reducers import Minimum, Maximum, Mean, Sum, Duration, ArgMinimum
+from nose.tools import assert_equal, assert_almost_equal
+import numpy as np
+
+class TestReducers(object):
+    @classmethod
+    def setup_class(self):
+        self.network = Network(inputfile="tests/testnetwork.inp")
+        self.network.run()
+        self.pressure = self.network.junctions.pressure
+        self.velocity = self.network.pipes.velocity
+        self.energy = self.network.pumps.energy
+
+    def test01_reducers(self):
+        network = self.network
+        results = network.run(reducers={'min_pressure': Minimum(network.junctions, 'pressure'),
+                                        'max_velocity': Maximum(network.pipes, 'velocity'),
+                                        'mean_pressure': Mean(network.junctions, 'pressure'),
+                                        'energy': Sum(network.pumps, 'energy', unit=3600),
+                                        'low_pressure': Duration(network.junctions, 'pressure', 20),
+                                        'min_time': ArgMinimum(network.junctions, 'pressure')})
+
+        # no time series are kept
+        assert_equal(network.junctions['4'].results, {})
+
+        np.testing.assert_allclose(results['min_pressure'], self.pressure.min())
+        np.testing.assert_allclose(results['max_velocity'], self.velocity.max())
+        assert_equal(results['min_time']['4'], self.pressure['4'].idxmin())
+
+        # time weighted by the step lengths
+        durations = np.diff(self.pressure.index.values, append=self.pressure.index.values[-1])
+        weighted = (self.pressure.mul(durations, axis=0).sum() / durations.sum())
+        np.testing.assert_allclose(results['mean_pressure'], weighted)
+
+        energy = (self.energy.mul(durations, axis=0).sum() / 3600)
+        np.testing.assert_allclose(results['energy'], energy)
+
+        low = ((self.pressure < 20).mul(durations, axis=0)).sum()
+        np.testing.assert_allclose(results['low_pressure'], low)
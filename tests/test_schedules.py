@@ -0,0 +1,58 @@
+from epynet import Network, epanet2
+from epynet.energy import EnergyAccount
+from epynet.schedules import ScheduleProblem
+from nose.tools import assert_equal, assert_almost_equal
+import numpy as np
+
+class TestSchedules(object):
+    @classmethod
+    def setup_class(self):
+        self.network = Network(inputfile="tests/testnetwork.inp")
+        self.problem = ScheduleProblem(self.network, periods=10, tariff=0.1, min_pressure=-10)
+        self.candidates = np.ones((4, 10))
+        self.candidates[1] = 0.9
+        self.candidates[2, 5:] = 0
+
+    def test01_evaluate(self):
+        objectives, constraints = self.problem.evaluate(self.candidates)
+        assert_equal(objectives.shape, (4, 2))
+        assert_equal(constraints.shape, (4, 3))
+        assert((constraints <= 0).all())
+
+        # duplicate candidates are simulated once
+        assert_equal(len(self.problem.cache), 3)
+        np.testing.assert_allclose(objectives[0], objectives[3])
+        assert(objectives[2, 1] < objectives[1, 1] < objectives[0, 1])
+
+        # the same as a run of the applied schedule
+        self.problem.apply(self.candidates[2])
+        account = EnergyAccount(self.network.pumps, 0.1)
+        self.network.run(reducers={'energy': account})
+        assert_almost_equal(account.result()['cost'].sum(), objectives[2, 0], 6)
+        assert_almost_equal(account.result()['energy'].sum(), objectives[2, 1], 6)
+
+    def test02_hard_constraints(self):
+        problem = ScheduleProblem(self.network, periods=10, tariff=0.1, min_pressure=0)
+        objectives, constraints = problem.evaluate(self.candidates[:1])
+        assert(np.isinf(objectives).all())
+        assert(constraints[0, 0] > 0)
+
+    def test03_parallel(self):
+        problem = ScheduleProblem(self.network, periods=10, tariff=0.1, min_pressure=-10)
+        objectives, constraints = problem.evaluate(self.candidates, workers=2, chunksize=1)
+        serial, _ = ScheduleProblem(self.network, periods=10, tariff=0.1, min_pressure=-10).evaluate(self.candidates)
+        np.testing.assert_allclose(objectives, serial)
+
+    def test04_restore(self):
+        network = Network(inputfile="tests/testnetwork.inp")
+        pump = network.pumps['2']
+        network.ep.ENsetlinkvalue(pump.index, epanet2.EN_LINKPATTERN, network.pattern_store.index('1'))
+        problem = ScheduleProblem(network, periods=10, tariff=0.1, min_pressure=-10)
+        problem.evaluate(self.candidates)
+        # the schedule pattern is written through the pattern store
+        index = network.pattern_store.index('schedule_2')
+        np.testing.assert_allclose(network.pattern_store.get('schedule_2'), network.ep.ENgetpattern(index))
+        assert_equal(network.ep.ENgetlinkvalue(pump.index, epanet2.EN_LINKPATTERN), index)
+
+        problem.restore()
+        assert_equal(network.ep.ENgetlinkvalue(pump.index, epanet2.EN_LINKPATTERN), network.pattern_store.index('1'))
@@ -0,0 +1,46 @@
+from epynet import Network
+from nose.tools import assert_equal, assert_raises
+import pandas as pd
+
+class TestSegments(object):
+    @classmethod
+    def setup_class(self):
+        self.network = Network(inputfile="tests/testnetwork.inp")
+        self.valves = pd.DataFrame({'pipe': ['4', '11', '12', '8'],
+                                    'node': ['4', '4', '9', '9']})
+
+    def test01_segments(self):
+        segments = self.network.isolation_segments(self.valves)
+        assert_equal(segments.count, 4)
+
+        assert_equal(sorted(segments.nodes(0).keys()), ['2', '3', '4', 'in'])
+        assert_equal(sorted(segments.links(0).keys()), ['1', '2', '3'])
+        assert_equal(sorted(segments.nodes(1).keys()), ['5', '6', '7', '8'])
+        assert_equal(sorted(segments.links(1).keys()), ['10', '4', '5', '6', '7', '8'])
+        assert_equal(sorted(segments.nodes(2).keys()), ['10', '9'])
+        assert_equal(sorted(segments.links(2).keys()), ['11', '9'])
+        assert_equal(sorted(segments.nodes(3).keys()), ['11'])
+
+    def test02_adjacency(self):
+        segments = self.network.isolation_segments(self.valves)
+        assert_equal(segments.adjacency[0], set([1, 2]))
+        assert_equal(segments.adjacency[2], set([0, 1, 3]))
+
+        # valves to close when pipe 5 bursts
+        boundary = segments.isolate('5')
+        assert_equal(sorted(boundary['pipe']), ['4', '8'])
+
+    def test03_cache(self):
+        segments = self.network.isolation_segments(self.valves)
+        assert(self.network.isolation_segments(list(zip(self.valves['pipe'], self.valves['node']))) is segments)
+
+        # topology changes invalidate the segments
+        self.network.add_junction('J1', 0, 0)
+        self.network.add_pipe('P1', '10', 'J1')
+        updated = self.network.isolation_segments(self.valves)
+        assert(updated is not segments)
+        assert_equal(updated.link_segments['P1'], updated.node_segments['10'])
+
+    def test04_invalid(self):
+        assert_raises(ValueError, self.network.isolation_segments, [('4', '9')])
+        assert_raises(ValueError, self.network.isolation_segments, [('unknown', '9')])
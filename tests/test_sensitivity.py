@@ -0,0 +1,89 @@
+from epynet import Network, epanet2
+from epynet.sensitivity import SensitivityAnalysis
+from nose.tools import assert_equal, assert_almost_equal, raises
+import numpy as np
+import pandas as pd
+
+class TestSensitivity(object):
+    @classmethod
+    def setup_class(self):
+        self.network = Network(inputfile="tests/testnetwork.inp")
+        self.analysis = SensitivityAnalysis(self.network, 'basedemand', outputs=['pressure', 'flow'], accuracy=1e-8)
+        self.jacobians = self.analysis.run()
+
+    def test01_shape(self):
+        pressure = self.jacobians['pressure']
+        assert_equal(list(pressure.index), list(self.network.junctions.uid))
+        assert_equal(list(pressure.columns), list(self.network.junctions.uid))
+        assert_equal(list(self.jacobians['flow'].index), list(self.network.links.uid))
+        # one solve per group and a baseline solve
+        assert_equal(self.analysis.solves, len(self.network.junctions) + 1)
+
+    def test02_finite_difference(self):
+        network = self.network
+        accuracy = network.ep.ENgetoption(epanet2.EN_ACCURACY)
+        network.ep.ENsetoption(epanet2.EN_ACCURACY, 1e-8)
+        network.solve()
+        base = network.junctions.pressure
+        network.junctions['5'].basedemand += 0.1
+        network.solve()
+        column = (network.junctions.pressure - base) / 0.1
+        network.junctions['5'].basedemand -= 0.1
+        network.ep.ENsetoption(epanet2.EN_ACCURACY, accuracy)
+        network.solved = False
+        np.testing.assert_allclose(self.jacobians['pressure']['5'], column, atol=1e-3)
+        assert self.jacobians['pressure'].loc['5', '5'] < 0
+
+    def test03_groups(self):
+        groups = {'north': ['2', '3', '4'], 'south': ['6', '7', '8']}
+        analysis = SensitivityAnalysis(self.network, 'basedemand', groups=groups, accuracy=1e-8)
+        pressure = analysis.run(workers=2)['pressure']
+        assert_equal(list(pressure.columns), ['north', 'south'])
+        # a step on every junction of a group changes the pressure by the sum of the derivatives
+        expected = self.jacobians['pressure'][groups['north']].sum(axis=1)
+        np.testing.assert_allclose(pressure['north'], expected, atol=1e-3)
+
+    def test04_sparse(self):
+        jacobians = self.network.sensitivity('roughness', outputs=['flow'], threshold=1e-4)
+        flow = jacobians['flow']
+        assert isinstance(flow.dtypes.iloc[0], pd.SparseDtype)
+        assert np.all(np.abs(flow.sparse.to_dense().values[flow.sparse.to_dense().values != 0]) > 1e-4)
+
+    @raises(ValueError)
+    def test05_unknown_parameter(self):
+        SensitivityAnalysis(self.network, 'color')
+
+class TestIndependentZones(object):
+    @classmethod
+    def setup_class(self):
+        network = self.network = Network()
+        network.add_reservoir('r', 0, 0, elevation=50)
+        for zone, direction in (('a', 1), ('b', -1)):
+            previous = 'r'
+            for number in range(3):
+                uid = '%s%d' % (zone, number)
+                network.add_junction(uid, direction * (number + 1) * 10, 0, basedemand=1)
+                network.add_pipe('p' + uid, previous, uid, diameter=100, length=100)
+                previous = uid
+
+    def test01_colors(self):
+        analysis = SensitivityAnalysis(self.network, 'basedemand', accuracy=1e-8)
+        # the zones only meet at the reservoir, so they share solves
+        assert_equal(analysis.colors, 3)
+        pressure = analysis.run()['pressure']
+        assert_equal(analysis.solves, 4)
+        assert_equal(pressure.loc['b0', 'a2'], 0)
+        assert pressure.loc['a0', 'a2'] < 0
+        assert pressure.loc['b2', 'b0'] < 0
+
+    def test02_demand_output(self):
+        # the demand of the reservoir depends on both zones
+        analysis = SensitivityAnalysis(self.network, 'basedemand', outputs=['demand'])
+        assert_equal(analysis.colors, 6)
+
+    def test03_adaptive_steps(self):
+        # changes below min_change enlarge the step up to max_step
+        analysis = SensitivityAnalysis(self.network, 'basedemand', min_change=100, max_step=1)
+        analysis.run()
+        np.testing.assert_allclose(analysis.used_steps, 1)
+        assert_equal(analysis.solves, 3 * 4)
@@ -0,0 +1,55 @@
+from epynet import Network
+from nose.tools import assert_equal, assert_almost_equal
+import numpy as np
+
+class TestSession(object):
+    @classmethod
+    def setup_class(self):
+        self.network = Network(inputfile="tests/testnetwork.inp")
+
+    def test01_advance(self):
+        with self.network.session() as session:
+            for hour in range(2):
+                state = session.advance(3600)
+            head = state['head'][session.node_uids.index('11')]
+
+        with self.network.session() as session:
+            tank = session.node_uids.index('11')
+            # steps that cross the pattern times integrate like a full simulation
+            for delta in [600, 3000, 1800, 1800]:
+                state = session.advance(delta)
+            assert_equal(session.time, 7200)
+            assert_almost_equal(state['head'][tank], head, 4)
+            assert_equal(len(state['flow']), len(self.network.links))
+
+        assert_equal(self.network.ep.ENgettimeparam(0), 36000)
+        assert_equal(self.network.ep.ENgettimeparam(1), 3600)
+
+    def test02_update(self):
+        session = self.network.session(start=3600)
+        pump = session.link_uids.index('2')
+        tank = session.node_uids.index('11')
+        assert(session.state()['flow'][pump] > 0)
+
+        session.update(tank_levels={'11': 5}, pump_status={'2': 0})
+        state = session.state()
+        assert_almost_equal(state['head'][tank], 5)
+        assert_equal(state['flow'][pump], 0)
+
+        # the tank drains while the pump is off
+        state = session.advance(60)
+        assert(state['head'][tank] < 5)
+        assert_equal(session.time, 3660)
+        session.close()
+
+        self.network.solve()
+        assert(self.network.pumps['2'].flow > 0)
+
+    def test03_restore_input_data(self):
+        with self.network.session() as session:
+            session.update(tank_levels={'11': 5}, demands={'5': 20})
+            session.advance(60)
+            session.update(tank_levels={'11': 6})
+            assert_almost_equal(session.state()['demand'][session.node_uids.index('5')], 20)
+        assert_almost_equal(self.network.tanks['11'].tanklevel, 10)
+        assert_almost_equal(self.network.junctions['5'].basedemand, 1)
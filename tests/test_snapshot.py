@@ -0,0 +1,52 @@
+from epynet import Network, epanet2
+from epynet.journal import Journal
+from nose.tools import assert_equal, assert_almost_equal, raises
+import numpy as np
+
+class TestSnapshot(object):
+    @classmethod
+    def setup_class(self):
+        self.network = Network(inputfile="tests/testnetwork.inp")
+        self.network.solve()
+        self.pressure = self.network.junctions.pressure
+        self.snapshot = self.network.snapshot()
+
+    def change(self):
+        network = self.network
+        network.pipes['4'].diameter = 50
+        network.pipes.roughness = 2
+        network.junctions['4'].basedemand = 10
+        network.tanks['11'].tanklevel = 3
+        network.valves['9'].setting = 8
+        network.patterns['1'].values = [3, 3]
+        network.ep.ENsettimeparam(epanet2.EN_DURATION, 7200)
+        network.ep.ENsetoption(epanet2.EN_DEMANDMULT, 1.5)
+
+    def check(self):
+        network = self.network
+        assert_equal(network.pipes['4'].diameter, 100)
+        assert_equal(network.tanks['11'].tanklevel, 10)
+        assert_equal(network.patterns['1'].values[:2], [1, 2])
+        assert_equal(network.ep.ENgettimeparam(epanet2.EN_DURATION), 36000)
+        assert_almost_equal(network.ep.ENgetoption(epanet2.EN_DEMANDMULT), 1)
+        network.solve()
+        np.testing.assert_allclose(network.junctions.pressure, self.pressure)
+
+    def test01_restore(self):
+        self.change()
+        restored = self.network.restore(self.snapshot)
+        # only the values that were written are compared
+        assert_equal(restored, len(self.network.pipes) + 7)
+        self.check()
+        assert_equal(self.network.restore(self.snapshot), 0)
+
+    def test02_without_journal(self):
+        self.network.ep.journal = Journal()
+        self.change()
+        self.network.restore(self.snapshot)
+        self.check()
+
+    @raises(ValueError)
+    def test03_structure(self):
+        self.network.add_junction('J1', 0, 0)
+        self.network.restore(self.snapshot)
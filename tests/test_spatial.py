@@ -0,0 +1,135 @@
+from epynet import Network
+from epynet.spatial import KDTree, RTree
+from nose.tools import assert_equal, assert_almost_equal
+import numpy as np
+import pandas as pd
+
+class TestSpatial(object):
+    @classmethod
+    def setup_class(self):
+        self.network = Network(inputfile="tests/testnetwork.inp")
+
+    def test01_kdtree(self):
+        rng = np.random.RandomState(1)
+        points = rng.uniform(0, 100, (500, 2))
+        tree = KDTree(points, leafsize=8)
+        mask = rng.uniform(size=500) > 0.2
+        for point in rng.uniform(-10, 110, (20, 2)):
+            squared = ((points - point) ** 2).sum(axis=1)
+            squared[~mask] = np.inf
+            distances, positions = tree.query(point, 5, mask)
+            np.testing.assert_array_equal(positions, np.argsort(squared)[:5])
+            np.testing.assert_allclose(distances, np.sort(squared)[:5])
+
+        inside = np.flatnonzero(np.all((points >= 20) & (points <= 40), axis=1))
+        np.testing.assert_array_equal(tree.query_box((20, 20, 40, 40)), inside)
+
+    def test02_rtree(self):
+        rng = np.random.RandomState(2)
+        lower = rng.uniform(0, 100, (300, 2))
+        boxes = np.column_stack([lower, lower + rng.uniform(0, 5, (300, 2))])
+        tree = RTree(boxes, capacity=4)
+        expected = np.flatnonzero((boxes[:, 0] <= 60) & (boxes[:, 2] >= 50) & (boxes[:, 1] <= 60) & (boxes[:, 3] >= 50))
+        np.testing.assert_array_equal(tree.query_box((50, 50, 60, 60)), expected)
+
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        distance = lambda numbers, point: np.sqrt(((centers[numbers] - point) ** 2).sum(axis=1))
+        for point in rng.uniform(0, 100, (20, 2)):
+            number, best = tree.nearest(point, distance)
+            assert_equal(number, np.argmin(distance(np.arange(300), point)))
+
+    def test03_nearest_nodes(self):
+        index = self.network.spatial_index
+        nodes = self.network.nodes
+        points = pd.DataFrame({'x': [nodes['4'].coordinates[0] + 1, nodes['9'].coordinates[0]],
+                               'y': [nodes['4'].coordinates[1], nodes['9'].coordinates[1] - 2]},
+                              index=['meter1', 'meter2'])
+        nearest = index.nearest_nodes(points)
+        assert_equal(list(nearest['node']), ['4', '9'])
+        assert_almost_equal(nearest.loc['meter1', 'distance'], 1)
+        assert_almost_equal(nearest.loc['meter2', 'distance'], 2)
+
+        nearest = index.nearest_nodes(points, k=3)
+        assert_equal(len(nearest), 6)
+        assert_equal(nearest.loc[('meter1', 0), 'node'], '4')
+        assert(nearest.loc['meter1', 'distance'].is_monotonic_increasing)
+
+    def test04_nearest_links(self):
+        link = self.network.links['4']
+        start, end = np.array(link.from_node.coordinates), np.array(link.to_node.coordinates)
+        middle = (start + end) / 2
+        normal = np.array([end[1] - start[1], start[0] - end[0]])
+        point = middle + normal / np.linalg.norm(normal) * 0.5
+        nearest = self.network.spatial_index.nearest_links([point])
+        assert_equal(nearest.loc[0, 'link'], '4')
+        assert_almost_equal(nearest.loc[0, 'distance'], 0.5)
+        assert_almost_equal(nearest.loc[0, 'offset'], np.linalg.norm(end - start) / 2)
+        assert_almost_equal(nearest.loc[0, 'x'], middle[0])
+
+    def test05_regions(self):
+        index = self.network.spatial_index
+        points = np.array([node.coordinates for node in self.network.nodes])
+        lower = points.min(axis=0)
+        upper = (points.min(axis=0) + points.max(axis=0)) / 2
+
+        nodes = index.nodes_in_bbox(np.concatenate([lower, upper]))
+        expected = [node.uid for node, point in zip(self.network.nodes, points) if np.all(point <= upper)]
+        assert_equal(sorted(nodes.keys()), sorted(expected))
+
+        # a triangle through the bounding box has the nodes below its diagonal
+        polygon = [(lower[0] - 1, lower[1] - 1), (upper[0] * 2, lower[1] - 1), (lower[0] - 1, upper[1] * 2)]
+        nodes = index.nodes_in_polygon(polygon)
+        assert(0 < len(nodes) < len(self.network.nodes))
+
+        links = index.links_in_polygon(polygon)
+        for link in self.network.links:
+            if link.from_node.uid in nodes or link.to_node.uid in nodes:
+                assert(link.uid in links)
+
+    def test06_incremental(self):
+        index = self.network.spatial_index
+        self.network.add_junction('J1', 10000, 10000)
+        self.network.add_pipe('P1', '10', 'J1')
+        assert(self.network.spatial_index is index)
+
+        nearest = index.nearest_nodes([(10001, 10000)])
+        assert_equal(nearest.loc[0, 'node'], 'J1')
+        assert_equal(index.nearest_links([(10000, 10001)]).loc[0, 'link'], 'P1')
+        assert('J1' in index.nodes_in_bbox((9000, 9000, 11000, 11000)))
+
+        self.network.delete_node('J1')
+        assert(index.nearest_nodes([(10001, 10000)]).loc[0, 'node'] != 'J1')
+        assert(index.nearest_links([(10000, 10001)]).loc[0, 'link'] != 'P1')
+        assert_equal(len(index.nodes_in_bbox((9000, 9000, 11000, 11000))), 0)
+
+    def test07_link_existing_nodes(self):
+        network = Network(inputfile="tests/testnetwork.inp")
+        index = network.spatial_index
+        network.add_pipe('PX', '4', '8')
+        network.add_valve('VX', 'tcv', '5', '7')
+        network.add_pump('UX', '6', '10')
+        links = index.links_in_bbox((-1e9, -1e9, 1e9, 1e9))
+        for uid in ['PX', 'VX', 'UX']:
+            assert(uid in links)
+
+    def test08_delete_rebuild(self):
+        network = Network(inputfile="tests/testnetwork.inp")
+        index = network.spatial_index
+        for number in range(index.leafsize):
+            network.add_junction('J%d' % number, 10000 + 10 * number, 10000)
+        # caches the node indices, the next removal rebuilds the tree
+        [node.index for node in network.nodes]
+        network.delete_node('J0')
+        points = [(10000 + 10 * number, 10000) for number in range(1, index.leafsize)]
+        nearest = index.nearest_nodes(points)
+        assert_equal(list(nearest['node']), ['J%d' % number for number in range(1, index.leafsize)])
+        np.testing.assert_allclose(nearest['distance'], 0)
+
+        network = Network(inputfile="tests/testnetwork.inp")
+        index = network.spatial_index
+        for number in range(index.leafsize):
+            network.add_pipe('P%d' % number, '4', '8')
+        network.topology
+        network.delete_link('P0')
+        assert('P0' not in index.links_in_bbox((-1e9, -1e9, 1e9, 1e9)))
+        assert('P1' in index.links_in_bbox((-1e9, -1e9, 1e9, 1e9)))